@@ -0,0 +1,127 @@
+"""
+CSV → Notionアップローダーの入力経路のメモリ使用量ベンチマーク
+
+同じCSVを旧方式（全件をDataFrameに読み込み、isinで絞り込んでからレコード化）と
+ストリーミング方式（csv_stream.iter_csv_recordsでチャンク単位に読み込み）で
+NotionUploaderに流し、それぞれ別プロセスで実行してピークRSSと処理時間を表示する。
+アップロード処理自体は何もしない関数に置き換えるため、Notion APIにはアクセスしない。
+
+使い方:
+    python benchmarks/bench_csv_upload.py [--rows 50000] [--lyrics-chars 1500] [--csv 既存のCSV]
+"""
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+
+from csv_stream import DEFAULT_CHUNKSIZE, iter_csv_records  # noqa: E402
+from notion_uploader import NotionUploader  # noqa: E402
+from song_parser import SONG_FIELDS  # noqa: E402
+
+MODES = ("dataframe", "stream")
+
+
+def generate_csv(filepath, rows, lyrics_chars):
+    """ダミーの歌詞CSVを書き出す（1000行ずつ追記するので生成側のメモリは増えない）"""
+    rng = random.Random(0)
+    chars = "あいうえおかきくけこさしすせそたちつてとなにぬねの愛夢空君僕\n"
+    with open(filepath, "w", encoding="utf-8-sig", newline="") as f:
+        pd.DataFrame(columns=SONG_FIELDS).to_csv(f, index=False)
+        for start in range(0, rows, 1000):
+            batch = []
+            for song_id in range(start + 1, min(rows, start + 1000) + 1):
+                batch.append({
+                    "song_id": str(song_id),
+                    "title": f"曲{song_id}",
+                    "artist": f"アーティスト{song_id % 300}",
+                    "main_theme": "",
+                    "lyricist": f"作詞者{song_id % 50}",
+                    "composer": f"作曲者{song_id % 50}",
+                    "arranger": "",
+                    "release_date": "2020/01/01",
+                    "cover_url": f"https://example.com/{song_id}.jpg",
+                    "lyrics": "".join(rng.choice(chars) for _ in range(lyrics_chars)),
+                })
+            pd.DataFrame(batch, columns=SONG_FIELDS).to_csv(f, index=False, header=False)
+
+
+def dataframe_records(filepath, existing_song_ids):
+    """旧方式: 全件をDataFrameに読み込んでから絞り込む"""
+    df = pd.read_csv(filepath)
+    df_to_upload = df[~df['song_id'].astype(str).isin(existing_song_ids)]
+    return (row for row in df_to_upload.to_dict('records'))
+
+
+def stream_records(filepath, existing_song_ids, chunksize=DEFAULT_CHUNKSIZE):
+    """ストリーミング方式: チャンク単位で読み込みながら絞り込む"""
+    return (
+        record for record in iter_csv_records(filepath, chunksize=chunksize)
+        if record.get('song_id') not in existing_song_ids
+    )
+
+
+def run_mode(mode, filepath):
+    """
+    1つの方式でアップローダーに全件を流す（子プロセスで実行する）
+
+    Returns:
+        dict: mode, records, seconds, peak_rss_mb
+    """
+    # 1割は既にNotionにある想定でスキップさせる
+    existing_song_ids = {str(song_id) for song_id in range(1, 1000000, 10)}
+    start = time.perf_counter()
+    if mode == "dataframe":
+        records = dataframe_records(filepath, existing_song_ids)
+    else:
+        records = stream_records(filepath, existing_song_ids)
+
+    uploader = NotionUploader(lambda record, limiter: True, max_workers=3, rate=1e9, burst=1e9)
+    counts = uploader.run(records)
+    elapsed = time.perf_counter() - start
+    # Linuxのru_maxrssはKB単位
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"mode": mode, "records": counts["total"], "seconds": elapsed, "peak_rss_mb": peak_kb / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000, help="生成するダミーCSVの行数")
+    parser.add_argument("--lyrics-chars", type=int, default=1500, help="1曲あたりの歌詞の文字数")
+    parser.add_argument("--csv", help="ダミーを生成せずにこのCSVを使う")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_mode(args.child, args.csv)
+        print(f"{result['mode']}\t{result['records']}\t{result['seconds']:.3f}\t{result['peak_rss_mb']:.1f}")
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = args.csv
+        if filepath is None:
+            filepath = os.path.join(tmpdir, "lyrics_data_bench.csv")
+            generate_csv(filepath, args.rows, args.lyrics_chars)
+        size_mb = os.path.getsize(filepath) / (1024 * 1024)
+        print(f"CSV: {filepath} ({size_mb:.1f} MB)")
+
+        # ピークRSSはプロセス単位でしか測れないので、方式ごとに子プロセスで実行する
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", mode, "--csv", filepath],
+                check=True, capture_output=True, text=True,
+            ).stdout.strip().splitlines()[-1]
+            _, records, seconds, peak = output.split("\t")
+            print(f"{mode:>10}: {int(records):7d} records  {float(seconds):7.2f} s  peak RSS {float(peak):8.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+コマンドラインツールの起動時間の予算チェック
+
+`python cli.py --help` と、scriptsを読み込むサブコマンドの代表として `python cli.py status` を
+別プロセスで繰り返し実行して最短の所要時間を測り、予算（秒）を超えたら、
+または読み込みだけで重いモジュール（pandas / bs4 / lxml / requests / tqdm / numpy）が
+読み込まれていたら終了コード1を返す。
+同じ確認は tests/test_import_time.py でも行うので、遅延インポートが崩れるとテストが失敗する。
+
+使い方:
+    python benchmarks/bench_import_time.py [--budget 0.25] [--status-budget 0.4] [--repeat 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, "cli.py")
+
+# 予算（秒）。cli.py --help は引数の解析だけ、status はscriptsと状態DBの読み込みまで
+HELP_BUDGET = 0.25
+STATUS_BUDGET = 0.4
+
+# 起動時に読み込まれてはいけないモジュール（実際に解析・書き込み・通信するときに初めて読み込む）
+HEAVY_MODULES = ("pandas", "bs4", "lxml", "requests", "tqdm", "numpy")
+
+# cli.pyの読み込みだけでは、scriptsが読み込むdotenvも読み込まれてはいけない
+CLI_HEAVY_MODULES = HEAVY_MODULES + ("dotenv",)
+
+_CHECK_CLI = """
+import sys
+sys.path.insert(0, {root!r})
+import cli
+cli.build_parser()
+print(",".join(name for name in {modules!r} if name in sys.modules))
+"""
+
+_CHECK_STATUS = """
+import contextlib, io, sys
+sys.path.insert(0, {root!r})
+import cli
+with contextlib.redirect_stdout(io.StringIO()):
+    cli.main({argv!r})
+print(",".join(name for name in {modules!r} if name in sys.modules))
+"""
+
+
+def measure(argv, repeat, cwd=None):
+    """argvを別プロセスでrepeat回実行し、最短の所要時間（秒）を返す"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(argv, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=cwd)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def loaded_modules(code, cwd=None):
+    """codeを別プロセスで実行し、出力された（読み込まれた重いモジュールの）一覧を返す"""
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True, cwd=cwd
+    ).stdout.strip()
+    return output.split(",") if output else []
+
+
+def status_argv(workdir):
+    """workdirの状態DBを使うstatusサブコマンドの引数"""
+    return ["--progress", "none", "--state-db", os.path.join(workdir, "pipeline_state.sqlite3"), "status"]
+
+
+def check(repeat=5, help_budget=HELP_BUDGET, status_budget=STATUS_BUDGET):
+    """
+    起動時間と読み込まれたモジュールを測る
+
+    Returns:
+        dict: {"baseline", "help", "status": 所要時間（秒）, "help_loaded", "status_loaded": 重いモジュール,
+               "problems": 予算超過などの説明のリスト（空なら問題なし）}
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        argv = status_argv(workdir)
+        result = {
+            "baseline": measure([sys.executable, "-c", "pass"], repeat),
+            "help": measure([sys.executable, CLI, "--help"], repeat),
+            "status": measure([sys.executable, CLI] + argv, repeat, cwd=workdir),
+            "help_loaded": loaded_modules(_CHECK_CLI.format(root=ROOT, modules=CLI_HEAVY_MODULES)),
+            "status_loaded": loaded_modules(
+                _CHECK_STATUS.format(root=ROOT, argv=argv, modules=HEAVY_MODULES), cwd=workdir
+            ),
+        }
+    problems = []
+    if result["help"] > help_budget:
+        problems.append(f"cli.py --help: {result['help'] * 1000:.0f} ms（予算 {help_budget * 1000:.0f} ms）")
+    if result["status"] > status_budget:
+        problems.append(f"cli.py status: {result['status'] * 1000:.0f} ms（予算 {status_budget * 1000:.0f} ms）")
+    if result["help_loaded"]:
+        problems.append(f"cli.pyの読み込みで重いモジュールが読み込まれました: {', '.join(result['help_loaded'])}")
+    if result["status_loaded"]:
+        problems.append(f"cli.py statusで重いモジュールが読み込まれました: {', '.join(result['status_loaded'])}")
+    result["problems"] = problems
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=HELP_BUDGET, help="cli.py --help に許す時間（秒）")
+    parser.add_argument("--status-budget", type=float, default=STATUS_BUDGET, help="cli.py status に許す時間（秒）")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    result = check(repeat=args.repeat, help_budget=args.budget, status_budget=args.status_budget)
+    print(f"python起動のみ:    {result['baseline'] * 1000:7.1f} ms")
+    print(f"cli.py --help:     {result['help'] * 1000:7.1f} ms (予算 {args.budget * 1000:.0f} ms)")
+    print(f"cli.py status:     {result['status'] * 1000:7.1f} ms (予算 {args.status_budget * 1000:.0f} ms)")
+    print(f"読み込まれた重いモジュール: --help {', '.join(result['help_loaded']) or 'なし'}"
+          f" / status {', '.join(result['status_loaded']) or 'なし'}")
+
+    for problem in result["problems"]:
+        print(problem)
+    print("予算超過" if result["problems"] else "OK")
+    return 1 if result["problems"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+song_idから歌詞を1曲引くときのレイテンシのベンチマーク
+
+bench_csv_upload.pyと同じダミーの歌詞CSVから歌詞ストア（lyrics_store.py）を作り、
+ランダムなsong_idの検索について次の方式のp50/p99/最大を表示する。
+
+    csv          pd.read_csvで全件を読み込んでから絞り込む（従来の方法。--csv-lookups回だけ）
+    store        開いておいたLyricsStore.get（索引の二分探索＋mmap）
+    get_lyrics   scripts.get_lyricsと同じopen_lyrics_store経由（変更の検知を含む）
+
+--processes を指定すると、同じストアを複数プロセスから同時に引いたときのスループットも表示する
+（ストアはmmapで開くので、各プロセスは歌詞本体を複製せずOSのページキャッシュを共有する）。
+
+使い方:
+    python benchmarks/bench_lyrics_store.py [--rows 50000] [--lookups 20000] [--processes 4]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import pandas as pd  # noqa: E402
+
+from bench_csv_upload import generate_csv  # noqa: E402
+from bench_offline import percentile  # noqa: E402
+from csv_stream import iter_csv_records  # noqa: E402
+from lyrics_store import LyricsStore, build_lyrics_store, open_lyrics_store  # noqa: E402
+
+
+def measure(song_ids, lookup):
+    """song_idごとの所要時間（秒）のリストを返す"""
+    samples = []
+    for song_id in song_ids:
+        start = time.perf_counter()
+        lyrics = lookup(song_id)
+        samples.append(time.perf_counter() - start)
+        if lyrics is None:
+            raise RuntimeError(f"song_id: {song_id} が見つかりません")
+    return samples
+
+
+def csv_lookup(csv_path):
+    def lookup(song_id):
+        df = pd.read_csv(csv_path, dtype=str)
+        rows = df.loc[df['song_id'] == song_id, 'lyrics']
+        return rows.iloc[0] if len(rows) else None
+    return lookup
+
+
+def _worker(task):
+    store_path, song_ids = task
+    with LyricsStore(store_path) as store:
+        start = time.perf_counter()
+        for song_id in song_ids:
+            store.get(song_id)
+        elapsed = time.perf_counter() - start
+    return len(song_ids), elapsed
+
+
+def report(name, samples):
+    print(f"{name:>10}: {len(samples):6d} lookups  p50 {percentile(samples, 50) * 1e6:10.1f} us  "
+          f"p99 {percentile(samples, 99) * 1e6:10.1f} us  max {max(samples) * 1e6:10.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000, help="生成するダミーCSVの行数")
+    parser.add_argument("--lyrics-chars", type=int, default=1500, help="1曲あたりの歌詞の文字数")
+    parser.add_argument("--csv", help="ダミーを生成せずにこのCSVを使う")
+    parser.add_argument("--lookups", type=int, default=20000, help="ストアを引く回数")
+    parser.add_argument("--csv-lookups", type=int, default=3, help="従来の方法で引く回数（1回で全件を読む）")
+    parser.add_argument("--processes", type=int, default=0, help="同時に引くプロセス数（0なら省略）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        csv_path = args.csv
+        if csv_path is None:
+            csv_path = os.path.join(tmpdir, "lyrics_data_bench.csv")
+            generate_csv(csv_path, args.rows, args.lyrics_chars)
+        store_path = os.path.join(tmpdir, "lyrics_data_bench.lyrics")
+        start = time.perf_counter()
+        rows = build_lyrics_store(iter_csv_records(csv_path, columns=['song_id', 'lyrics']), store_path)
+        build_seconds = time.perf_counter() - start
+        print(f"rows: {rows}  CSV {os.path.getsize(csv_path) / 1024 / 1024:.1f} MB  "
+              f"store {os.path.getsize(store_path) / 1024 / 1024:.1f} MB + "
+              f"index {os.path.getsize(store_path + '.idx') / 1024:.0f} KB  build {build_seconds:.2f} s")
+
+        with LyricsStore(store_path) as store:
+            all_ids = store.song_ids()
+        rng = random.Random(0)
+        song_ids = [rng.choice(all_ids) for _ in range(args.lookups)]
+
+        report("csv", measure(song_ids[:args.csv_lookups], csv_lookup(csv_path)))
+        with LyricsStore(store_path) as store:
+            report("store", measure(song_ids, store.get))
+        report("get_lyrics", measure(song_ids, lambda song_id: open_lyrics_store(store_path).get(song_id)))
+
+        if args.processes:
+            chunks = [(store_path, song_ids[index::args.processes]) for index in range(args.processes)]
+            start = time.perf_counter()
+            with Pool(args.processes) as pool:
+                results = pool.map(_worker, chunks)
+            elapsed = time.perf_counter() - start
+            total = sum(count for count, _ in results)
+            print(f"{args.processes} processes: {total / elapsed:,.0f} lookups/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
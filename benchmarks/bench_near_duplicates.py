@@ -0,0 +1,123 @@
+"""
+歌詞の重複検出（near_duplicates.py）のベンチマーク
+
+bench_csv_upload.pyと同じダミーの歌詞CSVに、既存の曲の歌詞を少しだけ書き換えた別バージョン
+（--variant-rate の割合）を混ぜて、MinHash/LSHの索引を作り次を表示する。
+
+    build      索引の作成時間とスループット、署名を比べた候補の延べ数（全組み合わせの何分の1か）
+    recall     混ぜた別バージョンのうち、元の曲と同じクラスタに入った割合
+    false      別バージョンではないのに同じクラスタに入った曲の数
+    pairwise   全組み合わせの署名を比べる方法（先頭--pairwise-rows曲で測って全件に換算）
+
+使い方:
+    python benchmarks/bench_near_duplicates.py [--rows 50000] [--variant-rate 0.1] [--edit-rate 0.01]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from bench_csv_upload import generate_csv  # noqa: E402
+from csv_stream import iter_csv_records  # noqa: E402
+from near_duplicates import NearDuplicateIndex, lyrics_shingles, minhash_signature  # noqa: E402
+from scripts import SONG_FIELDS  # noqa: E402
+
+CHARS = "あいうえおかきくけこさしすせそたちつてとなにぬねの愛夢空君僕"
+
+
+def mutate(lyrics, rng, edit_rate):
+    """歌詞の一部の文字を置き換え、末尾に1行足した別バージョンを作る"""
+    chars = [rng.choice(CHARS) if rng.random() < edit_rate else char for char in lyrics]
+    return "".join(chars) + "\n（Live ver.）"
+
+
+def add_variants(csv_path, rows, variant_rate, edit_rate):
+    """
+    CSVの末尾に別バージョンを追記する
+
+    Returns:
+        dict: {別バージョンのsong_id: 元の曲のsong_id}
+    """
+    rng = random.Random(1)
+    originals = [record for record in iter_csv_records(csv_path) if rng.random() < variant_rate]
+    variants = {}
+    batch = []
+    for offset, record in enumerate(originals):
+        song_id = str(rows + offset + 1)
+        variants[song_id] = record['song_id']
+        batch.append({**record, 'song_id': song_id, 'title': f"{record['title']}（Live ver.）",
+                      'lyrics': mutate(record['lyrics'], rng, edit_rate)})
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        pd.DataFrame(batch, columns=SONG_FIELDS).to_csv(f, index=False, header=False)
+    return variants
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000, help="生成するダミーCSVの行数（別バージョンは別に追加）")
+    parser.add_argument("--lyrics-chars", type=int, default=600, help="1曲あたりの歌詞の文字数")
+    parser.add_argument("--variant-rate", type=float, default=0.1, help="別バージョンを作る曲の割合")
+    parser.add_argument("--edit-rate", type=float, default=0.01, help="別バージョンで置き換える文字の割合")
+    parser.add_argument("--pairwise-rows", type=int, default=2000, help="全組み合わせの比較を測る曲数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        csv_path = os.path.join(tmpdir, "lyrics_data_bench.csv")
+        generate_csv(csv_path, args.rows, args.lyrics_chars)
+        variants = add_variants(csv_path, args.rows, args.variant_rate, args.edit_rate)
+        total = args.rows + len(variants)
+
+        start = time.perf_counter()
+        index_path = os.path.join(tmpdir, "lyrics_data_bench.dupes.sqlite3")
+        with NearDuplicateIndex(index_path) as index:
+            for count, record in enumerate(iter_csv_records(csv_path, columns=['song_id', 'title', 'artist', 'lyrics'])):
+                index.add(record, commit=False)
+                if count % 1000 == 999:
+                    index.commit()
+            index.commit()
+            build_seconds = time.perf_counter() - start
+            clusters = index.clusters()
+            compared = index.compared
+        pairs = total * (total - 1) // 2
+        print(f"build: {total} songs ({len(variants)} variants) in {build_seconds:.1f} s "
+              f"({total / build_seconds:.0f} songs/s)  compared {compared} candidates "
+              f"(1/{pairs / max(compared, 1):,.0f} of {pairs:,} pairs)  index {os.path.getsize(index_path) / 1024 / 1024:.1f} MB")
+
+        cluster_of = {member['song_id']: canonical for canonical, members in clusters.items() for member in members}
+        found = sum(1 for variant, original in variants.items()
+                    if variant in cluster_of and cluster_of[variant] == cluster_of.get(original))
+        expected = set(variants) | set(variants.values())
+        false_members = [song_id for song_id in cluster_of if song_id not in expected]
+        print(f"recall: {found}/{len(variants)} ({found / max(len(variants), 1):.1%})  "
+              f"false: {len(false_members)}  clusters: {len(clusters)}")
+
+        # 全組み合わせ: 署名を計算済みとして、1曲ずつそれまでの全曲の署名と比べる
+        signatures = []
+        for record in iter_csv_records(csv_path, columns=['lyrics']):
+            shingles = lyrics_shingles(record['lyrics'])
+            if len(shingles):
+                signatures.append(minhash_signature(shingles))
+            if len(signatures) >= args.pairwise_rows:
+                break
+        matrix = np.vstack(signatures)
+        start = time.perf_counter()
+        for position in range(1, len(matrix)):
+            np.count_nonzero(matrix[:position] == matrix[position], axis=1)
+        pairwise_seconds = time.perf_counter() - start
+        estimate = pairwise_seconds * (total / len(matrix)) ** 2
+        print(f"pairwise: {len(matrix)} songs in {pairwise_seconds:.2f} s → about {estimate:,.0f} s for {total} songs "
+              f"(signature comparison only, {pairs:,} pairs)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""
+uta-net.com / api.notion.com にアクセスしないエンドツーエンドのベンチマーク
+
+フィクスチャをUtaNetStandInで配信し、NotionをMockNotionServerで置き換えて、
+環境変数 UTA_NET_BASE_URL / NOTION_API_BASE_URL で scripts の接続先をローカルに向ける。
+シナリオごとに別プロセスで実行し、件数/秒・1件あたりの所要時間のp50/p99・ピークRSSをJSONで出力する。
+
+シナリオ:
+    song_ids      get_and_save_song_ids（アーティストページの巡回。所要時間はページ単位）
+    song_details  get_song_details_and_lyrics（楽曲ページの取得と解析）
+    convert       convert_to_notion_format（ネットワークなし）
+    upload        upload_csv_to_notion（Notionの代替サーバーへのアップロード）
+
+使い方:
+    python benchmarks/bench_offline.py [--fixtures 保存したフィクスチャ] [--scenarios song_ids,upload]
+        [--notion-latency 0.05] [--notion-429-rate 0.05] [--output result.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from offline_server import MockNotionServer, UtaNetStandIn, generate_fixtures, load_manifest  # noqa: E402
+
+SCENARIOS = ("song_ids", "song_details", "convert", "upload")
+
+
+def percentile(values, q):
+    """最近傍順位法の百分位数（valuesが空ならNone）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class LatencyRecorder:
+    """関数を包んで呼び出しごとの所要時間を記録する"""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def wrap(self, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.samples.append(elapsed)
+        return timed
+
+
+def _setup_scripts(workdir, args):
+    """子プロセスでscriptsを読み込み、ローカルの接続先とベンチマーク用の設定を反映する"""
+    sys.path.insert(0, ROOT)
+    import progress
+
+    progress.set_progress_backend("none")
+    import scripts
+    from throttle import AdaptiveScheduler
+
+    scripts.UTA_NET_CACHE_DIR = None
+    scripts.STATE_DB_PATH = os.path.join(workdir, "pipeline_state.sqlite3")
+    scripts.NOTION_TOKEN = scripts.NOTION_TOKEN or "bench"
+    scripts.NOTION_DATABASE_ID = scripts.NOTION_DATABASE_ID or "bench-db"
+    # uta-netの代替サーバーへの速度はベンチマークの引数で決める（既定は実質無制限）
+    scripts.uta_net_scheduler = AdaptiveScheduler(
+        initial_rate=args.uta_net_rate, min_rate=args.uta_net_rate, max_rate=args.uta_net_rate,
+        initial_concurrency=args.workers, max_concurrency=args.workers,
+    )
+    return scripts
+
+
+def run_scenario(name, manifest, workdir, args):
+    """
+    1つのシナリオを実行する（子プロセスで呼ばれる）
+
+    Returns:
+        dict: items, seconds, items_per_sec, songs, songs_per_sec, latency_p50, latency_p99, errors
+    """
+    scripts = _setup_scripts(workdir, args)
+    base_url = os.environ["UTA_NET_BASE_URL"]
+    song_ids = manifest["song_ids"][:args.songs] if args.songs else manifest["song_ids"]
+    recorder = LatencyRecorder()
+    errors = 0
+    songs = len(song_ids)
+
+    if name == "song_ids":
+        scripts._fetch_listing_page = recorder.wrap(scripts._fetch_listing_page)
+        start = time.perf_counter()
+        found = scripts.get_and_save_song_ids(base_url + manifest["artist_url_path"],
+                                              filepath=os.path.join(workdir, "song_ids.csv"),
+                                              max_workers=args.workers)
+        seconds = time.perf_counter() - start
+        songs = len(found)
+        items = len(recorder.samples)
+
+    elif name == "song_details":
+        fetch = recorder.wrap(scripts.get_song_details_and_lyrics)
+
+        def fetch_one(song_id):
+            try:
+                return fetch(song_id)
+            except Exception:
+                return None
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            results = list(executor.map(fetch_one, song_ids))
+        seconds = time.perf_counter() - start
+        errors = sum(1 for result in results if result is None)
+        items = len(song_ids)
+
+    elif name == "convert":
+        from song_parser import parse_song_page
+
+        pages = []
+        for song_id in song_ids:
+            with open(os.path.join(args.fixtures, "song", song_id, "index.html"), encoding="utf-8") as f:
+                pages.append(parse_song_page(song_id, f.read()))
+        convert = recorder.wrap(scripts.convert_to_notion_format)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for song_data in pages:
+                convert(song_data)
+        seconds = time.perf_counter() - start
+        items = len(pages) * args.repeat
+        songs = items
+
+    elif name == "upload":
+        from song_parser import SONG_FIELDS, parse_song_page
+        import pandas as pd
+
+        csv_path = os.path.join(workdir, "lyrics_data_bench.csv")
+        rows = []
+        for song_id in song_ids:
+            with open(os.path.join(args.fixtures, "song", song_id, "index.html"), encoding="utf-8") as f:
+                rows.append(parse_song_page(song_id, f.read()))
+        pd.DataFrame(rows, columns=SONG_FIELDS).to_csv(csv_path, index=False, encoding="utf-8-sig")
+        scripts.upload_to_notion = recorder.wrap(scripts.upload_to_notion)
+        start = time.perf_counter()
+        result = scripts.upload_csv_to_notion(csv_path, batch_size=args.workers, max_workers=args.workers,
+                                              rate_limit=args.notion_rate)
+        seconds = time.perf_counter() - start
+        errors = result["failed"]
+        items = result["total"]
+
+    else:
+        raise ValueError(f"未対応のシナリオです: {name}")
+
+    return {
+        "items": items,
+        "seconds": seconds,
+        "items_per_sec": items / seconds if seconds > 0 else None,
+        "songs": songs,
+        "songs_per_sec": songs / seconds if seconds > 0 else None,
+        "latency_p50": percentile(recorder.samples, 50),
+        "latency_p99": percentile(recorder.samples, 99),
+        "errors": errors,
+    }
+
+
+def _child(args):
+    manifest = load_manifest(args.fixtures)
+    with tempfile.TemporaryDirectory() as workdir:
+        # scriptsの進捗メッセージは標準エラーに回し、標準出力には結果のJSONだけを書く
+        with contextlib.redirect_stdout(sys.stderr):
+            result = run_scenario(args.child, manifest, workdir, args)
+    # Linuxのru_maxrssはKB単位
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(result))
+    return 0
+
+
+def _child_argv(args, scenario):
+    argv = [sys.executable, os.path.abspath(__file__), "--child", scenario, "--fixtures", args.fixtures]
+    for option in ("songs", "workers", "repeat", "uta_net_rate", "notion_rate"):
+        argv += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    return argv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", help="フィクスチャのディレクトリ（省略時はダミーを生成）")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="実行するシナリオ（カンマ区切り）")
+    parser.add_argument("--songs", type=int, default=0, help="使う曲数の上限（0なら全て）")
+    parser.add_argument("--workers", type=int, default=4, help="並列数（取得スレッド・アップロードワーカー）")
+    parser.add_argument("--repeat", type=int, default=20, help="convertシナリオの繰り返し回数")
+    parser.add_argument("--uta-net-rate", type=float, default=1000.0, help="uta-netの代替サーバーへの最大件数/秒")
+    parser.add_argument("--notion-rate", type=float, default=1000.0, help="Notionへの最大件数/秒")
+    parser.add_argument("--latency", type=float, default=0.0, help="uta-netの代替サーバーの応答遅延（秒）")
+    parser.add_argument("--notion-latency", type=float, default=0.0, help="Notionの代替サーバーの応答遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="両サーバーの遅延に加える0〜jitter秒の乱数")
+    parser.add_argument("--notion-429-rate", type=float, default=0.0, help="Notionの代替サーバーが429を返す確率")
+    parser.add_argument("--notion-retry-after", type=float, default=0.5, help="429のRetry-After（秒）")
+    parser.add_argument("--output", help="結果のJSONを書き出すファイル（省略時は標準出力）")
+    parser.add_argument("--verbose", action="store_true", help="各シナリオの進捗メッセージを表示する")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return _child(args)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未対応のシナリオです: {', '.join(unknown)}")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.fixtures is None:
+            args.fixtures = os.path.join(tmpdir, "fixtures")
+            generate_fixtures(args.fixtures)
+        manifest = load_manifest(args.fixtures)
+        report = {
+            "config": {
+                "fixtures": "generated" if args.fixtures.startswith(tmpdir) else args.fixtures,
+                "songs": len(manifest["song_ids"][:args.songs] if args.songs else manifest["song_ids"]),
+                "workers": args.workers,
+                "latency": args.latency,
+                "notion_latency": args.notion_latency,
+                "jitter": args.jitter,
+                "notion_429_rate": args.notion_429_rate,
+            },
+            "scenarios": {},
+        }
+        for scenario in scenarios:
+            # シナリオごとにサーバーを作り直し、Notionの代替サーバーのページと応答の件数を分ける
+            with UtaNetStandIn(args.fixtures, latency=args.latency, jitter=args.jitter) as uta_net, \
+                    MockNotionServer(latency=args.notion_latency, jitter=args.jitter, rate_429=args.notion_429_rate,
+                                     retry_after=args.notion_retry_after) as notion:
+                env = dict(os.environ, UTA_NET_BASE_URL=uta_net.url, NOTION_API_BASE_URL=f"{notion.url}/v1",
+                           UTA_NET_PROGRESS="none")
+                completed = subprocess.run(
+                    _child_argv(args, scenario), env=env, capture_output=True, text=True,
+                )
+                if args.verbose or completed.returncode != 0:
+                    sys.stderr.write(completed.stderr)
+                if completed.returncode != 0:
+                    report["scenarios"][scenario] = {"error": f"終了コード {completed.returncode}"}
+                    continue
+                result = json.loads(completed.stdout.strip().splitlines()[-1])
+                result["server_responses"] = {
+                    "uta_net": {str(status): count for status, count in sorted(uta_net.counts.items())},
+                    "notion": {str(status): count for status, count in sorted(notion.counts.items())},
+                }
+                report["scenarios"][scenario] = result
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0 if all("error" not in result for result in report["scenarios"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+歌詞データのCSVとParquet（列指向・辞書符号化・zstd圧縮）の比較ベンチマーク
+
+bench_csv_upload.pyと同じダミーの歌詞CSVを生成してParquetに変換し、
+ファイルサイズと次の読み込みの所要時間（繰り返しのうち最短）を表示する。
+
+    count        行数（旧方式はread_csvで全件、CSVはsong_id列だけ、Parquetはメタデータ）
+    check        check_csv_dataと同じ件数＋先頭5行の表示列
+    columns      song_id・title・artistの3列を全行
+    records      全列を1行ずつdictで（upload_csv_to_notionの入力経路）
+
+使い方:
+    python benchmarks/bench_parquet.py [--rows 50000] [--lyrics-chars 1500] [--csv 既存のCSV] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import pandas as pd  # noqa: E402
+
+from bench_csv_upload import generate_csv  # noqa: E402
+from columnar_store import (convert_csv_to_parquet, count_lyrics_rows, iter_lyrics_column,  # noqa: E402
+                            iter_lyrics_records, read_lyrics_head)
+
+SAMPLE_COLUMNS = ['song_id', 'title', 'artist', 'release_date']
+SELECTED_COLUMNS = ['song_id', 'title', 'artist']
+
+
+def best_of(repeat, func):
+    """funcをrepeat回実行し、最短の所要時間（秒）と最後の戻り値を返す"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def legacy_check(filepath):
+    """旧来のcheck_csv_data: 全件をDataFrameに読み込んで件数と先頭を得る"""
+    df = pd.read_csv(filepath)
+    return len(df), df[SAMPLE_COLUMNS].head()
+
+
+def check(filepath):
+    return count_lyrics_rows(filepath), read_lyrics_head(filepath, columns=SAMPLE_COLUMNS)
+
+
+def read_columns(filepath):
+    return sum(1 for _ in iter_lyrics_records(filepath, columns=SELECTED_COLUMNS, chunksize=10000))
+
+
+def read_records(filepath):
+    return sum(1 for _ in iter_lyrics_records(filepath))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000, help="生成するダミーCSVの行数")
+    parser.add_argument("--lyrics-chars", type=int, default=1500, help="1曲あたりの歌詞の文字数")
+    parser.add_argument("--csv", help="ダミーを生成せずにこのCSVを使う")
+    parser.add_argument("--repeat", type=int, default=3, help="各計測の繰り返し回数（最短を表示）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        csv_path = args.csv
+        if csv_path is None:
+            csv_path = os.path.join(tmpdir, "lyrics_data_bench.csv")
+            generate_csv(csv_path, args.rows, args.lyrics_chars)
+        parquet_path = os.path.join(tmpdir, "lyrics_data_bench.parquet")
+        convert_seconds, (_, rows) = best_of(1, lambda: convert_csv_to_parquet(csv_path, parquet_path))
+
+        csv_mb = os.path.getsize(csv_path) / (1024 * 1024)
+        parquet_mb = os.path.getsize(parquet_path) / (1024 * 1024)
+        print(f"rows: {rows}  CSV {csv_mb:.1f} MB  Parquet {parquet_mb:.1f} MB "
+              f"({parquet_mb / csv_mb:.0%})  変換 {convert_seconds:.2f} s")
+
+        cases = [
+            ("count", "csv (read_csv)", lambda: len(pd.read_csv(csv_path))),
+            ("count", "csv (song_id)", lambda: sum(1 for _ in iter_lyrics_column(csv_path, "song_id"))),
+            ("count", "parquet", lambda: count_lyrics_rows(parquet_path)),
+            ("check", "csv (read_csv)", lambda: legacy_check(csv_path)),
+            ("check", "csv", lambda: check(csv_path)),
+            ("check", "parquet", lambda: check(parquet_path)),
+            ("columns", "csv", lambda: read_columns(csv_path)),
+            ("columns", "parquet", lambda: read_columns(parquet_path)),
+            ("records", "csv", lambda: read_records(csv_path)),
+            ("records", "parquet", lambda: read_records(parquet_path)),
+        ]
+        for name, variant, func in cases:
+            seconds, _ = best_of(args.repeat, func)
+            print(f"{name:>8} {variant:>15}: {seconds * 1000:9.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+楽曲ページパーサーのマイクロベンチマーク
+
+保存済みの楽曲ページ（{song_id}.html）を各バックエンドで解析し、
+基準実装（html.parser）との結果の一致と1秒あたりの解析ページ数を表示する。
+楽曲詳細エリアが無いなど解析できないページ（SongParseError）も失敗として時間に含め、件数を表示する。
+
+使い方:
+    python benchmarks/bench_parsers.py <HTMLファイルのディレクトリ> [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from song_parser import PARSER_BACKENDS, SongParseError, compare_backends, parse_song_page  # noqa: E402
+
+
+def load_pages(directory):
+    """ディレクトリ内の*.htmlを{song_id: HTML}として読み込む"""
+    pages = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".html"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                pages[name[:-len(".html")]] = f.read()
+    return pages
+
+
+def benchmark_parsers(pages, repeat=3, backends=None):
+    """
+    バックエンドごとの解析速度を計測する
+
+    Args:
+        pages (dict): {song_id: HTML}
+        repeat (int): 計測の繰り返し回数（最速の回を採用）
+        backends (list): 計測するバックエンド（省略時は全て）
+
+    Returns:
+        dict: {backend: {"pages_per_sec": 1秒あたりの解析ページ数（失敗したページを含む）,
+                         "failed": SongParseErrorで解析できなかったページ数}}
+    """
+    results = {}
+    for backend in backends or PARSER_BACKENDS:
+        best = None
+        failed = 0
+        for _ in range(repeat):
+            failed = 0
+            start = time.perf_counter()
+            for song_id, html in pages.items():
+                try:
+                    parse_song_page(song_id, html, backend=backend)
+                except SongParseError:
+                    failed += 1
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[backend] = {"pages_per_sec": len(pages) / best if best else float("inf"), "failed": failed}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="楽曲ページのHTMLを保存したディレクトリ")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages(args.directory)
+    if not pages:
+        print(f"{args.directory}に*.htmlが見つかりません。")
+        return 1
+
+    mismatches = compare_backends(pages)
+    for backend, song_id, field, expected, actual in mismatches:
+        print(f"不一致: {backend} song_id={song_id} {field}: {expected!r} != {actual!r}")
+    print(f"一致チェック: {len(pages)}ページ, 不一致 {len(mismatches)}件")
+
+    for backend, result in benchmark_parsers(pages, repeat=args.repeat).items():
+        print(f"{backend:>12}: {result['pages_per_sec']:8.1f} pages/sec  解析できないページ {result['failed']}件")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
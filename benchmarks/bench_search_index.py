@@ -0,0 +1,111 @@
+"""
+全文検索の索引（search_index.py）のベンチマーク
+
+bench_csv_upload.pyと同じダミーの歌詞CSVから歌詞ストアとn-gram索引を作り、
+ランダムな曲の歌詞から切り出した検索語で次の検索のレイテンシ（p50/p99/最大）を表示する。
+
+    term{N}      N文字の検索語1つ（歌詞・タイトル・主題歌情報）
+    and          2つの検索語のAND
+    str.contains 全件をDataFrameに読み込んでstr.containsで探す従来の方法（--scan-queries回だけ）
+
+使い方:
+    python benchmarks/bench_search_index.py [--rows 100000] [--lyrics-chars 1500] [--queries 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import pandas as pd  # noqa: E402
+
+from bench_csv_upload import generate_csv  # noqa: E402
+from bench_offline import percentile  # noqa: E402
+from csv_stream import iter_csv_records  # noqa: E402
+from lyrics_store import build_lyrics_store, open_lyrics_store  # noqa: E402
+from search_index import SearchIndex, normalize_text  # noqa: E402
+
+
+def measure(queries, search):
+    samples = []
+    hits = 0
+    for query in queries:
+        start = time.perf_counter()
+        result = search(query)
+        samples.append(time.perf_counter() - start)
+        hits += len(result)
+    return samples, hits
+
+
+def report(name, samples, hits):
+    print(f"{name:>12}: {len(samples):5d} queries  p50 {percentile(samples, 50) * 1000:8.2f} ms  "
+          f"p99 {percentile(samples, 99) * 1000:8.2f} ms  max {max(samples) * 1000:8.2f} ms  "
+          f"hits/query {hits / len(samples):8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000, help="生成するダミーCSVの行数")
+    parser.add_argument("--lyrics-chars", type=int, default=600, help="1曲あたりの歌詞の文字数")
+    parser.add_argument("--csv", help="ダミーを生成せずにこのCSVを使う")
+    parser.add_argument("--queries", type=int, default=200, help="種類ごとの検索回数")
+    parser.add_argument("--scan-queries", type=int, default=3, help="str.containsで探す回数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        csv_path = args.csv
+        if csv_path is None:
+            csv_path = os.path.join(tmpdir, "lyrics_data_bench.csv")
+            generate_csv(csv_path, args.rows, args.lyrics_chars)
+        store_path = os.path.join(tmpdir, "lyrics_data_bench.lyrics")
+        index_path = os.path.join(tmpdir, "lyrics_data_bench.search.sqlite3")
+        build_lyrics_store(iter_csv_records(csv_path, columns=['song_id', 'lyrics']), store_path)
+
+        start = time.perf_counter()
+        with SearchIndex(index_path) as index:
+            for record in iter_csv_records(csv_path, columns=['song_id', 'title', 'main_theme', 'lyrics']):
+                index.add(record)
+        build_seconds = time.perf_counter() - start
+        index = SearchIndex(index_path, text_source=lambda song_ids: {
+            song_id: open_lyrics_store(store_path).get(song_id) for song_id in song_ids})
+        print(f"rows: {len(index)}  CSV {os.path.getsize(csv_path) / 1024 / 1024:.1f} MB  "
+              f"index {os.path.getsize(index_path) / 1024 / 1024:.1f} MB  build {build_seconds:.1f} s "
+              f"({len(index) / build_seconds:.0f} songs/s)")
+
+        # 検索語はランダムな曲の歌詞から切り出す（改行をまたがないもの）
+        rng = random.Random(0)
+        samples = [normalize_text(record['lyrics']) for record in iter_csv_records(csv_path, columns=['lyrics'])
+                   if rng.random() < 0.01] or [""]
+
+        def random_term(length):
+            for _ in range(100):
+                text = rng.choice(samples)
+                if len(text) < length:
+                    continue
+                position = rng.randrange(len(text) - length + 1)
+                term = text[position:position + length]
+                if " " not in term:
+                    return term
+            return "愛"
+
+        workloads = {f"term{length}": [random_term(length) for _ in range(args.queries)] for length in (1, 2, 3, 4, 6)}
+        workloads["and"] = [f"{random_term(3)} {random_term(4)}" for _ in range(args.queries)]
+        for name, queries in workloads.items():
+            report(name, *measure(queries, lambda query: index.search(query, limit=None)))
+
+        df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+        scan_queries = workloads["term4"][:args.scan_queries]
+        report("str.contains", *measure(scan_queries, lambda term: df.index[
+            df['lyrics'].str.contains(term, regex=False) | df['title'].str.contains(term, regex=False)
+            | df['main_theme'].str.contains(term, regex=False)
+        ]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+作業キュー（work_queue.py）で歌詞の取得を複数のワーカープロセスに分担したときのスループットのベンチマーク
+
+フィクスチャをUtaNetStandInで配信し、ワーカー数ごとに新しいキューへ全曲を登録してから
+同じ数のワーカープロセス（scripts.run_queue_worker）を起動し、全ワーカーがscriptsを読み込み終えてから
+全曲の取得が終わるまでを測る。
+各ワーカーのuta-net.comへの速度は --rate 件/秒に固定するので（実運用ではワーカーごとに自動調整）、
+理想的にはスループットがワーカー数に比例する。1ワーカーあたりのスループットの比（効率）も表示する。
+全ワーカー合計の速度はキューで共有する送信枠で --fleet-rate 件/秒に抑える。省略時は --rate × ワーカー数で、
+ワーカーごとの速度が上限になる。--fleet-rate を指定すると、ワーカーを増やしても合計がその値を超えないことを確かめられる。
+ワーカーと代替サーバーは同じマシンで動くので、CPUの数が少ないとCPUの取り合いで効率が下がる。
+
+--kill を指定すると、各回の途中で1つのワーカーを強制終了し、期限切れの貸し出しを残りのワーカーが
+引き取って全曲を取得できることも確かめる（その分だけ --lease 秒待つので効率は下がる）。
+
+使い方:
+    python benchmarks/bench_work_queue.py [--workers 1,2,4,8] [--songs 200] [--rate 3] [--fleet-rate 6] [--latency 0.1]
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from offline_server import UtaNetStandIn, generate_fixtures, load_manifest  # noqa: E402
+from work_queue import SQLiteWorkQueue  # noqa: E402
+
+
+def run_child(args):
+    """ワーカープロセスの本体（--child で呼ばれる）。結果をJSONの1行で出力する"""
+    import progress
+
+    progress.set_progress_backend("none")
+    import scripts
+    from throttle import AdaptiveScheduler
+
+    scripts.UTA_NET_CACHE_DIR = None
+    scripts.STATE_DB_PATH = None
+    scripts.WORK_QUEUE_POLL_INTERVAL = 0.2
+    scripts.uta_net_scheduler = AdaptiveScheduler(
+        initial_rate=args.rate, min_rate=args.rate, max_rate=args.rate,
+        initial_concurrency=args.threads, max_concurrency=args.threads,
+    )
+    # 読み込みが終わったことを知らせ、全ワーカーがそろうまで待つ
+    open(f"{args.queue}.ready-{args.worker_id}", "w").close()
+    while not os.path.exists(f"{args.queue}.go"):
+        time.sleep(0.01)
+    counts = scripts.run_queue_worker(queue=args.queue, worker_id=args.worker_id, max_workers=args.threads,
+                                      request_interval=1.0 / args.fleet_rate, batch_size=args.batch_size,
+                                      lease_seconds=args.lease)
+    print(json.dumps(counts))
+    return 0
+
+
+def run_round(args, workers, fixtures, uta_net_url, workdir):
+    queue_path = os.path.join(workdir, f"queue_{workers}.sqlite3")
+    song_ids = load_manifest(fixtures)["song_ids"][:args.songs]
+    with SQLiteWorkQueue(queue_path) as queue:
+        queue.enqueue(song_ids)
+
+    env = dict(os.environ, UTA_NET_BASE_URL=uta_net_url, UTA_NET_PROGRESS="none")
+    fleet_rate = args.fleet_rate or args.rate * workers
+    argv = [sys.executable, os.path.abspath(__file__), "--child", "--queue", queue_path,
+            "--rate", str(args.rate), "--fleet-rate", str(fleet_rate), "--threads", str(args.threads), "--batch-size", str(args.batch_size),
+            "--lease", str(args.lease)]
+    processes = [
+        subprocess.Popen(argv + ["--worker-id", f"bench-{index}"], env=env, stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL, text=True, cwd=workdir)
+        for index in range(workers)
+    ]
+    while not all(os.path.exists(f"{queue_path}.ready-bench-{index}") for index in range(workers)):
+        time.sleep(0.01)
+    start = time.perf_counter()
+    open(f"{queue_path}.go", "w").close()
+    if args.kill and workers > 1:
+        time.sleep(args.kill)
+        processes[0].send_signal(signal.SIGKILL)
+    for process in processes:
+        process.communicate()
+    seconds = time.perf_counter() - start
+
+    with SQLiteWorkQueue(queue_path) as queue:
+        counts = queue.counts()
+    return {"workers": workers, "seconds": seconds, "done": counts.get("done", 0),
+            "songs_per_sec": counts.get("done", 0) / seconds, "fleet_rate": fleet_rate}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4,8", help="試すワーカープロセス数（カンマ区切り）")
+    parser.add_argument("--songs", type=int, default=200, help="取得する曲数")
+    parser.add_argument("--rate", type=float, default=3.0, help="ワーカーごとのuta-net.comへの速度（件/秒）")
+    parser.add_argument("--fleet-rate", type=float, default=0.0,
+                        help="全ワーカー合計のuta-net.comへの速度の上限（件/秒、0なら --rate × ワーカー数）")
+    parser.add_argument("--threads", type=int, default=2, help="ワーカーごとの取得スレッド数")
+    parser.add_argument("--batch-size", type=int, default=10, help="1回に借りる曲数")
+    parser.add_argument("--lease", type=float, default=5.0, help="貸し出しの期限（秒）")
+    parser.add_argument("--latency", type=float, default=0.1, help="代替サーバーの応答の遅延（秒）")
+    parser.add_argument("--kill", type=float, default=0.0, help="この秒数後に1つのワーカーを強制終了する（0なら終了しない）")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--queue", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-id", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_child(args)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fixtures = os.path.join(tmpdir, "fixtures")
+        pages = max(1, -(-args.songs // 50))
+        generate_fixtures(fixtures, pages=pages, songs_per_page=50)
+        print(f"CPUs: {os.cpu_count()}")
+        results = []
+        for workers in (int(value) for value in args.workers.split(",")):
+            with UtaNetStandIn(fixtures, latency=args.latency) as uta_net:
+                results.append(run_round(args, workers, fixtures, uta_net.url, tmpdir))
+        base = results[0]["songs_per_sec"] / results[0]["workers"]
+        for result in results:
+            efficiency = result["songs_per_sec"] / (base * result["workers"])
+            print(f"workers {result['workers']:3d}: {result['done']:5d} songs in {result['seconds']:6.1f} s  "
+                  f"{result['songs_per_sec']:7.1f} songs/s  efficiency {efficiency:6.1%}  "
+                  f"limit {result['fleet_rate']:6.1f}/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,414 @@
+"""
+オフラインベンチマーク用のローカルサーバーとフィクスチャ
+
+- UtaNetStandIn: フィクスチャのディレクトリ（URLのパスと同じ階層に index.html を置いたもの）を
+  uta-net.comの代わりに配信する
+- MockNotionServer: Notion APIのうちこのプロジェクトが使うエンドポイント
+  （ページの作成・更新、データベースの取得・クエリ）をメモリ上で再現する。
+  応答の遅延と一定確率の429（Retry-After付き）を注入できる
+
+フィクスチャは record_fixtures() で実際のページ（レスポンスキャッシュ経由）を保存するか、
+generate_fixtures() で同じ構造のダミーページを生成して用意する。
+
+使い方:
+    python benchmarks/offline_server.py record https://www.uta-net.com/artist/134/ fixtures/ [--songs 200]
+    python benchmarks/offline_server.py generate fixtures/ [--pages 4] [--songs-per-page 50]
+    python benchmarks/offline_server.py serve fixtures/ [--port 8800] [--notion-port 8801] [--notion-429-rate 0.05]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ダミーの歌詞に使う文字
+_LYRICS_CHARS = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん愛夢空君僕心花風光"
+
+
+def fixture_path(directory, url_path):
+    """URLのパスに対応するフィクスチャのファイル（/artist/1/ → {directory}/artist/1/index.html）"""
+    parts = [part for part in url_path.split("/") if part]
+    return os.path.join(directory, *parts, "index.html")
+
+
+def _write_fixture(directory, url_path, html):
+    path = fixture_path(directory, url_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+def _padding(size):
+    # 実際のページに含まれるナビゲーションやスクリプトの代わり（解析対象外の要素）
+    block = '<li class="nav-item"><a class="nav-link" href="/ranking/">ランキング</a></li>\n'
+    return "<nav><ul>" + block * max(0, size // len(block)) + "</ul></nav>"
+
+
+def _song_page(song_id, artist_id, rng, lyrics_chars, padding):
+    lines = []
+    remaining = lyrics_chars
+    while remaining > 0:
+        length = min(remaining, rng.randint(8, 24))
+        lines.append("".join(rng.choice(_LYRICS_CHARS) for _ in range(length)))
+        remaining -= length
+    lyricist_id = 1000 + song_id % 50
+    composer_id = 2000 + song_id % 40
+    arranger_id = 3000 + song_id % 30
+    return f"""<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><title>曲{song_id}</title></head>
+<body>
+{_padding(padding)}
+<div class="blur-filter row py-3">
+  <h2 class="ms-2 ms-md-3 kashi-title">曲{song_id}</h2>
+  <h3 class="ms-2 ms-md-3"><a href="/artist/{artist_id}/">アーティスト{artist_id}</a></h3>
+  <p class="ms-2 ms-md-3 mb-0">ドラマ「タイトル{song_id % 7}」主題歌</p>
+  <p class="ms-2 ms-md-3 detail mb-0">
+    作詞：<a href="/lyricist/{lyricist_id}/">作詞者{lyricist_id}</a>
+    作曲：<a href="/composer/{composer_id}/">作曲者{composer_id}</a>
+    編曲：<a href="/arranger/{arranger_id}/">編曲者{arranger_id}</a>
+    発売日：2020/01/{1 + song_id % 28:02d} 曲ナンバー：{song_id}
+  </p>
+  <img class="img-fluid" src="https://example.com/cover/{song_id}.jpg">
+</div>
+<div id="kashi_area" itemprop="text">{"<br>".join(lines)}</div>
+{_padding(padding // 2)}
+</body></html>
+"""
+
+
+def _listing_page(artist_id, page, pages, song_ids, padding):
+    rows = []
+    for song_id in song_ids:
+        lyricist_id = 1000 + song_id % 50
+        composer_id = 2000 + song_id % 40
+        rows.append(
+            f'<tr><td><a class="py-2 py-lg-0" href="/song/{song_id}/"><span>曲{song_id}</span></a></td>'
+            f'<td><a href="/artist/{artist_id}/">アーティスト{artist_id}</a></td>'
+            f'<td><a href="/lyricist/{lyricist_id}/">作詞者{lyricist_id}</a></td>'
+            f'<td><a href="/composer/{composer_id}/">作曲者{composer_id}</a></td></tr>'
+        )
+    pagination = "".join(
+        f'<li class="page-item"><a class="page-link" href="/artist/{artist_id}/0/{p}/">{p}</a></li>'
+        for p in range(1, pages + 1) if p != page
+    )
+    return f"""<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><title>アーティスト{artist_id}</title></head>
+<body>
+{_padding(padding)}
+<table class="songlist-table"><tbody>{"".join(rows)}</tbody></table>
+<ul class="pagination">{pagination}</ul>
+</body></html>
+"""
+
+
+def generate_fixtures(directory, artist_id=1, pages=4, songs_per_page=50, lyrics_chars=600, padding=40000, seed=0):
+    """
+    uta-net.comと同じ構造のダミーのアーティストページと楽曲ページを生成する
+
+    Args:
+        directory (str): 保存先のディレクトリ
+        artist_id (int): アーティストID
+        pages (int): アーティストページのページ数
+        songs_per_page (int): 1ページあたりの曲数
+        lyrics_chars (int): 1曲あたりの歌詞の文字数
+        padding (int): 1ページに加える解析対象外のHTMLのバイト数（実際のページの大きさに近づける）
+        seed (int): 乱数のシード
+
+    Returns:
+        dict: {"artist_url_path": 1ページ目のパス, "song_ids": 曲IDのリスト}
+    """
+    rng = random.Random(seed)
+    song_ids = []
+    for page in range(1, pages + 1):
+        page_song_ids = [artist_id * 100000 + (page - 1) * songs_per_page + i + 1 for i in range(songs_per_page)]
+        song_ids.extend(page_song_ids)
+        url_path = f"/artist/{artist_id}/" if page == 1 else f"/artist/{artist_id}/0/{page}/"
+        _write_fixture(directory, url_path, _listing_page(artist_id, page, pages, page_song_ids, padding // 2))
+        for song_id in page_song_ids:
+            _write_fixture(directory, f"/song/{song_id}/", _song_page(song_id, artist_id, rng, lyrics_chars, padding))
+    manifest = {"artist_url_path": f"/artist/{artist_id}/", "song_ids": [str(song_id) for song_id in song_ids]}
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def record_fixtures(directory, artist_url, songs=200):
+    """
+    実際のアーティストページと楽曲ページを保存する（scriptsのキャッシュと間隔調整を通して取得する）
+
+    Args:
+        directory (str): 保存先のディレクトリ
+        artist_url (str): アーティストページのURL
+        songs (int): 保存する楽曲ページの数の上限
+
+    Returns:
+        dict: {"artist_url_path": 1ページ目のパス, "song_ids": 保存した曲IDのリスト}
+    """
+    sys.path.insert(0, ROOT)
+    import scripts
+    from listing_parser import listing_page_url, parse_listing_page, parse_listing_url
+
+    kind, listing_id = parse_listing_url(artist_url)
+    song_ids = []
+    page = 1
+    last_page = 1
+    while page <= last_page:
+        url = listing_page_url(kind, listing_id, page)
+        response = scripts.fetch_uta_net_page(url, max_age=scripts.LISTING_CACHE_MAX_AGE)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url}: ステータス {response.status_code}")
+        _write_fixture(directory, urlparse(url).path, response.text)
+        page_song_ids, page_last, _ = parse_listing_page(response.text, kind, listing_id)
+        song_ids.extend(page_song_ids)
+        last_page = max(last_page, page_last or 0)
+        page += 1
+
+    recorded = []
+    for song_id in song_ids[:songs]:
+        url = f"https://www.uta-net.com/song/{song_id}/"
+        response = scripts.fetch_uta_net_page(url, max_age=scripts.SONG_CACHE_MAX_AGE)
+        if response.status_code == 200:
+            _write_fixture(directory, urlparse(url).path, response.text)
+            recorded.append(song_id)
+    manifest = {"artist_url_path": urlparse(listing_page_url(kind, listing_id, 1)).path, "song_ids": recorded}
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def load_manifest(directory):
+    with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class _BackgroundServer:
+    """別スレッドで動かすHTTPサーバーの共通部分（withで起動・停止する）"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, seed=0):
+        """
+        Args:
+            host (str): 待ち受けるアドレス
+            port (int): 待ち受けるポート（0なら空いているポート）
+            latency (float): 全レスポンスに加える遅延（秒）
+            jitter (float): 遅延に加える0〜jitter秒の一様乱数
+            seed (int): 遅延と429の注入に使う乱数のシード
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # ヘッダーと本文を別々に送るため、Nagleアルゴリズムで応答が遅れないようにする
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                server._delay()
+                status, headers, payload = server.handle(self.command, self.path, body)
+                server._count(status)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PATCH = _dispatch
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _random(self):
+        with self._lock:
+            return self._rng.random()
+
+    def _delay(self):
+        delay = self.latency + (self._random() * self.jitter if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _count(self, status):
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def handle(self, method, path, body):
+        """(ステータス, ヘッダー, 本文のbytes) を返す（サブクラスで実装する）"""
+        raise NotImplementedError
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class UtaNetStandIn(_BackgroundServer):
+    """フィクスチャのディレクトリをuta-net.comの代わりに配信する（存在しないパスは404）"""
+
+    def __init__(self, directory, **kwargs):
+        self.directory = directory
+        super().__init__(**kwargs)
+
+    def handle(self, method, path, body):
+        if method != "GET":
+            return 405, {}, b""
+        path = fixture_path(self.directory, urlparse(path).path)
+        if not os.path.isfile(path):
+            return 404, {"Content-Type": "text/html; charset=utf-8"}, b"<html><body>Not Found</body></html>"
+        with open(path, "rb") as f:
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, f.read()
+
+
+class MockNotionServer(_BackgroundServer):
+    """
+    Notion APIの代わりになるメモリ上のサーバー
+
+    POST /v1/pages, PATCH /v1/pages/{id}, GET /v1/databases/{id}, POST /v1/databases/{id}/query に応答する。
+    rate_429の確率で429とRetry-After（retry_after秒）を返す。
+    """
+
+    def __init__(self, rate_429=0.0, retry_after=0.5, page_size_limit=100, **kwargs):
+        """
+        Args:
+            rate_429 (float): 429を返す確率（0〜1）
+            retry_after (float): 429のRetry-Afterの秒数
+            page_size_limit (int): クエリの1回あたりの最大件数
+        """
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.page_size_limit = page_size_limit
+        # ページID → ページ（作成順）
+        self.pages = {}
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def _json(status, data, headers=None):
+        return status, dict({"Content-Type": "application/json"}, **(headers or {})), json.dumps(data).encode("utf-8")
+
+    def _touch(self, page, properties):
+        page["properties"].update(properties)
+        page["last_edited_time"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+    def handle(self, method, path, body):
+        if self.rate_429 and self._random() < self.rate_429:
+            return self._json(429, {"object": "error", "code": "rate_limited"},
+                              {"Retry-After": f"{self.retry_after:g}"})
+        parts = [part for part in urlparse(path).path.split("/") if part]
+        if parts[:1] == ["v1"]:
+            parts = parts[1:]
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return self._json(400, {"object": "error", "code": "invalid_json"})
+
+        if parts == ["pages"] and method == "POST":
+            page = {"object": "page", "id": str(uuid.uuid4()), "properties": {}}
+            self._touch(page, data.get("properties", {}))
+            with self._lock:
+                self.pages[page["id"]] = page
+            return self._json(200, page)
+        if len(parts) == 2 and parts[0] == "pages" and method == "PATCH":
+            with self._lock:
+                page = self.pages.get(parts[1])
+                if page is None:
+                    return self._json(404, {"object": "error", "code": "object_not_found"})
+                self._touch(page, data.get("properties", {}))
+            return self._json(200, page)
+        if len(parts) == 2 and parts[0] == "databases" and method == "GET":
+            return self._json(200, {"object": "database", "id": parts[1],
+                                    "properties": {"song_id": {"id": "song_id", "type": "number"}}})
+        if len(parts) == 3 and parts[0] == "databases" and parts[2] == "query" and method == "POST":
+            with self._lock:
+                pages = list(self.pages.values())
+            since = (data.get("filter") or {}).get("last_edited_time", {}).get("on_or_after")
+            if since:
+                pages = [page for page in pages if page["last_edited_time"] >= since]
+            start = int(data.get("start_cursor") or 0)
+            size = min(int(data.get("page_size") or 100), self.page_size_limit)
+            chunk = pages[start:start + size]
+            has_more = start + size < len(pages)
+            return self._json(200, {"object": "list", "results": chunk, "has_more": has_more,
+                                    "next_cursor": str(start + size) if has_more else None})
+        return self._json(404, {"object": "error", "code": "invalid_request_url"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="実際のページをフィクスチャとして保存する")
+    record.add_argument("artist_url")
+    record.add_argument("directory")
+    record.add_argument("--songs", type=int, default=200)
+
+    generate = subparsers.add_parser("generate", help="ダミーのフィクスチャを生成する")
+    generate.add_argument("directory")
+    generate.add_argument("--pages", type=int, default=4)
+    generate.add_argument("--songs-per-page", type=int, default=50)
+    generate.add_argument("--lyrics-chars", type=int, default=600)
+
+    serve = subparsers.add_parser("serve", help="フィクスチャとNotionの代替サーバーを起動する")
+    serve.add_argument("directory")
+    serve.add_argument("--port", type=int, default=8800)
+    serve.add_argument("--notion-port", type=int, default=8801)
+    serve.add_argument("--latency", type=float, default=0.0, help="uta-netの応答遅延（秒）")
+    serve.add_argument("--notion-latency", type=float, default=0.0, help="Notionの応答遅延（秒）")
+    serve.add_argument("--notion-429-rate", type=float, default=0.0, help="Notionが429を返す確率")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        manifest = record_fixtures(args.directory, args.artist_url, songs=args.songs)
+        print(f"{len(manifest['song_ids'])}曲のページを{args.directory}に保存しました。")
+    elif args.command == "generate":
+        manifest = generate_fixtures(args.directory, pages=args.pages, songs_per_page=args.songs_per_page,
+                                     lyrics_chars=args.lyrics_chars)
+        print(f"{len(manifest['song_ids'])}曲のページを{args.directory}に生成しました。")
+    else:
+        with UtaNetStandIn(args.directory, port=args.port, latency=args.latency) as uta_net, \
+                MockNotionServer(port=args.notion_port, latency=args.notion_latency,
+                                 rate_429=args.notion_429_rate) as notion:
+            print(f"UTA_NET_BASE_URL={uta_net.url}")
+            print(f"NOTION_API_BASE_URL={notion.url}/v1")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
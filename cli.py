@@ -0,0 +1,396 @@
+"""
+UTA-NET歌詞スクレイピングのコマンドラインツール
+
+使い方:
+    python cli.py discover https://www.uta-net.com/artist/134/ [--incremental]
+    python cli.py scrape --artist-id 134 [--workers 4] [--parse-workers 2]
+    python cli.py scrape --retry-failed --artist-id 134
+    python cli.py batch artists.txt [--workers 4]
+    python cli.py crawl https://www.uta-net.com/lyricist/1234/ [--depth 1] [--follow lyricist,composer]
+    python cli.py enqueue https://www.uta-net.com/artist/134/ --queue /shared/work_queue.sqlite3
+    python cli.py work --queue /shared/work_queue.sqlite3 [--workers 2]   （ホスト・コンテナごとに実行）
+    python cli.py collect --queue /shared/work_queue.sqlite3 --artist-id 134
+    python cli.py upload lyrics_data_134.csv [--skip-test] [--duplicates canonical]
+    python cli.py export-parquet lyrics_data_134.csv
+    python cli.py lyrics 123456 --file lyrics_data_134.csv
+    python cli.py search "愛してる 君" --file lyrics_data_134.csv
+    python cli.py dupes lyrics_data_134.csv
+    python cli.py sync lyrics_data_134.csv
+    python cli.py status
+
+pandas / bs4 / requests などの重いモジュールは、サブコマンドの実行時に初めて読み込む
+（--helpや引数の誤りはすぐに返る）。
+"""
+import argparse
+import logging
+import os
+import sys
+
+
+def _load_scripts(args):
+    """scriptsを読み込み、共通オプションを反映して返す"""
+    import progress
+
+    progress.set_progress_backend(args.progress)
+    import scripts
+
+    scripts.configure_logging(args.log_format, level=logging.DEBUG if args.trace else logging.INFO)
+    if args.profile_dir:
+        scripts.set_profile_dir(args.profile_dir)
+
+    if args.state_db is not None:
+        scripts.STATE_DB_PATH = None if args.state_db == "none" else args.state_db
+    if args.cache_dir is not None:
+        scripts.UTA_NET_CACHE_DIR = None if args.cache_dir == "none" else args.cache_dir
+    if args.offline:
+        scripts.UTA_NET_OFFLINE = True
+    return scripts
+
+
+def _read_song_ids(scripts, args):
+    """scrapeの対象のsong_idを、指定されたCSVか状態DBから読み込む"""
+    from csv_stream import iter_csv_column
+
+    filepath = args.song_ids or (f"song_ids_{args.artist_id}.csv" if args.artist_id else None)
+    if filepath and os.path.exists(filepath):
+        return list(iter_csv_column(filepath, "song_id"))
+    store = scripts.get_state_store()
+    if store is not None and args.artist_id:
+        return sorted(store.song_ids(args.artist_id))
+    return None
+
+
+def cmd_discover(args):
+    scripts = _load_scripts(args)
+    song_ids = scripts.get_and_save_song_ids(
+        args.artist_url, filepath=args.output, incremental=args.incremental, max_workers=args.workers
+    )
+    return 0 if song_ids else 1
+
+
+def cmd_scrape(args):
+    scripts = _load_scripts(args)
+    if args.retry_failed:
+        scripts.retry_failed_songs(
+            args.artist_id, filepath=args.output, max_workers=args.workers, request_interval=args.interval
+        )
+        store = scripts.get_state_store()
+        return 1 if store is not None and store.failed_songs(args.artist_id) else 0
+    song_ids = _read_song_ids(scripts, args)
+    if song_ids is None:
+        print("song_idが見つかりません。--song-idsでCSVを指定するか、先にdiscoverを実行してください。", file=sys.stderr)
+        return 2
+    result = scripts.scrape_and_save_lyrics(
+        song_ids,
+        filepath=args.output,
+        artist_id=args.artist_id,
+        max_workers=args.workers,
+        request_interval=args.interval,
+        parse_workers=args.parse_workers,
+        parquet=args.parquet or None,
+    )
+    return 1 if result["failed"] else 0
+
+
+def cmd_batch(args):
+    with open(args.artists_file, encoding="utf-8") as f:
+        artist_urls = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not artist_urls:
+        print(f"{args.artists_file}にアーティストのURLがありません。", file=sys.stderr)
+        return 2
+    scripts = _load_scripts(args)
+    summary = scripts.crawl_artists(
+        artist_urls,
+        lyrics_filepath=args.output,
+        incremental=not args.full,
+        listing_workers=args.listing_workers,
+        max_workers=args.workers,
+        parse_workers=args.parse_workers,
+        batch_name=args.batch_name,
+        parquet=args.parquet or None,
+    )
+    if not summary or any(counts["failed"] for counts in summary.values()):
+        return 1
+    return 0
+
+
+def cmd_crawl(args):
+    follow_kinds = tuple(kind.strip() for kind in args.follow.split(",") if kind.strip())
+    scripts = _load_scripts(args)
+    catalogue = scripts.crawl_listings(
+        args.urls,
+        depth=args.depth,
+        follow_kinds=follow_kinds,
+        max_listings=args.max_listings or None,
+        max_workers=args.workers,
+        filepath=args.output,
+    )
+    return 0 if catalogue and all(catalogue.values()) else 1
+
+
+def cmd_enqueue(args):
+    scripts = _load_scripts(args)
+    for artist_url in args.artist_urls:
+        scripts.enqueue_artist_songs(
+            artist_url, queue=args.queue, incremental=args.incremental, max_workers=args.workers
+        )
+    scripts.show_queue_status(args.queue)
+    return 0
+
+
+def cmd_work(args):
+    scripts = _load_scripts(args)
+    kwargs = {}
+    if args.batch_size:
+        kwargs["batch_size"] = args.batch_size
+    if args.lease:
+        kwargs["lease_seconds"] = args.lease
+    counts = scripts.run_queue_worker(
+        queue=args.queue,
+        worker_id=args.worker_id,
+        max_workers=args.workers,
+        request_interval=args.interval,
+        wait=not args.no_wait,
+        **kwargs,
+    )
+    return 1 if counts["failed"] else 0
+
+
+def cmd_collect(args):
+    scripts = _load_scripts(args)
+    result = scripts.collect_queue_results(
+        queue=args.queue, filepath=args.output, artist_id=args.artist_id, parquet=args.parquet or None
+    )
+    scripts.show_queue_status(args.queue)
+    return 1 if result["failed"] or result["write_failed"] else 0
+
+
+def cmd_export_parquet(args):
+    scripts = _load_scripts(args)
+    return 0 if scripts.export_lyrics_parquet(args.csv_file, parquet_filepath=args.output) else 1
+
+
+def cmd_lyrics(args):
+    scripts = _load_scripts(args)
+    if args.build:
+        scripts.export_lyrics_store(args.file)
+    status = 0
+    for song_id in args.song_ids:
+        lyrics = scripts.get_lyrics(song_id, filepath=args.file)
+        if lyrics is None:
+            print(f"song_id: {song_id} の歌詞が{args.file}の歌詞ストアに見つかりません。", file=sys.stderr)
+            status = 1
+            continue
+        if len(args.song_ids) > 1:
+            print(f"# {song_id}")
+        print(lyrics)
+    return status
+
+
+def cmd_search(args):
+    fields = tuple(field.strip() for field in args.fields.split(",") if field.strip())
+    scripts = _load_scripts(args)
+    if args.build:
+        scripts.export_search_index(args.file)
+    results = scripts.search_lyrics(args.query, filepath=args.file, fields=fields, limit=args.limit or None)
+    for result in results:
+        print(f"{result['song_id']}\t{result['title']}")
+    return 0 if results else 1
+
+
+def cmd_dupes(args):
+    scripts = _load_scripts(args)
+    if args.build:
+        scripts.export_near_duplicates(args.csv_file)
+    clusters = scripts.get_near_duplicate_clusters(args.csv_file)
+    for canonical_id, members in clusters.items():
+        print(f"# {canonical_id}（{len(members)}曲）")
+        for member in members:
+            print(f"{member['song_id']}\t{member['title']}\t{member['artist']}")
+    variants = sum(len(members) - 1 for members in clusters.values())
+    print(f"{len(clusters)}クラスタ、代表以外の別バージョン{variants}曲", file=sys.stderr)
+    return 0
+
+
+def cmd_upload(args):
+    scripts = _load_scripts(args)
+    result = scripts.notion_upload_workflow(
+        args.csv_file,
+        skip_test=args.skip_test,
+        batch_size=args.batch_size,
+        delay=args.delay,
+        max_workers=args.workers,
+        duplicates=args.duplicates,
+    )
+    if result["status"] != "success" or result["result"]["failed"]:
+        return 1
+    return 0
+
+
+def cmd_sync(args):
+    scripts = _load_scripts(args)
+    result = scripts.sync_csv_to_notion(args.csv_file, batch_size=args.batch_size, max_workers=args.workers,
+                                        duplicates=args.duplicates)
+    return 1 if result["failed"] else 0
+
+
+def cmd_status(args):
+    scripts = _load_scripts(args)
+    if args.queue:
+        scripts.show_queue_status(args.queue)
+    counts = scripts.show_pipeline_status()
+    if counts is None:
+        return 1
+    store = scripts.get_state_store()
+    failed = store.failed_songs(args.artist_id)
+    if failed:
+        print(f"取得失敗（デッドレター）: {len(failed)}件")
+        for song_id, error in list(failed.items())[:args.show_failed]:
+            print(f"  {song_id}: {error}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--progress", choices=["auto", "notebook", "terminal", "plain", "none"], default="auto",
+                        help="進捗表示の方式（autoは端末ならterminal、それ以外はplain）")
+    parser.add_argument("--state-db", help="状態DBのパス（noneで無効）")
+    parser.add_argument("--cache-dir", help="レスポンスキャッシュのディレクトリ（noneで無効）")
+    parser.add_argument("--offline", action="store_true", help="ネットワークにアクセスせずキャッシュだけを使う")
+    parser.add_argument("--log-format", choices=["text", "json"], help="ログの形式（jsonは1行1イベント。省略時はUTA_NET_LOG_FORMAT）")
+    parser.add_argument("--trace", action="store_true", help="各ステージの区間（span）もログに出力する")
+    parser.add_argument("--profile-dir", help="scrape / upload の実行中のスタックを採取し、flamegraph用の折りたたみ形式で書き出すディレクトリ")
+    parser.add_argument("--metrics-out", help="終了時にステージ別の計測結果を書き出すファイル（.promならPrometheus形式、それ以外はJSON）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    discover = subparsers.add_parser("discover", help="アーティストページから楽曲IDを収集する")
+    discover.add_argument("artist_url", help="アーティスト（または作詞者・作曲者・編曲者）のページのURL")
+    discover.add_argument("--output", help="楽曲IDのCSV（省略時は song_ids_{artist_id}.csv）")
+    discover.add_argument("--incremental", action="store_true", help="新着ページだけを巡回する")
+    discover.add_argument("--workers", type=int, default=4, help="ページを並列取得するスレッド数")
+    discover.set_defaults(func=cmd_discover)
+
+    scrape = subparsers.add_parser("scrape", help="楽曲の詳細情報と歌詞を取得する")
+    scrape.add_argument("--artist-id", help="アーティストID（song_ids_{artist_id}.csvか状態DBから対象を読む）")
+    scrape.add_argument("--song-ids", help="対象のsong_idを含むCSV")
+    scrape.add_argument("--output", help="歌詞のCSV（省略時は lyrics_data_{artist_id}.csv）")
+    scrape.add_argument("--workers", type=int, default=1, help="同時に取得するスレッド数")
+    scrape.add_argument("--parse-workers", type=int, default=0, help="解析に使うプロセス数（0なら取得スレッド内で解析）")
+    scrape.add_argument("--interval", type=float, help="リクエスト間隔（秒）。省略時は自動調整")
+    scrape.add_argument("--retry-failed", action="store_true", help="取得に失敗した曲だけを再取得する")
+    scrape.add_argument("--parquet", action="store_true", help="取得後に同じ名前の.parquetも書き出す（pyarrowが必要）")
+    scrape.set_defaults(func=cmd_scrape)
+
+    batch = subparsers.add_parser("batch", help="複数アーティストの楽曲ID収集と歌詞取得をまとめて実行する")
+    batch.add_argument("artists_file", help="アーティストページのURLを1行に1つ書いたファイル（#で始まる行は無視）")
+    batch.add_argument("--output", default="lyrics_data_all.csv", help="全アーティスト分の歌詞のCSV")
+    batch.add_argument("--full", action="store_true", help="既知のアーティストも全ページを巡回する")
+    batch.add_argument("--listing-workers", type=int, default=4, help="アーティストページを並列取得するスレッド数")
+    batch.add_argument("--workers", type=int, default=1, help="楽曲ページを同時に取得するスレッド数")
+    batch.add_argument("--parse-workers", type=int, default=0, help="解析に使うプロセス数")
+    batch.add_argument("--batch-name", help="再開に使うバッチ名（省略時はアーティストの組み合わせから決める）")
+    batch.add_argument("--parquet", action="store_true", help="取得後に歌詞のCSVと同じ名前の.parquetも書き出す")
+    batch.set_defaults(func=cmd_batch)
+
+    crawl = subparsers.add_parser("crawl", help="一覧ページからクレジットをたどって楽曲IDを収集する")
+    crawl.add_argument("urls", nargs="+", help="アーティスト・作詞者・作曲者・編曲者のページのURL")
+    crawl.add_argument("--depth", type=int, default=1, help="クレジットをたどる深さ（0なら指定した一覧のみ）")
+    crawl.add_argument("--follow", default="lyricist,composer,arranger",
+                       help="たどる一覧の種類（artist / lyricist / composer / arranger をカンマ区切り）")
+    crawl.add_argument("--max-listings", type=int, default=200, help="巡回する一覧の数の上限（0なら無制限）")
+    crawl.add_argument("--workers", type=int, default=4, help="ページを並列取得するスレッド数")
+    crawl.add_argument("--output", default="song_ids_catalogue.csv", help="一覧ごとの楽曲IDを書き出すCSV")
+    crawl.set_defaults(func=cmd_crawl)
+
+    queue_help = "作業キューの場所（SQLiteのパスか sqlite:///共有ボリューム/...。省略時はUTA_NET_WORK_QUEUE）"
+
+    enqueue = subparsers.add_parser("enqueue", help="楽曲IDを収集し、複数のワーカーで取得するための作業キューに登録する")
+    enqueue.add_argument("artist_urls", nargs="+", help="アーティスト（または作詞者・作曲者・編曲者）のページのURL")
+    enqueue.add_argument("--queue", help=queue_help)
+    enqueue.add_argument("--incremental", action="store_true", help="新着ページだけを巡回する")
+    enqueue.add_argument("--workers", type=int, default=4, help="ページを並列取得するスレッド数")
+    enqueue.set_defaults(func=cmd_enqueue)
+
+    work = subparsers.add_parser("work", help="作業キューから曲を借りて楽曲ページを取得するワーカーを実行する")
+    work.add_argument("--queue", help=queue_help)
+    work.add_argument("--worker-id", help="ワーカーID（省略時は ホスト名-プロセスID）")
+    work.add_argument("--workers", type=int, default=1, help="同時に取得するスレッド数")
+    work.add_argument("--interval", type=float,
+                      help="全ワーカー合計でのリクエスト間隔（秒）。省略時はWORK_QUEUE_REQUEST_INTERVAL")
+    work.add_argument("--batch-size", type=int, help="1回に借りる曲数（省略時はLEASE_BATCH_SIZE）")
+    work.add_argument("--lease", type=float, help="貸し出しの期限（秒、省略時はLEASE_SECONDS）")
+    work.add_argument("--no-wait", action="store_true", help="借りられる曲が無くなったら、他のワーカーの期限切れを待たずに終了する")
+    work.set_defaults(func=cmd_work)
+
+    collect = subparsers.add_parser("collect", help="作業キューのワーカーが取得した結果を歌詞CSVに書き込む")
+    collect.add_argument("--queue", help=queue_help)
+    collect.add_argument("--artist-id", help="このアーティストとして登録した曲だけを回収する")
+    collect.add_argument("--output", help="歌詞のCSV（省略時は lyrics_data_{artist_id}.csv）")
+    collect.add_argument("--parquet", action="store_true", help="書き込み後に同じ名前の.parquetも書き出す")
+    collect.set_defaults(func=cmd_collect)
+
+    export_parquet = subparsers.add_parser("export-parquet", help="歌詞CSVを列指向のParquetに変換する")
+    export_parquet.add_argument("csv_file", help="歌詞のCSV")
+    export_parquet.add_argument("--output", help="出力先（省略時は拡張子を.parquetにしたパス）")
+    export_parquet.set_defaults(func=cmd_export_parquet)
+
+    lyrics = subparsers.add_parser("lyrics", help="歌詞ストアからsong_idの歌詞を表示する")
+    lyrics.add_argument("song_ids", nargs="+", help="楽曲ID")
+    lyrics.add_argument("--file", default="lyrics_data.csv", help="歌詞のCSV（並べて置いた.lyricsを読む）")
+    lyrics.add_argument("--build", action="store_true", help="CSVから歌詞ストアを作る・補ってから引く")
+    lyrics.set_defaults(func=cmd_lyrics)
+
+    search = subparsers.add_parser("search", help="歌詞・タイトル・主題歌情報を全文検索する")
+    search.add_argument("query", help="空白区切りの検索語（すべてを含む曲を探す。\"...\"で空白を含むフレーズ）")
+    search.add_argument("--file", default="lyrics_data.csv", help="歌詞のCSV（並べて置いた索引を使う）")
+    search.add_argument("--fields", default="lyrics,title,main_theme", help="探す列（カンマ区切り）")
+    search.add_argument("--limit", type=int, default=20, help="表示する件数の上限（0なら全件）")
+    search.add_argument("--build", action="store_true", help="CSVから索引を作る・補ってから検索する")
+    search.set_defaults(func=cmd_search)
+
+    dupes = subparsers.add_parser("dupes", help="歌詞がほぼ同じ曲（カバー・再録・別バージョン）のクラスタを表示する")
+    dupes.add_argument("csv_file", help="歌詞のCSV（並べて置いた索引を使う。.parquetも可）")
+    dupes.add_argument("--build", action="store_true", help="CSVから索引を作る・補ってから表示する")
+    dupes.set_defaults(func=cmd_dupes)
+
+    upload = subparsers.add_parser("upload", help="歌詞CSVをNotionにアップロードする")
+    upload.add_argument("csv_file", help="歌詞のCSV（.parquetも可）")
+    upload.add_argument("--skip-test", action="store_true", help="1件のテストアップロードを省略する")
+    upload.add_argument("--batch-size", type=int, default=3, help="連続して送信できる最大件数")
+    upload.add_argument("--delay", type=float, help="リクエスト間の最小間隔（秒）")
+    upload.add_argument("--workers", type=int, default=3, help="同時にアップロードするワーカー数")
+    upload.add_argument("--duplicates", choices=("all", "canonical", "link"),
+                        help="歌詞がほぼ同じ曲の扱い（canonical: 代表だけ、link: 代表だけにして他のバージョンを"
+                             "variantsに列挙。省略時はNOTION_DUPLICATE_MODE）")
+    upload.set_defaults(func=cmd_upload)
+
+    sync = subparsers.add_parser("sync", help="歌詞CSVとNotionを差分同期する")
+    sync.add_argument("csv_file", help="歌詞のCSV（.parquetも可）")
+    sync.add_argument("--batch-size", type=int, default=3, help="連続して送信できる最大件数")
+    sync.add_argument("--workers", type=int, default=3, help="同時に処理するワーカー数")
+    sync.add_argument("--duplicates", choices=("all", "canonical", "link"),
+                      help="歌詞がほぼ同じ曲の扱い（uploadと同じ。省略時はNOTION_DUPLICATE_MODE）")
+    sync.set_defaults(func=cmd_sync)
+
+    status = subparsers.add_parser("status", help="状態DBの件数と取得失敗の曲を表示する")
+    status.add_argument("--artist-id", help="取得失敗の曲をアーティストIDで絞り込む")
+    status.add_argument("--show-failed", type=int, default=10, help="表示する取得失敗の曲の数")
+    status.add_argument("--queue", help="作業キューの件数とワーカーごとの最終ハートビートも表示する")
+    status.set_defaults(func=cmd_status)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    finally:
+        # scriptsを読み込んだコマンドだけが計測結果を持つ
+        if args.metrics_out and "scripts" in sys.modules:
+            sys.modules["scripts"].metrics.write(args.metrics_out)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
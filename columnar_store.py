@@ -0,0 +1,197 @@
+import os
+
+from csv_stream import DEFAULT_CHUNKSIZE, iter_csv_column, iter_csv_records
+from song_parser import SONG_FIELDS
+
+# 値の種類が少なく、辞書符号化（値の一覧＋番号）で小さくなる列
+PARQUET_DICTIONARY_COLUMNS = ("artist", "main_theme", "lyricist", "composer", "arranger", "release_date")
+
+# 列ごとの圧縮方式（zstdは歌詞のような長い文字列でもgzip並みに縮み、展開が速い）
+PARQUET_COMPRESSION = "zstd"
+
+# 1つの行グループに入れる行数（列を絞った読み込みや先頭だけの読み込みはこの単位で行われる）
+PARQUET_ROW_GROUP_SIZE = 10000
+
+
+def _import_pyarrow():
+    """pyarrowを読み込む（任意の依存なので、使うときに初めて読み込む）"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquetの読み書きにはpyarrowが必要です（pip install pyarrow）。") from e
+    return pyarrow, pyarrow.parquet
+
+
+def is_parquet_path(filepath):
+    """拡張子が .parquet のファイルか"""
+    return str(filepath).lower().endswith(".parquet")
+
+
+def parquet_path_for(csv_filepath):
+    """歌詞CSVと同じ名前のParquetのパス（lyrics_data_134.csv → lyrics_data_134.parquet）"""
+    root, _ = os.path.splitext(csv_filepath)
+    return root + ".parquet"
+
+
+def lyrics_schema(fields=SONG_FIELDS):
+    """歌詞データのArrowスキーマ（PARQUET_DICTIONARY_COLUMNSは辞書型、それ以外は文字列）"""
+    pa, _ = _import_pyarrow()
+    return pa.schema([
+        pa.field(field, pa.dictionary(pa.int32(), pa.string()) if field in PARQUET_DICTIONARY_COLUMNS else pa.string())
+        for field in fields
+    ])
+
+
+def write_lyrics_parquet(records, filepath, fields=SONG_FIELDS, row_group_size=None):
+    """
+    楽曲データをParquetファイルに書き出す
+
+    PARQUET_ROW_GROUP_SIZE行ずつ行グループにして書くので、入力がイテレータなら
+    全件をメモリに載せない。一時ファイルに書いてから置き換えるため、途中で落ちても
+    古いファイルが壊れない。
+
+    Args:
+        records (iterable): {列名: 値} のdict
+        filepath (str): 出力先
+        fields (list): 列（省略時はSONG_FIELDS）
+        row_group_size (int): 1つの行グループの行数（省略時はPARQUET_ROW_GROUP_SIZE）
+
+    Returns:
+        int: 書き出した行数
+    """
+    pa, pq = _import_pyarrow()
+    schema = lyrics_schema(fields)
+    row_group_size = row_group_size or PARQUET_ROW_GROUP_SIZE
+    dictionary_columns = [field for field in fields if field in PARQUET_DICTIONARY_COLUMNS]
+
+    def flush(batch):
+        columns = [[_to_text(record.get(field)) for record in batch] for field in fields]
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=schema.field(field).type) for field, values in zip(fields, columns)],
+            schema=schema,
+        ), row_group_size=row_group_size)
+
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    tmp_path = f"{filepath}.tmp"
+    written = 0
+    try:
+        with pq.ParquetWriter(tmp_path, schema, compression=PARQUET_COMPRESSION,
+                              use_dictionary=dictionary_columns) as writer:
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) >= row_group_size:
+                    flush(batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                flush(batch)
+                written += len(batch)
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return written
+
+
+def _to_text(value):
+    """CSVから読んだ場合と同じく、欠損は空文字列にそろえる"""
+    if value is None or value != value:  # NaN
+        return ""
+    return str(value)
+
+
+def convert_csv_to_parquet(csv_filepath, parquet_filepath=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    歌詞CSVをParquetに変換する（CSVはチャンク単位で読むので全件をメモリに載せない）
+
+    Args:
+        csv_filepath (str): 歌詞CSVのパス
+        parquet_filepath (str): 出力先（省略時は拡張子を .parquet にしたパス）
+        chunksize (int): CSVを一度に読み込む行数
+
+    Returns:
+        tuple: (出力先, 書き出した行数)
+    """
+    parquet_filepath = parquet_filepath or parquet_path_for(csv_filepath)
+    written = write_lyrics_parquet(iter_csv_records(csv_filepath, chunksize=chunksize), parquet_filepath)
+    return parquet_filepath, written
+
+
+def parquet_row_count(filepath):
+    """Parquetのフッターのメタデータから行数を返す（データ本体は読まない）"""
+    _, pq = _import_pyarrow()
+    return pq.ParquetFile(filepath).metadata.num_rows
+
+
+def iter_parquet_records(filepath, columns=None, batch_size=DEFAULT_CHUNKSIZE):
+    """
+    Parquetファイルをbatch_size行ずつ読み込み、1行ずつdictとして返す
+
+    columnsを指定すると、その列のデータだけをディスクから読む。
+
+    Args:
+        filepath (str): Parquetファイルのパス
+        columns (list): 読み込む列（省略時は全列）
+        batch_size (int): 一度に読み込む行数
+
+    Yields:
+        dict: {列名: 値}
+    """
+    _, pq = _import_pyarrow()
+    parquet_file = pq.ParquetFile(filepath)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield from batch.to_pylist()
+
+
+def iter_parquet_column(filepath, column, batch_size=DEFAULT_CHUNKSIZE * 10):
+    """Parquetファイルの1列だけを読み込み、値を順に返す"""
+    _, pq = _import_pyarrow()
+    parquet_file = pq.ParquetFile(filepath)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=[column]):
+        yield from batch.column(0).to_pylist()
+
+
+def iter_lyrics_records(filepath, chunksize=DEFAULT_CHUNKSIZE, columns=None):
+    """歌詞データ（CSVまたはParquet）を1行ずつdictとして返す"""
+    if is_parquet_path(filepath):
+        return iter_parquet_records(filepath, columns=columns, batch_size=chunksize)
+    return iter_csv_records(filepath, chunksize=chunksize, columns=columns)
+
+
+def iter_lyrics_column(filepath, column):
+    """歌詞データ（CSVまたはParquet）の1列だけを順に返す"""
+    if is_parquet_path(filepath):
+        return iter_parquet_column(filepath, column)
+    return iter_csv_column(filepath, column)
+
+
+def count_lyrics_rows(filepath):
+    """
+    歌詞データの行数を返す
+
+    Parquetはメタデータだけを読む。CSVは行数を持たないのでsong_id列だけを読んで数える。
+    """
+    if is_parquet_path(filepath):
+        return parquet_row_count(filepath)
+    return sum(1 for _ in iter_csv_column(filepath, "song_id"))
+
+
+def read_lyrics_head(filepath, columns=None, n=5):
+    """
+    歌詞データの先頭n行だけをDataFrameで返す（columnsを指定するとその列だけを読む）
+
+    Parquetは先頭の行グループ、CSVは先頭のn行だけを読み込む。
+    """
+    import pandas as pd
+
+    if is_parquet_path(filepath):
+        _, pq = _import_pyarrow()
+        for batch in pq.ParquetFile(filepath).iter_batches(batch_size=n, columns=columns):
+            return batch.to_pandas()
+        return pd.DataFrame(columns=columns or SONG_FIELDS)
+    try:
+        return pd.read_csv(filepath, dtype=str, keep_default_na=False, usecols=columns, nrows=n)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(columns=columns or SONG_FIELDS)
@@ -0,0 +1,58 @@
+# 1チャンクで読み込む行数（メモリ使用量はおおよそこの行数分で頭打ちになる）
+DEFAULT_CHUNKSIZE = 1000
+
+
+def iter_csv_records(filepath, chunksize=DEFAULT_CHUNKSIZE, columns=None):
+    """
+    CSVファイルをチャンク単位で読み込み、1行ずつdictとして返す
+
+    ファイル全体をDataFrameに載せないため、巨大な歌詞CSVでもメモリ使用量が一定に保たれる。
+    値は型推論せず文字列のまま返し、空欄は空文字列になる
+    （"3.10"のような値が数値に化けず、チャンク間で型が揺れない）。
+
+    Args:
+        filepath (str): CSVファイルのパス
+        chunksize (int): 1チャンクで読み込む行数
+        columns (list): 読み込む列（省略時は全列）
+
+    Yields:
+        dict: {列名: 値}
+    """
+    import pandas as pd
+
+    try:
+        reader = pd.read_csv(
+            filepath,
+            dtype=str,
+            keep_default_na=False,
+            usecols=columns,
+            chunksize=chunksize,
+        )
+    except pd.errors.EmptyDataError:
+        return
+    with reader:
+        for chunk in reader:
+            yield from chunk.to_dict('records')
+
+
+def iter_csv_column(filepath, column, chunksize=DEFAULT_CHUNKSIZE * 10):
+    """
+    CSVファイルの1列だけをチャンク単位で読み込み、値を順に返す
+
+    Args:
+        filepath (str): CSVファイルのパス
+        column (str): 列名
+        chunksize (int): 1チャンクで読み込む行数
+
+    Yields:
+        str: 列の値
+    """
+    import pandas as pd
+
+    try:
+        reader = pd.read_csv(filepath, dtype=str, keep_default_na=False, usecols=[column], chunksize=chunksize)
+    except pd.errors.EmptyDataError:
+        return
+    with reader:
+        for chunk in reader:
+            yield from chunk[column].tolist()
@@ -0,0 +1,255 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+class CacheMissError(Exception):
+    """オフラインモードでキャッシュに存在しないURLを要求した"""
+
+
+class CachedResponse:
+    """キャッシュから返すレスポンス（requests.Responseの必要な属性だけを持つ）"""
+
+    def __init__(self, url, status_code, text, etag=None, last_modified=None, fetched_at=None, from_cache=True):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.from_cache = from_cache
+
+    def conditional_headers(self):
+        """再検証用の条件付きGETヘッダーを返す"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    URLをキーにしたディスク上のレスポンスキャッシュ
+
+    本文はzlib圧縮して内容のハッシュ名で保存する（同じ内容は1ファイルに集約）。
+    索引はSQLiteで持ち、最終アクセス順のLRUでmax_bytesを超えた分を削除する。
+    ETag / Last-Modifiedを保存し、期限切れの項目は条件付きGETで再検証できる。
+    """
+
+    def __init__(self, directory=".uta_net_cache", max_bytes=512 * 1024 * 1024):
+        """
+        Args:
+            directory (str): キャッシュを保存するディレクトリ
+            max_bytes (int): 本文ファイルの合計サイズの上限（バイト）
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._bodies_dir = os.path.join(directory, "bodies")
+        os.makedirs(self._bodies_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                body_hash TEXT NOT NULL,
+                status_code INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bodies (body_hash TEXT PRIMARY KEY, size INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _body_path(self, body_hash):
+        return os.path.join(self._bodies_dir, body_hash[:2], f"{body_hash}.z")
+
+    def get(self, url):
+        """
+        キャッシュされたレスポンスを返す
+
+        Args:
+            url (str): URL
+
+        Returns:
+            CachedResponse | None: 見つからなければNone
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body_hash, status_code, etag, last_modified, fetched_at FROM entries WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            body_hash, status_code, etag, last_modified, fetched_at = row
+            try:
+                with open(self._body_path(body_hash), "rb") as f:
+                    text = zlib.decompress(f.read()).decode("utf-8")
+            except (OSError, zlib.error):
+                # 本文が失われている項目は無かったことにする
+                self._conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+        return CachedResponse(url, status_code, text, etag, last_modified, fetched_at)
+
+    def put(self, url, status_code, text, etag=None, last_modified=None):
+        """
+        レスポンスを保存する
+
+        Args:
+            url (str): URL
+            status_code (int): ステータスコード
+            text (str): 本文
+            etag (str): ETagヘッダー
+            last_modified (str): Last-Modifiedヘッダー
+        """
+        data = text.encode("utf-8")
+        body_hash = hashlib.sha256(data).hexdigest()
+        path = self._body_path(body_hash)
+        now = time.time()
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                compressed = zlib.compress(data, 6)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(compressed)
+                os.replace(tmp_path, path)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO bodies (body_hash, size) VALUES (?, ?)", (body_hash, len(compressed))
+                )
+            old = self._conn.execute("SELECT body_hash FROM entries WHERE url = ?", (url,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (url, body_hash, status_code, etag, last_modified, fetched_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, body_hash, status_code, etag, last_modified, now, now),
+            )
+            if old and old[0] != body_hash:
+                self._drop_body_if_unused(old[0])
+            self._evict()
+            self._conn.commit()
+
+    def mark_revalidated(self, url):
+        """304で再検証できた項目の取得時刻を更新する"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE entries SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+            self._conn.commit()
+
+    def total_bytes(self):
+        """本文ファイルの合計サイズ（圧縮後）を返す"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _drop_body_if_unused(self, body_hash):
+        in_use = self._conn.execute("SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1", (body_hash,)).fetchone()
+        if in_use:
+            return
+        self._conn.execute("DELETE FROM bodies WHERE body_hash = ?", (body_hash,))
+        try:
+            os.remove(self._body_path(body_hash))
+        except OSError:
+            pass
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT url, body_hash FROM entries ORDER BY accessed_at").fetchall()
+        for url, body_hash in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+            size = self._conn.execute("SELECT size FROM bodies WHERE body_hash = ?", (body_hash,)).fetchone()
+            self._drop_body_if_unused(body_hash)
+            still_used = self._conn.execute("SELECT 1 FROM bodies WHERE body_hash = ?", (body_hash,)).fetchone()
+            if size and not still_used:
+                total -= size[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def cached_get(client, cache, url, max_age=None, offline=False, before_request=None, after_request=None,
+               retry_policy=None, breaker=None):
+    """
+    キャッシュを優先してGETする
+
+    キャッシュから返す場合はリトライもサーキットブレーカーも通らない（ブレーカーの状態も変えない）ので、
+    遮断中のホストでもキャッシュにあるページは返せる。
+
+    Args:
+        client (HttpClient): 実際のリクエストに使うクライアント
+        cache (ResponseCache | None): キャッシュ（Noneなら常にリクエストする）
+        url (str): URL
+        max_age (float | None): この秒数以内に取得した項目はそのまま返す。
+            Noneなら期限なし、0なら毎回条件付きGETで再検証する
+        offline (bool): Trueならネットワークに一切アクセスしない
+        before_request (callable): 実際にリクエストする直前に呼ぶ関数（間隔調整用）
+        after_request (callable): 実際にリクエストした後に (url, status_code, 応答秒数) で呼ぶ関数。
+            接続エラーの場合はstatus_codeをNoneにして呼んでから例外を送出する
+        retry_policy (RetryPolicy): 実際のリクエストだけをこの方針でリトライする
+        breaker (CircuitBreaker): retry_policyと一緒に使うサーキットブレーカー
+
+    Returns:
+        CachedResponse | requests.Response: status_codeとtextを持つレスポンス
+    """
+    cached = cache.get(url) if cache is not None else None
+    if offline:
+        if cached is None:
+            raise CacheMissError(f"オフラインモードですがキャッシュにありません: {url}")
+        return cached
+    if cached is not None and (max_age is None or time.time() - cached.fetched_at < max_age):
+        return cached
+
+    headers = cached.conditional_headers() if cached is not None else {}
+
+    def request():
+        if before_request is not None:
+            before_request(url)
+        start = time.monotonic()
+        try:
+            response = client.get(url, headers=headers)
+        except Exception:
+            if after_request is not None:
+                after_request(url, None, time.monotonic() - start)
+            raise
+        if after_request is not None:
+            after_request(url, response.status_code, time.monotonic() - start)
+        return response
+
+    if retry_policy is not None:
+        response = retry_policy.call(request, url, breaker=breaker)
+    else:
+        response = request()
+
+    if response.status_code == 304 and cached is not None:
+        cache.mark_revalidated(url)
+        return cached
+    if cache is not None and response.status_code == 200:
+        cache.put(
+            url,
+            response.status_code,
+            response.text,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+    return response
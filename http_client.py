@@ -0,0 +1,111 @@
+import threading
+from urllib.parse import urlparse
+
+# (接続タイムアウト, 読み込みタイムアウト) 秒
+DEFAULT_TIMEOUT = (10, 30)
+
+
+class HttpClient:
+    """
+    ホストごとにKeep-Aliveセッションをプールして使い回すHTTPクライアント
+
+    uta-net.comとapi.notion.comへのリクエストで同じTCP/TLS接続を再利用し、
+    全リクエストに既定のタイムアウトを設定する。リトライ方針は
+    urllib3.util.Retry（またはリトライ回数のint）で差し替えられる。
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retry=None, host_retries=None, pool_maxsize=10):
+        """
+        Args:
+            timeout (float | tuple): 既定のタイムアウト（秒）
+            retry (urllib3.util.Retry | int | None): 全ホスト共通のリトライ方針
+            host_retries (dict): ホスト名ごとのリトライ方針（retryより優先）
+            pool_maxsize (int): ホストごとに保持する接続数の上限
+        """
+        self.timeout = timeout
+        self.retry = retry
+        self.host_retries = dict(host_retries or {})
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._adapters = {}
+        self._lock = threading.Lock()
+
+    def session(self, url):
+        """
+        urlのホストに対応するセッションを返す（なければ作成する）
+
+        Args:
+            url (str): リクエスト先のURL
+
+        Returns:
+            requests.Session: ホスト専用のセッション
+        """
+        parsed = urlparse(url)
+        key = f"{parsed.scheme}://{parsed.netloc}"
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                # requestsは最初のリクエストで読み込む（状態の表示などネットワークを使わないコマンドを速くする）
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                retry = self.host_retries.get(parsed.netloc, self.retry)
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_maxsize,
+                    max_retries=retry if retry is not None else 0,
+                )
+                session = requests.Session()
+                session.mount(f"{parsed.scheme}://", adapter)
+                self._sessions[key] = session
+                self._adapters[key] = adapter
+            return session
+
+    def request(self, method, url, **kwargs):
+        """既定のタイムアウトを付けてリクエストを送信する"""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session(url).request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def stats(self):
+        """
+        ホストごとの接続再利用の統計を返す
+
+        Returns:
+            dict: {ホスト: {"requests": 送信数, "connections": 新規接続数, "reused": 再利用数}}
+        """
+        result = {}
+        with self._lock:
+            adapters = list(self._adapters.items())
+        for key, adapter in adapters:
+            requests_count = 0
+            connections = 0
+            pools = adapter.poolmanager.pools
+            for pool_key in list(pools.keys()):
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                requests_count += pool.num_requests
+                connections += pool.num_connections
+            result[key] = {
+                "requests": requests_count,
+                "connections": connections,
+                "reused": max(requests_count - connections, 0),
+            }
+        return result
+
+    def close(self):
+        """全セッションを閉じる"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._adapters.clear()
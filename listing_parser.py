@@ -0,0 +1,106 @@
+import re
+from urllib.parse import urljoin, urlparse
+
+UTA_NET_BASE_URL = "https://www.uta-net.com"
+
+# 曲の一覧ページを持つ種類（URLの1階層目）
+LISTING_KINDS = ("artist", "lyricist", "composer", "arranger")
+
+# 一覧ページの曲リンクのクラス
+SONG_LINK_CLASS = "py-2 py-lg-0"
+
+_LISTING_PATH_PATTERN = re.compile(r"^/(%s)/(\d+)(?:/|$)" % "|".join(LISTING_KINDS))
+
+
+def parse_listing_url(url):
+    """
+    一覧ページのURLから種類とIDを取り出す
+
+    Args:
+        url (str): https://www.uta-net.com/lyricist/1234/ のようなURL（相対パスでもよい）
+
+    Returns:
+        tuple: (種類, ID)
+
+    Raises:
+        ValueError: LISTING_KINDSの一覧ページではない場合
+    """
+    match = _LISTING_PATH_PATTERN.match(urlparse(url).path)
+    if match is None:
+        raise ValueError(f"一覧ページのURLではありません: {url}")
+    return match.group(1), match.group(2)
+
+
+def listing_key(kind, listing_id):
+    """
+    状態DBで一覧ページを区別するキー
+
+    アーティストは従来どおりIDそのもの、それ以外は "lyricist:1234" のように種類を付ける。
+    """
+    if kind == "artist":
+        return str(listing_id)
+    return f"{kind}:{listing_id}"
+
+
+def listing_page_url(kind, listing_id, page, base_url=UTA_NET_BASE_URL):
+    """一覧ページのpageページ目のURL（2ページ目以降は /{種類}/{ID}/0/{page}/）"""
+    if page == 1:
+        return f"{base_url}/{kind}/{listing_id}/"
+    return f"{base_url}/{kind}/{listing_id}/0/{page}/"
+
+
+def _row_credits(row, kind, listing_id):
+    """曲一覧の1行にある一覧ページへのリンク {(種類, ID)}（この一覧自身は含まない）"""
+    credits = set()
+    for link in row.find_all("a", href=True):
+        try:
+            credit = parse_listing_url(urljoin(UTA_NET_BASE_URL, link["href"]))
+        except ValueError:
+            continue
+        if credit != (kind, str(listing_id)):
+            credits.add(credit)
+    return credits
+
+
+def parse_listing_page(page_html, kind, listing_id):
+    """
+    一覧ページから曲ID・最終ページ番号・クレジットのリンクを取り出す
+
+    Args:
+        page_html (str): 一覧ページのHTML
+        kind (str): 一覧の種類（LISTING_KINDSのいずれか）
+        listing_id (str): 一覧のID
+
+    Returns:
+        tuple: (このページの曲IDのリスト,
+                ページネーションに現れた最大のページ番号またはNone,
+                曲一覧の各行にあるクレジットのリンクの集合 {(種類, ID)}（この一覧自身は含まない）)
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page_html, "html.parser")
+
+    # このページの曲リンクから曲IDを抽出し、同じ行（<tr>）にある歌手・作詞・作曲・編曲のリンクを集める
+    # （ナビゲーションやサイドバー、ランキングのリンクは曲の行の外にあるので含まれない）
+    page_song_ids = []
+    credits = set()
+    for song_link in soup.find_all("a", class_=SONG_LINK_CLASS):
+        href = song_link.get("href")
+        if href and "/song/" in href:
+            try:
+                page_song_ids.append(href.split("/")[-2])
+            except IndexError:
+                continue  # エラーは静かに処理
+            row = song_link.find_parent("tr")
+            if row is not None:
+                credits |= _row_credits(row, kind, listing_id)
+
+    # ページネーションのリンクから最大のページ番号を取得
+    page_pattern = re.compile(rf"/{kind}/{re.escape(str(listing_id))}/0/(\d+)/")
+    last_page = None
+    for link in soup.find_all("a", class_="page-link"):
+        match = page_pattern.search(link.get("href") or "")
+        if match:
+            last_page = max(last_page or 0, int(match.group(1)))
+
+    return page_song_ids, last_page, credits
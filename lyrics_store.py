@@ -0,0 +1,344 @@
+import mmap
+import os
+import struct
+import threading
+
+# データファイルの各レコードの先頭（song_id, 歌詞のバイト数）。歌詞本文（UTF-8）が続く
+RECORD_HEADER = struct.Struct("<QI")
+
+# 索引ファイルの先頭（マジック, バージョン, 件数, 索引に含めたデータファイルのバイト数）
+INDEX_MAGIC = b"ULIX"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<4sIQQ")
+
+# 索引の1件（song_id, 歌詞本文の位置, バイト数）。song_idの昇順に並べる
+INDEX_ENTRY = struct.Struct("<QQI")
+
+
+def lyrics_store_path_for(csv_filepath):
+    """歌詞CSVと同じ名前のストアのパス（lyrics_data_134.csv → lyrics_data_134.lyrics）"""
+    root, _ = os.path.splitext(csv_filepath)
+    return root + ".lyrics"
+
+
+def index_path_for(store_path):
+    return store_path + ".idx"
+
+
+def _song_key(song_id):
+    """song_idを索引のキー（符号なし整数）にする"""
+    try:
+        key = int(str(song_id).strip())
+    except ValueError:
+        raise ValueError(f"song_idは数字である必要があります: {song_id!r}") from None
+    if key < 0:
+        raise ValueError(f"song_idは数字である必要があります: {song_id!r}")
+    return key
+
+
+def _read_index(store_path):
+    """
+    索引ファイルを読み込む
+
+    Returns:
+        tuple: (索引の本体のbytes、または索引がなければNone, 件数, 索引に含めたデータのバイト数)
+    """
+    try:
+        with open(index_path_for(store_path), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None, 0, 0
+    if len(data) < INDEX_HEADER.size:
+        return None, 0, 0
+    magic, version, count, covered = INDEX_HEADER.unpack_from(data)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION or len(data) != INDEX_HEADER.size + count * INDEX_ENTRY.size:
+        # 壊れた索引はデータファイルから作り直す
+        return None, 0, 0
+    return data, count, covered
+
+
+def _scan_records(buffer, start, end):
+    """
+    データファイルのstartからendまでのレコードを順に返す
+
+    Yields:
+        tuple: (song_idのキー, 歌詞本文の位置, バイト数, 次のレコードの位置)
+    """
+    position = start
+    while position + RECORD_HEADER.size <= end:
+        key, length = RECORD_HEADER.unpack_from(buffer, position)
+        offset = position + RECORD_HEADER.size
+        if offset + length > end:
+            # 書きかけのレコード（異常終了時）
+            return
+        position = offset + length
+        yield key, offset, length, position
+
+
+class LyricsStoreWriter:
+    """
+    歌詞を追記専用のデータファイルに書き込み、閉じるときにsong_idの索引を書き出す
+
+    データファイルの各レコードは song_id と長さのヘッダーを持つので、索引を書き出す前に
+    異常終了しても、次に開いたときに索引に含まれていない末尾を読み直して続きから追記できる
+    （書きかけのレコードは切り捨てる）。同じsong_idを再度書き込んだ場合は新しい方が有効になる。
+    書き込みは1つのプロセス・スレッドから行う。
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): データファイルのパス（索引は {path}.idx）
+        """
+        self.path = path
+        self.written = 0
+        self._new_entries = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "ab")
+        self._recover()
+
+    def _recover(self):
+        """索引に含まれていない末尾のレコードを拾い、書きかけのレコードを切り捨てる"""
+        _, _, covered = _read_index(self.path)
+        size = os.path.getsize(self.path)
+        if size < covered:
+            # データファイルが索引より短い（差し替えられた）場合は全体を読み直す
+            covered = 0
+            os.remove(index_path_for(self.path))
+        end = covered
+        if size > covered:
+            with open(self.path, "rb") as f:
+                f.seek(covered)
+                tail = f.read()
+            for key, offset, length, position in _scan_records(tail, 0, len(tail)):
+                self._new_entries[key] = (covered + offset, length)
+                end = covered + position
+        if end < size:
+            self._file.truncate(end)
+        self._end = end
+
+    def append(self, song_id, lyrics):
+        """1曲の歌詞を追記する"""
+        body = (lyrics or "").encode("utf-8")
+        self._file.write(RECORD_HEADER.pack(_song_key(song_id), len(body)))
+        self._file.write(body)
+        self._new_entries[_song_key(song_id)] = (self._end + RECORD_HEADER.size, len(body))
+        self._end += RECORD_HEADER.size + len(body)
+        self.written += 1
+
+    def flush(self):
+        """追記した分をディスクに書き出す（索引は更新しない）"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def write_index(self):
+        """既存の索引と追記した分をsong_id順に合わせた索引を書き出す"""
+        self.flush()
+        data, count, covered = _read_index(self.path)
+        if data is not None and not self._new_entries and covered == self._end:
+            return
+        entries = {}
+        if data is not None:
+            for index in range(count):
+                key, offset, length = INDEX_ENTRY.unpack_from(data, INDEX_HEADER.size + index * INDEX_ENTRY.size)
+                entries[key] = (offset, length)
+        entries.update(self._new_entries)
+
+        index_path = index_path_for(self.path)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(entries), self._end))
+            for key in sorted(entries):
+                offset, length = entries[key]
+                f.write(INDEX_ENTRY.pack(key, offset, length))
+            f.flush()
+            os.fsync(f.fileno())
+        # 一時ファイルに書いてから置き換える（読み込み中のプロセスは古い索引をそのまま使える）
+        os.replace(tmp_path, index_path)
+        self._new_entries = {}
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            self.write_index()
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class LyricsStore:
+    """
+    mmapで歌詞ストアを読み込み、song_idから歌詞を引く
+
+    索引（song_id昇順の固定長レコード）を二分探索し、データファイルの該当する範囲だけを読む。
+    どちらもmmapで開くので、複数のプロセスで開いてもOSのページキャッシュを共有する。
+    開いた時点の内容を読む（その後の追記は開き直すまで見えない。open_lyrics_storeは変更を検知して開き直す）。
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): データファイルのパス（索引は {path}.idx）
+        """
+        self.path = path
+        self._data_file = None
+        self._data = None
+        self._index = None
+        self._count = 0
+        self._tail = {}
+        self.size = 0
+        self._open()
+
+    def _open(self):
+        self.size = os.path.getsize(self.path)
+        self._data_file = open(self.path, "rb")
+        if self.size:
+            self._data = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        covered = 0
+        index_path = index_path_for(self.path)
+        if os.path.exists(index_path) and os.path.getsize(index_path) >= INDEX_HEADER.size:
+            with open(index_path, "rb") as f:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, count, covered = INDEX_HEADER.unpack_from(index)
+            if (magic == INDEX_MAGIC and version == INDEX_VERSION and covered <= self.size
+                    and len(index) == INDEX_HEADER.size + count * INDEX_ENTRY.size):
+                self._index, self._count = index, count
+            else:
+                index.close()
+                covered = 0
+
+        # 索引を書き出す前に追記された末尾（書き込み中・異常終了後）は走査して辞書に持つ
+        if self._data is not None and covered < self.size:
+            for key, offset, length, _ in _scan_records(self._data, covered, self.size):
+                self._tail[key] = (offset, length)
+
+    def _search_index(self, key):
+        """索引を二分探索する"""
+        index = self._index
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            middle_key, offset, length = INDEX_ENTRY.unpack_from(index, INDEX_HEADER.size + middle * INDEX_ENTRY.size)
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return offset, length
+        return None
+
+    def _lookup(self, key):
+        # 末尾の方が新しいので先に引く
+        found = self._tail.get(key)
+        if found is None:
+            found = self._search_index(key)
+        return found
+
+    def get(self, song_id, default=None):
+        """
+        song_idの歌詞を返す
+
+        Args:
+            song_id (str): 楽曲ID
+            default: 見つからない場合の戻り値
+
+        Returns:
+            str: 歌詞（見つからない場合はdefault）
+        """
+        try:
+            key = _song_key(song_id)
+        except ValueError:
+            return default
+        found = self._lookup(key)
+        if found is None:
+            return default
+        offset, length = found
+        return self._data[offset:offset + length].decode("utf-8")
+
+    def __contains__(self, song_id):
+        return self.get(song_id) is not None
+
+    def __len__(self):
+        return self._count + sum(1 for key in self._tail if self._search_index(key) is None)
+
+    def song_ids(self):
+        """格納している全song_idを昇順に返す"""
+        keys = {key for key, _ in self._iter_index()}
+        keys.update(self._tail)
+        return [str(key) for key in sorted(keys)]
+
+    def _iter_index(self):
+        for index in range(self._count):
+            key, offset, length = INDEX_ENTRY.unpack_from(self._index, INDEX_HEADER.size + index * INDEX_ENTRY.size)
+            yield key, (offset, length)
+
+    def close(self):
+        for handle in (self._index, self._data, self._data_file):
+            if handle is not None:
+                handle.close()
+        self._index = self._data = self._data_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def build_lyrics_store(records, path):
+    """
+    楽曲データのイテレータから歌詞ストアを作り直す
+
+    Args:
+        records (iterable): song_idとlyricsを持つdict
+        path (str): データファイルのパス
+
+    Returns:
+        int: 書き込んだ件数
+    """
+    for existing in (path, index_path_for(path)):
+        if os.path.exists(existing):
+            os.remove(existing)
+    with LyricsStoreWriter(path) as writer:
+        for record in records:
+            writer.append(record["song_id"], record.get("lyrics"))
+    return writer.written
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_lyrics_store(path):
+    """
+    プロセス内で共有する読み込み用のストアを返す
+
+    データファイルか索引が前回開いたときから変わっていれば開き直す。
+
+    Returns:
+        LyricsStore: ストア（ファイルがなければNone）
+    """
+    try:
+        data_stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    try:
+        index_mtime = os.stat(index_path_for(path)).st_mtime_ns
+    except FileNotFoundError:
+        index_mtime = None
+    version = (data_stat.st_size, data_stat.st_mtime_ns, index_mtime)
+    with _stores_lock:
+        cached = _stores.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        store = LyricsStore(path)
+        # 古いストアは他のスレッドが読み込み中かもしれないので閉じずにGCに任せる
+        _stores[path] = (version, store)
+        return store
@@ -0,0 +1,339 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# 所要時間のヒストグラムのバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prometheus形式で出力するときのメトリクス名の接頭辞
+METRIC_PREFIX = "uta_net_"
+
+# ログの形式。"text"（メッセージのみ。従来のprintと同じ表示）または "json"（1行1イベント）
+# 環境変数UTA_NET_LOG_FORMATで上書きできる
+LOG_FORMAT = os.getenv("UTA_NET_LOG_FORMAT", "text")
+
+logger = logging.getLogger("uta_net")
+
+# スレッドID → 実行中の計測区間のステージ名のスタック（profilingのサンプラーが参照する）
+_active_stages = {}
+
+
+def active_stage(thread_id):
+    """スレッドで実行中の一番内側の計測区間のステージ名（なければNone）"""
+    stack = _active_stages.get(thread_id)
+    return stack[-1] if stack else None
+
+
+class Histogram:
+    """固定バケットのヒストグラム（分位数はバケット内の線形補間で推定する）"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # 各バケット（上限以下）の件数。最後は+Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """q（0〜1）分位数の推定値（観測がなければNone）"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if count and seen + count >= rank:
+                lower = max(lower, self.min)
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsRegistry:
+    """
+    カウンターとヒストグラムを集計するレジストリ（スレッドセーフ）
+
+    パイプラインの各ステージ（一覧の取得、楽曲の取得、解析、書き込み、Notionのクエリ・作成など）は
+    span()またはrecord_stage()で計測し、stage_duration_seconds / stage_items_total /
+    stage_errors_total にステージ名のラベル付きで記録する。
+    snapshot()でJSON向けの集計、to_prometheus()でPrometheusのテキスト形式を返す。
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets (tuple): ヒストグラムのバケットの上限（秒）
+        """
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._started_at = time.time()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self._started_at = time.time()
+
+    def inc(self, name, value=1, **labels):
+        """カウンターnameにvalueを加える"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """ヒストグラムnameに値を1件記録する"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def record_stage(self, stage, seconds, error=False, items=1, **labels):
+        """
+        ステージの処理1回分を記録する（別プロセスで計測した時間を反映する場合など）
+
+        Args:
+            stage (str): ステージ名
+            seconds (float): 所要時間
+            error (bool): 失敗したかどうか
+            items (int): 処理した件数（書き込みのバッチなど）
+        """
+        self.observe("stage_duration_seconds", seconds, stage=stage, **labels)
+        self.inc("stage_items_total", items, stage=stage, **labels)
+        if error:
+            self.inc("stage_errors_total", 1, stage=stage, **labels)
+
+    @contextmanager
+    def span(self, stage, items=1, **labels):
+        """
+        withで囲んだ処理をステージstageとして計測する（例外は記録してそのまま送出する）
+
+        DEBUGレベルのログが有効なら、区間ごとに "span" イベントを出力する。
+        """
+        stages = _active_stages.setdefault(threading.get_ident(), [])
+        stages.append(stage)
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            stages.pop()
+            self.record_stage(stage, elapsed, error=error is not None, items=items, **labels)
+            if logger.isEnabledFor(logging.DEBUG):
+                log_event("span", f"{stage}: {elapsed * 1000:.1f}ms", level=logging.DEBUG, stage=stage,
+                          seconds=elapsed, error=repr(error) if error is not None else None, **labels)
+
+    def snapshot(self):
+        """
+        現在の集計を返す
+
+        Returns:
+            dict: {"started_at", "elapsed",
+                   "stages": {ステージ名: {"count", "items", "errors", "seconds", "p50", "p99", ...}},
+                   "counters": {名前: [{"labels": {...}, "value": 値}]},
+                   "histograms": {名前: [{"labels": {...}, "count", "sum", "p50", "p99", ...}]}}
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: histogram.summary() for key, histogram in self._histograms.items()}
+            started_at = self._started_at
+
+        result = {"started_at": started_at, "elapsed": time.time() - started_at,
+                  "stages": {}, "counters": {}, "histograms": {}}
+        for (name, key), value in sorted(counters.items()):
+            result["counters"].setdefault(name, []).append({"labels": dict(key), "value": value})
+        for (name, key), summary in sorted(histograms.items()):
+            result["histograms"].setdefault(name, []).append(dict({"labels": dict(key)}, **summary))
+
+        # ステージ名ごとに他のラベルをまとめた集計
+        for (name, key), summary in sorted(histograms.items()):
+            if name != "stage_duration_seconds":
+                continue
+            stage = dict(key).get("stage")
+            entry = result["stages"].setdefault(stage, {"count": 0, "items": 0, "errors": 0, "seconds": 0.0,
+                                                       "p50": summary["p50"], "p99": summary["p99"],
+                                                       "max": summary["max"]})
+            entry["count"] += summary["count"]
+            entry["seconds"] += summary["sum"]
+            entry["max"] = max(entry["max"], summary["max"])
+        for (name, key), value in counters.items():
+            stage = dict(key).get("stage")
+            if stage in result["stages"] and name in ("stage_items_total", "stage_errors_total"):
+                result["stages"][stage]["items" if name == "stage_items_total" else "errors"] += value
+        return result
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=indent)
+
+    def to_prometheus(self):
+        """Prometheusのテキスト形式（exposition format）で返す"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, list(histogram.counts), histogram.count, histogram.sum)
+                for key, histogram in self._histograms.items()
+            )
+        lines = []
+        typed = set()
+        for (name, key), value in counters:
+            metric = METRIC_PREFIX + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_format_labels(key)} {value}")
+        for (name, key), counts, count, total in histograms:
+            metric = METRIC_PREFIX + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (None,), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound is None else f"{bound:g}"
+                lines.append(f"{metric}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(key)} {total}")
+            lines.append(f"{metric}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """集計をファイルに書き出す（拡張子が .prom / .txt ならPrometheus形式、それ以外はJSON）"""
+        content = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json() + "\n"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def format_summary(self):
+        """ステージごとの集計を表示用の文字列にする"""
+        stages = self.snapshot()["stages"]
+        if not stages:
+            return "計測結果はありません。"
+        lines = ["ステージ別の所要時間:"]
+        for stage, entry in sorted(stages.items(), key=lambda item: -item[1]["seconds"]):
+            p50 = f"{entry['p50'] * 1000:.0f}ms" if entry["p50"] is not None else "-"
+            p99 = f"{entry['p99'] * 1000:.0f}ms" if entry["p99"] is not None else "-"
+            lines.append(
+                f"  {stage:>16}: {entry['count']}回 ({entry['items']}件, エラー {entry['errors']}件), "
+                f"合計 {entry['seconds']:.1f}秒, p50 {p50}, p99 {p99}"
+            )
+        return "\n".join(lines)
+
+
+class JsonLogFormatter(logging.Formatter):
+    """1行1イベントのJSONでログを出力する（log_event()のeventとフィールドを含める）"""
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": getattr(record, "event", None),
+            "message": record.getMessage(),
+        }
+        data.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _StdoutHandler(logging.StreamHandler):
+    # ノートブックやredirect_stdoutでsys.stdoutが差し替えられても、その時点の出力先に書く
+    def emit(self, record):
+        self.stream = sys.stdout
+        super().emit(record)
+
+
+_handler = None
+
+
+def configure_logging(fmt=None, level=logging.INFO, stream=None):
+    """
+    "uta_net" ロガーの出力形式を設定する
+
+    Args:
+        fmt (str): "text"（メッセージのみ）または "json"（省略時はLOG_FORMAT）
+        level (int): 出力する最低レベル
+        stream: 出力先（省略時はその時点のsys.stdout）
+    """
+    global _handler, LOG_FORMAT
+    fmt = fmt or LOG_FORMAT
+    if fmt not in ("text", "json"):
+        raise ValueError(f"未対応のログ形式です: {fmt}")
+    LOG_FORMAT = fmt
+    if _handler is not None:
+        logger.removeHandler(_handler)
+    _handler = logging.StreamHandler(stream) if stream is not None else _StdoutHandler()
+    _handler.setFormatter(JsonLogFormatter() if fmt == "json" else logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def log_event(event, message, level=logging.INFO, **fields):
+    """
+    構造化ログを1件出力する
+
+    Args:
+        event (str): イベント名（"song_failed" など。JSON形式のときに集計に使う）
+        message (str): 表示用のメッセージ（text形式ではこれだけを出力する）
+        level (int): ログレベル
+        **fields: JSON形式のときに出力する追加の項目
+    """
+    if _handler is None and not logger.handlers:
+        # 設定前に呼ばれた場合も、従来のprintと同じくメッセージを表示する
+        configure_logging()
+    logger.log(level, message, extra={"event": event, "fields": fields})
@@ -0,0 +1,233 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from search_index import normalize_text
+
+# 歌詞を比べる単位（連続するこの文字数の部分文字列の集合のJaccard係数で似ているかを測る）
+SHINGLE_SIZE = 5
+
+# MinHashの署名の長さ（ハッシュ関数の数）
+NUM_PERM = 128
+
+# LSHのバンド数。1バンドはNUM_PERM / LSH_BANDS行で、類似度がおよそ (1/バンド数)^(1/行数)
+# （16バンド×8行なら約0.71）を超える組が同じバケットに入りやすくなる
+LSH_BANDS = 16
+
+# 署名から推定したJaccard係数がこの値以上なら同じ歌詞の別バージョンとみなす
+SIMILARITY_THRESHOLD = 0.8
+
+# これより短い歌詞（インストゥルメンタルなど）は比べない
+MIN_TEXT_CHARS = 30
+
+# MinHashのハッシュ関数（(a * x + b) mod 2^64 の上位32ビット）の係数（aは奇数）。
+# ファイルをまたいで署名を比べられるよう係数は固定の乱数にする
+_random = np.random.RandomState(1)
+_PERM_A = _random.randint(0, 1 << 63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_PERM_B = _random.randint(0, 1 << 63, size=NUM_PERM, dtype=np.uint64)
+# 部分文字列の各位置の文字（コードポイント）に掛ける係数と、最後に上位32ビットを取り出す前に掛ける奇数
+_SHINGLE_WEIGHTS = _random.randint(1, 1 << 62, size=SHINGLE_SIZE, dtype=np.uint64) | np.uint64(1)
+_SHINGLE_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def near_duplicate_path_for(csv_filepath):
+    """歌詞CSVと同じ名前の重複検出用DBのパス（lyrics_data_134.csv → lyrics_data_134.dupes.sqlite3）"""
+    root, _ = os.path.splitext(csv_filepath)
+    return root + ".dupes.sqlite3"
+
+
+def lyrics_shingles(lyrics):
+    """
+    歌詞を正規化（空白・改行は無視）し、SHINGLE_SIZE文字の部分文字列をそれぞれ32ビットのハッシュにする
+
+    部分文字列を作らず、コードポイントの配列に位置ごとの係数を掛けて足し合わせる（numpyで一括計算）。
+
+    Returns:
+        numpy.ndarray: 重複を除いたハッシュ（uint64、値は32ビット未満）。短すぎる歌詞は空
+    """
+    text = normalize_text(lyrics).replace(" ", "")
+    if len(text) < MIN_TEXT_CHARS:
+        return np.empty(0, dtype=np.uint64)
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype="<u4").astype(np.uint64)
+    count = len(codes) - SHINGLE_SIZE + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    # uint64の乗算・加算は2^64で折り返す（その分も含めてハッシュとして使う）
+    for position, weight in enumerate(_SHINGLE_WEIGHTS):
+        hashes += codes[position:position + count] * weight
+    return np.unique((hashes * _SHINGLE_MIX) >> np.uint64(32))
+
+
+def minhash_signature(shingles):
+    """
+    部分文字列のハッシュからMinHash署名を計算する
+
+    NUM_PERM個のハッシュ関数それぞれの最小値を取る（剰余を使わない乗算とシフトだけのハッシュ）。
+
+    Args:
+        shingles (numpy.ndarray): lyrics_shinglesのハッシュ
+
+    Returns:
+        numpy.ndarray: NUM_PERM個のuint32
+    """
+    values = shingles[:, np.newaxis] * _PERM_A + _PERM_B
+    return (values.min(axis=0) >> np.uint64(32)).astype(np.uint32)
+
+
+def band_keys(signature):
+    """署名をLSH_BANDSに分け、バンドごとのバケットのキー（56ビットの整数）を返す"""
+    rows = len(signature) // LSH_BANDS
+    data = signature.astype("<u4").tobytes()
+    return [
+        int.from_bytes(hashlib.blake2b(data[band * rows * 4:(band + 1) * rows * 4], digest_size=7).digest(), "little")
+        for band in range(LSH_BANDS)
+    ]
+
+
+def estimate_similarity(signature, other):
+    """2つの署名の一致する割合（Jaccard係数の推定値）"""
+    return float(np.count_nonzero(signature == other)) / len(signature)
+
+
+class NearDuplicateIndex:
+    """
+    歌詞がほぼ同じ曲（カバー・再録・別バージョン）をまとめるMinHash/LSHの索引（SQLite）
+
+    曲を追加するたびに署名をLSH_BANDS個のバケットに登録し、同じバケットに入っている曲だけを
+    候補として署名を比べるので、全組み合わせを比べずに済む（1曲あたりバンド数回の索引検索）。
+    類似度がSIMILARITY_THRESHOLD以上の曲は同じクラスタにまとめ、クラスタの代表は
+    最も小さいsong_id（cluster_id）とする。
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): データベースファイルのパス
+        """
+        self.path = path
+        # 署名を比べた候補の延べ数（全組み合わせとの比較用）
+        self.compared = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                song_id INTEGER PRIMARY KEY,
+                cluster_id INTEGER NOT NULL,
+                title TEXT,
+                artist TEXT,
+                signature BLOB
+            );
+            CREATE INDEX IF NOT EXISTS docs_cluster_id ON docs (cluster_id);
+            CREATE TABLE IF NOT EXISTS buckets (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                song_id INTEGER NOT NULL,
+                PRIMARY KEY (band, bucket, song_id)
+            ) WITHOUT ROWID;
+            """
+        )
+        self._conn.commit()
+
+    def add(self, song_data, commit=True):
+        """
+        1曲を追加し、似ている曲があれば同じクラスタにまとめる（追加済みの曲は追加しない）
+
+        Args:
+            song_data (dict): song_id, lyrics, title, artistを持つ楽曲データ
+            commit (bool): すぐにコミットするか（まとめて追加するときはFalseにしてcommit()を呼ぶ）
+
+        Returns:
+            int: この曲のクラスタの代表のsong_id（追加しなかった場合はNone）
+        """
+        song_id = int(str(song_data["song_id"]).strip())
+        shingles = lyrics_shingles(song_data.get("lyrics"))
+        signature = minhash_signature(shingles) if len(shingles) else None
+        keys = band_keys(signature) if signature is not None else []
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM docs WHERE song_id = ?", (song_id,)).fetchone():
+                return None
+
+            # 同じバケットに入っている曲だけを候補にして署名を比べる
+            candidates = set()
+            for band, key in enumerate(keys):
+                candidates.update(row[0] for row in self._conn.execute(
+                    "SELECT song_id FROM buckets WHERE band = ? AND bucket = ?", (band, key)))
+            matched_clusters = set()
+            self.compared += len(candidates)
+            for candidate in candidates:
+                cluster_id, data = self._conn.execute(
+                    "SELECT cluster_id, signature FROM docs WHERE song_id = ?", (candidate,)).fetchone()
+                if estimate_similarity(signature, np.frombuffer(data, dtype="<u4")) >= SIMILARITY_THRESHOLD:
+                    matched_clusters.add(cluster_id)
+
+            cluster_id = min(matched_clusters | {song_id})
+            merged = matched_clusters - {cluster_id}
+            if merged:
+                self._conn.execute(
+                    f"UPDATE docs SET cluster_id = ? WHERE cluster_id IN ({','.join('?' * len(merged))})",
+                    [cluster_id, *merged],
+                )
+            self._conn.execute(
+                "INSERT INTO docs (song_id, cluster_id, title, artist, signature) VALUES (?, ?, ?, ?, ?)",
+                (song_id, cluster_id, song_data.get("title") or "", song_data.get("artist") or "",
+                 signature.astype("<u4").tobytes() if signature is not None else None),
+            )
+            self._conn.executemany(
+                "INSERT INTO buckets (band, bucket, song_id) VALUES (?, ?, ?)",
+                [(band, key, song_id) for band, key in enumerate(keys)],
+            )
+            if commit:
+                self._conn.commit()
+        return cluster_id
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        if self._conn is None:
+            return
+        self.commit()
+        self._conn.close()
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def song_ids(self):
+        """追加済みのsong_idの集合"""
+        with self._lock:
+            return {str(row[0]) for row in self._conn.execute("SELECT song_id FROM docs")}
+
+    def clusters(self):
+        """
+        2曲以上のクラスタ
+
+        Returns:
+            dict: {代表のsong_id: [{"song_id", "title", "artist"}, ...（代表を含むsong_id順）]}
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT cluster_id, song_id, title, artist FROM docs
+                WHERE cluster_id IN (SELECT cluster_id FROM docs GROUP BY cluster_id HAVING COUNT(*) > 1)
+                ORDER BY cluster_id, song_id
+                """
+            ).fetchall()
+        clusters = {}
+        for cluster_id, song_id, title, artist in rows:
+            clusters.setdefault(str(cluster_id), []).append(
+                {"song_id": str(song_id), "title": title, "artist": artist}
+            )
+        return clusters
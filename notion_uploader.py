@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import log_event
+from throttle import TokenBucket
+
+# Notion APIの平均リクエスト数の上限（件/秒）
+NOTION_RATE_LIMIT = 3.0
+
+
+class NotionUploader:
+    """
+    共有トークンバケットでレートを制御しながら、複数ワーカーでNotionにアップロードする
+
+    1件ごとの処理はupload_func(song_data, limiter)に任せる（scripts.upload_to_notion）。
+    upload_funcはリクエストごとにlimiter.acquire()し、429を受けたら
+    limiter.pause(Retry-After)で全ワーカーを止める。
+    待ち行列はmax_workersの2倍までに制限し、入力が巨大でも一度に読み込まない。
+    """
+
+    def __init__(self, upload_func, max_workers=3, rate=NOTION_RATE_LIMIT, burst=None):
+        """
+        Args:
+            upload_func (callable): (項目, limiter) を受け取り、成功時にTrueを返す関数
+            max_workers (int): 同時に処理するワーカー数
+            rate (float): 平均リクエスト数（件/秒）
+            burst (float): 瞬間的に許可するリクエスト数（省略時はrate）
+        """
+        self.upload_func = upload_func
+        self.max_workers = max(1, max_workers)
+        self.limiter = TokenBucket(rate=rate, capacity=burst)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._queued = 0
+        self._in_flight = 0
+        self._success = 0
+        self._failed = 0
+        self._started_at = None
+
+    def stats(self):
+        """
+        現在の進捗を返す
+
+        Returns:
+            dict: success, failed, queued（待ち行列の長さ）, in_flight,
+                  throughput（完了件数/秒）, paused_for（429による停止の残り秒数）
+        """
+        with self._lock:
+            done = self._success + self._failed
+            elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+            return {
+                "success": self._success,
+                "failed": self._failed,
+                "queued": self._queued,
+                "in_flight": self._in_flight,
+                "throughput": done / elapsed if elapsed > 0 else 0.0,
+                "paused_for": self.limiter.paused_for,
+            }
+
+    def _run_one(self, item):
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+        try:
+            ok = bool(self.upload_func(item, self.limiter))
+        except Exception as e:
+            log_event("upload_failed", f"アップロード中にエラーが発生しました: {e}", level=logging.ERROR, error=str(e))
+            ok = False
+        with self._lock:
+            self._in_flight -= 1
+            if ok:
+                self._success += 1
+            else:
+                self._failed += 1
+        return ok
+
+    def run(self, records, on_progress=None):
+        """
+        全レコードをアップロードする
+
+        Args:
+            records (iterable): upload_funcに渡す項目（通常は楽曲データのdict）。ジェネレータでもよい
+            on_progress (callable): 1件完了するごとに stats() の結果を渡して呼ぶ関数
+
+        Returns:
+            dict: {"success": 成功件数, "failed": 失敗件数, "total": 処理件数}
+        """
+        with self._lock:
+            self._reset()
+            self._started_at = time.monotonic()
+        slots = threading.BoundedSemaphore(self.max_workers * 2)
+
+        def done(_future):
+            slots.release()
+            if on_progress is not None:
+                on_progress(self.stats())
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for item in records:
+                slots.acquire()
+                with self._lock:
+                    self._queued += 1
+                executor.submit(self._run_one, item).add_done_callback(done)
+
+        stats = self.stats()
+        return {"success": stats["success"], "failed": stats["failed"], "total": stats["success"] + stats["failed"]}
@@ -0,0 +1,271 @@
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# 各ステージの終了を下流に伝える印
+_DONE = object()
+# 待ち行列の出し入れで停止要求を確認する間隔（秒）
+_POLL_INTERVAL = 0.1
+
+
+def _timed_call(func, *args):
+    """funcを呼び出し、(結果, 所要秒数)を返す（プロセスプール内で処理時間を測るため）"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class StageStats:
+    """
+    パイプラインの1ステージの稼働状況
+
+    busy: 処理そのものにかかった時間の合計
+    starved: 上流からの入力を待っていた時間の合計
+    blocked: 下流の待ち行列が満杯で待たされた時間の合計（バックプレッシャー）
+    """
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items=0, errors=0, busy=0.0, starved=0.0, blocked=0.0):
+        with self._lock:
+            self.items += items
+            self.errors += errors
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+
+    def snapshot(self, elapsed):
+        """
+        Args:
+            elapsed (float): パイプライン全体の経過秒数
+
+        Returns:
+            dict: items, errors, workers, busy, starved, blocked,
+                  utilization（busy / (elapsed * workers)）
+        """
+        with self._lock:
+            capacity = elapsed * self.workers
+            return {
+                "items": self.items,
+                "errors": self.errors,
+                "workers": self.workers,
+                "busy": self.busy,
+                "starved": self.starved,
+                "blocked": self.blocked,
+                "utilization": self.busy / capacity if capacity > 0 else 0.0,
+            }
+
+
+class SongPipeline:
+    """
+    取得 → 解析 → 書き込み を分離したパイプライン
+
+    取得ステージ: fetch_workers本のスレッドがfetch_func(item)でHTMLを取得し、待ち行列に入れる
+    解析ステージ: parse_workers個のプロセス（またはスレッド）でparse_func(item, raw)を実行する
+    書き込みステージ: run()の呼び出し側がジェネレータから結果を受け取って保存する
+
+    ステージ間の待ち行列はqueue_size件までに制限するため、下流が遅ければ上流は待たされ、
+    取得済みのHTMLがメモリに溜まり続けることはない。解析はGILの外で並行に進むので、
+    取得の並列度を上げても解析がボトルネックになりにくい。
+    """
+
+    def __init__(self, fetch_func, parse_func, fetch_workers=4, parse_workers=2, queue_size=None,
+                 parse_executor="process", metrics=None):
+        """
+        Args:
+            fetch_func (callable): 項目を受け取り、生データ（HTMLなど）を返す関数
+            parse_func (callable): (項目, 生データ) を受け取り結果を返す関数。
+                プロセスプールを使う場合はpickle可能なモジュールレベルの関数であること
+            fetch_workers (int): 取得スレッド数
+            parse_workers (int): 解析ワーカー数
+            queue_size (int): ステージ間の待ち行列の上限（省略時は解析ワーカー数の4倍）
+            parse_executor (str): "process" または "thread"
+            metrics (MetricsRegistry): 指定時は解析ワーカー内の処理時間を "parse" ステージとして記録する
+        """
+        if parse_executor not in ("process", "thread"):
+            raise ValueError(f"未対応のparse_executorです: {parse_executor}")
+        self.fetch_func = fetch_func
+        self.parse_func = parse_func
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_workers = max(1, parse_workers)
+        self.queue_size = queue_size or self.parse_workers * 4
+        self.parse_executor = parse_executor
+        self.metrics = metrics
+        self._reset()
+
+    def _reset(self):
+        self._stats = {
+            "fetch": StageStats("fetch", self.fetch_workers),
+            "parse": StageStats("parse", self.parse_workers),
+            "write": StageStats("write", 1),
+        }
+        self._started_at = None
+        self._finished_at = None
+
+    def stats(self):
+        """
+        ステージごとの稼働状況を返す
+
+        Returns:
+            dict: {"elapsed": 経過秒数, "fetch": {...}, "parse": {...}, "write": {...}}
+        """
+        if self._started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._finished_at or time.monotonic()) - self._started_at
+        result = {"elapsed": elapsed}
+        for name, stage in self._stats.items():
+            result[name] = stage.snapshot(elapsed)
+        return result
+
+    def format_stats(self):
+        """stats()を表示用の文字列にする"""
+        stats = self.stats()
+        lines = [f"経過時間: {stats['elapsed']:.1f}秒"]
+        for name in ("fetch", "parse", "write"):
+            stage = stats[name]
+            lines.append(
+                f"{name:>5}: {stage['items']}件 (エラー {stage['errors']}件), ワーカー {stage['workers']}, "
+                f"稼働率 {stage['utilization']:.0%}, 処理 {stage['busy']:.1f}秒, "
+                f"入力待ち {stage['starved']:.1f}秒, 出力待ち {stage['blocked']:.1f}秒"
+            )
+        return "\n".join(lines)
+
+    def _put(self, q, value, stop, stage=None):
+        """待ち行列が空くまで待って入れる（停止要求があればFalse）。待った時間はstageのblockedに加算する"""
+        start = time.monotonic()
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=_POLL_INTERVAL)
+                if stage is not None:
+                    stage.add(blocked=time.monotonic() - start)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q, stop, stage=None):
+        """待ち行列から取り出す（停止要求があれば_DONE）。待った時間はstageのstarvedに加算する"""
+        start = time.monotonic()
+        while not stop.is_set():
+            try:
+                value = q.get(timeout=_POLL_INTERVAL)
+                if stage is not None:
+                    stage.add(starved=time.monotonic() - start)
+                return value
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def run(self, items):
+        """
+        全項目をパイプラインに流す
+
+        Args:
+            items (iterable): 処理する項目（song_idなど）。ジェネレータでもよい
+
+        Yields:
+            tuple: (項目, 結果, 例外)。成功時は例外がNone、失敗時は結果がNone。
+                   取得の完了順に返すため入力順とは一致しない
+        """
+        self._reset()
+        self._started_at = time.monotonic()
+        fetch_stats, parse_stats, write_stats = self._stats["fetch"], self._stats["parse"], self._stats["write"]
+        fetched = queue.Queue(maxsize=self.queue_size)
+        in_flight = queue.Queue(maxsize=self.parse_workers * 2)
+        parsed = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        source = iter(items)
+        source_lock = threading.Lock()
+        fetchers_left = [self.fetch_workers]
+        fetchers_lock = threading.Lock()
+
+        def fetcher():
+            try:
+                while not stop.is_set():
+                    with source_lock:
+                        item = next(source, _DONE)
+                    if item is _DONE:
+                        break
+                    start = time.monotonic()
+                    try:
+                        raw, error = self.fetch_func(item), None
+                    except Exception as e:
+                        raw, error = None, e
+                    fetch_stats.add(items=1, errors=int(error is not None), busy=time.monotonic() - start)
+                    if not self._put(fetched, (item, raw, error), stop, fetch_stats):
+                        break
+            finally:
+                with fetchers_lock:
+                    fetchers_left[0] -= 1
+                    last = fetchers_left[0] == 0
+                if last:
+                    self._put(fetched, _DONE, stop, fetch_stats)
+
+        def dispatcher(pool):
+            # 取得結果を解析プールに投入する（投入済みで未回収の件数はin_flightの大きさまで）
+            while True:
+                value = self._get(fetched, stop, parse_stats)
+                if value is _DONE:
+                    break
+                item, raw, error = value
+                future = None if error is not None else pool.submit(_timed_call, self.parse_func, item, raw)
+                # in_flightが満杯なら解析ワーカーが全て埋まっている（出力待ちではない）
+                if not self._put(in_flight, (item, future, error), stop):
+                    return
+            self._put(in_flight, _DONE, stop)
+
+        def collector():
+            # 投入順に解析結果を回収して書き込みステージに渡す
+            while True:
+                value = self._get(in_flight, stop)
+                if value is _DONE:
+                    break
+                item, future, error = value
+                result = None
+                if future is not None:
+                    try:
+                        result, elapsed = future.result()
+                        parse_stats.add(items=1, busy=elapsed)
+                        if self.metrics is not None:
+                            self.metrics.record_stage("parse", elapsed)
+                    except Exception as e:
+                        error = e
+                        parse_stats.add(items=1, errors=1)
+                        if self.metrics is not None:
+                            self.metrics.record_stage("parse", 0.0, error=True)
+                if not self._put(parsed, (item, result, error), stop, parse_stats):
+                    return
+            self._put(parsed, _DONE, stop, parse_stats)
+
+        pool_class = ProcessPoolExecutor if self.parse_executor == "process" else ThreadPoolExecutor
+        pool = pool_class(max_workers=self.parse_workers)
+        threads = [threading.Thread(target=fetcher, daemon=True) for _ in range(self.fetch_workers)]
+        threads.append(threading.Thread(target=dispatcher, args=(pool,), daemon=True))
+        threads.append(threading.Thread(target=collector, daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                value = self._get(parsed, stop, write_stats)
+                if value is _DONE:
+                    break
+                start = time.monotonic()
+                yield value
+                write_stats.add(items=1, errors=int(value[2] is not None), busy=time.monotonic() - start)
+        finally:
+            # 途中で打ち切られた場合も含め、全スレッドとプールを止める
+            stop.set()
+            for thread in threads:
+                thread.join()
+            pool.shutdown(wait=True, cancel_futures=True)
+            self._finished_at = time.monotonic()
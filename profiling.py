@@ -0,0 +1,198 @@
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from metrics import active_stage, log_event
+
+# プロファイルの出力先。Noneなら計測しない（環境変数UTA_NET_PROFILE_DIRで有効にできる）
+PROFILE_DIR = os.getenv("UTA_NET_PROFILE_DIR") or None
+
+# スタックを採取する間隔（秒）
+PROFILE_INTERVAL = 0.005
+
+# 内部のフレームを1つにまとめるライブラリ（呼び出し元のプロジェクトのコードが見えるようにする）
+FOLD_MODULES = ("bs4", "lxml", "pandas", "numpy", "requests", "urllib3", "http", "ssl", "socket",
+                "json", "csv", "sqlite3", "tqdm", "email", "html", "concurrent", "encodings")
+
+# 何もせずに待っているだけのスレッドの先端のフレーム（スレッドプールの待機中のワーカーなど）
+_IDLE_FRAMES = {("threading", "wait"), ("queue", "get"), ("threading", "_wait_for_tstate_lock"),
+                ("selectors", "select")}
+
+# このフレームを含むスレッドは計測しない（ベンチマークなどで同じプロセス内に立てたHTTPサーバー）
+_IGNORED_THREAD_FRAMES = {("socketserver", "serve_forever"), ("socketserver", "process_request_thread")}
+
+_active_lock = threading.Lock()
+_active = None
+
+
+def set_profile_dir(directory):
+    """プロファイルの出力先を設定する（Noneで無効）"""
+    global PROFILE_DIR
+    PROFILE_DIR = directory
+
+
+def _frame_module(frame):
+    return frame.f_globals.get("__name__") or "?"
+
+
+class StackSampler:
+    """
+    全スレッドのスタックを一定間隔で採取するサンプリングプロファイラ
+
+    cProfileと違いスレッドプールのワーカーも計測でき、待ち時間（レート制御やネットワーク）も
+    実時間のまま現れる。各サンプルは、そのスレッドで実行中の計測区間（metrics.span）のステージに
+    振り分ける。FOLD_MODULESのライブラリ内部のフレームは "[bs4]" のように1つにまとめる。
+    """
+
+    def __init__(self, interval=None, fold_modules=FOLD_MODULES, default_stage="other"):
+        """
+        Args:
+            interval (float): 採取間隔（秒。省略時はPROFILE_INTERVAL）
+            fold_modules (tuple): 内部のフレームをまとめるトップレベルのモジュール名
+            default_stage (str): 計測区間の外で採取したサンプルのステージ名
+        """
+        self.interval = PROFILE_INTERVAL if interval is None else interval
+        self.fold_modules = frozenset(fold_modules or ())
+        self.default_stage = default_stage
+        # (ステージ, 折りたたんだスタック) → サンプル数
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = None
+        self.elapsed = 0.0
+
+    def _collapse(self, frame):
+        """スタックを "モジュール:関数;..." の1行にする（計測しないスレッドならNone）"""
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        labels = []
+        folded = None
+        for frame in reversed(frames):
+            module = _frame_module(frame)
+            if (module, frame.f_code.co_name) in _IGNORED_THREAD_FRAMES:
+                return None
+            package = module.split(".")[0]
+            if package in self.fold_modules:
+                # ライブラリの中から呼ばれた同じライブラリのフレームは1つにまとめる
+                if folded != package:
+                    labels.append(f"[{package}]")
+                    folded = package
+                continue
+            folded = None
+            labels.append(f"{module}:{frame.f_code.co_name}")
+        return ";".join(labels)
+
+    def _is_idle(self, frame):
+        return (_frame_module(frame), frame.f_code.co_name) in _IDLE_FRAMES
+
+    def sample_once(self):
+        """全スレッドのスタックを1回採取する"""
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stage = active_stage(thread_id)
+            if stage is None and self._is_idle(frame):
+                continue
+            stack = self._collapse(frame)
+            if stack is not None:
+                self.samples[(stage or self.default_stage, stack)] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample_once()
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.elapsed = time.monotonic() - self.started_at
+
+    def stage_totals(self):
+        """ステージごとのサンプル数"""
+        totals = Counter()
+        for (stage, _), count in self.samples.items():
+            totals[stage] += count
+        return totals
+
+    def write_collapsed(self, prefix):
+        """
+        折りたたみ形式（"フレーム;フレーム;... サンプル数"）のファイルを書き出す
+
+        {prefix}.collapsed には全ステージ（先頭のフレームがステージ名）、
+        {prefix}.{ステージ}.collapsed にはステージごとのスタックを書く。
+        flamegraph.pl / speedscope / inferno などでそのまま描画できる。
+
+        Returns:
+            list: 書き出したファイルのパス
+        """
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        by_stage = {}
+        for (stage, stack), count in self.samples.items():
+            by_stage.setdefault(stage, Counter())[stack] += count
+
+        paths = [f"{prefix}.collapsed"]
+        with open(paths[0], "w", encoding="utf-8") as f:
+            for stage in sorted(by_stage):
+                for stack, count in sorted(by_stage[stage].items()):
+                    f.write(f"{stage};{stack} {count}\n")
+        for stage in sorted(by_stage):
+            path = f"{prefix}.{stage}.collapsed"
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in sorted(by_stage[stage].items()):
+                    f.write(f"{stack} {count}\n")
+            paths.append(path)
+        return paths
+
+
+def profiled(name):
+    """
+    PROFILE_DIRが設定されているときだけ、関数の実行中に全スレッドのスタックを採取するデコレータ
+
+    終了時に {PROFILE_DIR}/{name}-{日時}-{PID}.collapsed（とステージごとのファイル）を書き出す。
+    既に別の関数で採取中の場合は入れ子にせず、外側のプロファイルに含める。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            global _active
+            directory = PROFILE_DIR
+            if not directory:
+                return func(*args, **kwargs)
+            with _active_lock:
+                nested = _active is not None
+                if not nested:
+                    sampler = _active = StackSampler(default_stage=name)
+            if nested:
+                return func(*args, **kwargs)
+
+            sampler.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                sampler.stop()
+                with _active_lock:
+                    _active = None
+                prefix = os.path.join(directory, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+                paths = sampler.write_collapsed(prefix)
+                totals = sampler.stage_totals()
+                total = sum(totals.values()) or 1
+                breakdown = ", ".join(f"{stage} {count / total:.0%}" for stage, count in totals.most_common(5))
+                log_event("profile_written",
+                          f"プロファイルを{paths[0]}に書き出しました（{sampler.elapsed:.1f}秒, "
+                          f"{sum(totals.values())}サンプル: {breakdown}）。",
+                          name=name, paths=paths, seconds=sampler.elapsed, samples=dict(totals))
+        return wrapper
+    return decorator
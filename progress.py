@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+
+# 進捗表示の方式。"auto" / "notebook" / "terminal" / "plain" / "none"
+# 環境変数UTA_NET_PROGRESSで上書きできる
+PROGRESS_BACKEND = os.getenv("UTA_NET_PROGRESS", "auto")
+
+# plain方式で進捗行を出力する最短の間隔（秒）
+PLAIN_PROGRESS_INTERVAL = 10.0
+
+
+def set_progress_backend(backend):
+    """
+    進捗表示の方式を切り替える
+
+    Args:
+        backend (str): "auto"（Jupyterならnotebook、端末ならterminal、それ以外はplain）、
+            "notebook"（tqdm.notebook）、"terminal"（tqdm）、"plain"（一定間隔で1行ずつ出力）、
+            "none"（表示しない）
+    """
+    global PROGRESS_BACKEND
+    if backend not in ("auto", "notebook", "terminal", "plain", "none"):
+        raise ValueError(f"未対応の進捗表示です: {backend}")
+    PROGRESS_BACKEND = backend
+
+
+def _in_notebook():
+    # IPythonを読み込んでいないプロセスでは判定のためだけに読み込まない
+    if "IPython" not in sys.modules:
+        return False
+    try:
+        shell = sys.modules["IPython"].get_ipython()
+    except AttributeError:
+        return False
+    return shell is not None and shell.__class__.__name__ == "ZMQInteractiveShell"
+
+
+def _resolve_backend():
+    if PROGRESS_BACKEND != "auto":
+        return PROGRESS_BACKEND
+    if _in_notebook():
+        return "notebook"
+    if sys.stderr.isatty():
+        return "terminal"
+    return "plain"
+
+
+class PlainProgress:
+    """
+    端末制御を使わない進捗表示（cronやコンテナのログ向け）
+
+    tqdmのうちこのプロジェクトで使うメソッドだけを持ち、
+    interval秒ごとと終了時に「説明: 完了数/総数」を1行で出力する。
+    """
+
+    def __init__(self, iterable=None, total=None, desc=None, unit="it", interval=None, quiet=False, **kwargs):
+        self.iterable = iterable
+        if total is None and iterable is not None and hasattr(iterable, "__len__"):
+            total = len(iterable)
+        self.total = total
+        self.desc = desc or ""
+        self.unit = unit
+        self.n = 0
+        self.postfix = ""
+        self.interval = PLAIN_PROGRESS_INTERVAL if interval is None else interval
+        self.quiet = quiet
+        self._started_at = time.monotonic()
+        self._printed_at = self._started_at
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            for item in self.iterable:
+                yield item
+                self.update(1)
+        finally:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _emit(self):
+        if self.quiet:
+            return
+        elapsed = time.monotonic() - self._started_at
+        count = f"{self.n}/{self.total}" if self.total else f"{self.n}"
+        rate = self.n / elapsed if elapsed > 0 else 0.0
+        postfix = f" [{self.postfix}]" if self.postfix else ""
+        print(f"{self.desc}: {count} {self.unit} ({elapsed:.0f}秒, {rate:.2f} {self.unit}/秒){postfix}", file=sys.stderr)
+        self._printed_at = time.monotonic()
+
+    def update(self, n=1):
+        self.n += n
+        if time.monotonic() - self._printed_at >= self.interval:
+            self._emit()
+
+    def set_description(self, desc=None, refresh=True):
+        self.desc = desc or ""
+
+    def set_postfix(self, ordered_dict=None, refresh=True, **kwargs):
+        values = dict(ordered_dict or {}, **kwargs)
+        self.postfix = ", ".join(f"{key}={value}" for key, value in values.items())
+
+    def refresh(self):
+        pass
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._emit()
+
+
+def progress_bar(*args, **kwargs):
+    """
+    現在の方式の進捗バーを作る（引数はtqdmと同じ）
+
+    tqdmは方式が決まってから読み込むため、進捗を表示しないコマンドでは読み込まれない。
+    """
+    backend = _resolve_backend()
+    if backend == "notebook":
+        from tqdm.notebook import tqdm
+        return tqdm(*args, **kwargs)
+    if backend == "terminal":
+        from tqdm import tqdm
+        return tqdm(*args, **kwargs)
+    return PlainProgress(*args, quiet=(backend == "none"), **kwargs)
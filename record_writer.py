@@ -0,0 +1,231 @@
+import io
+import json
+import os
+import time
+
+
+def _journal_path(filepath):
+    return f"{filepath}.journal"
+
+
+def _checkpoint_path(filepath):
+    return f"{filepath}.ckpt"
+
+
+def _read_checkpoint(filepath):
+    try:
+        with open(_checkpoint_path(filepath), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_checkpoint(filepath, csv_bytes, journal_bytes):
+    # 一時ファイルに書いてからos.replaceで置き換える（途中で落ちても古い方か新しい方のどちらかが残る）
+    path = _checkpoint_path(filepath)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"csv_bytes": csv_bytes, "journal_bytes": journal_bytes}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_journal(filepath, offset=0):
+    """
+    ジャーナルのoffsetバイト目以降にある完全な行だけを読み込む
+
+    Returns:
+        list: レコードのリスト（書き込み途中で途切れた末尾の行は含まない）
+    """
+    try:
+        with open(_journal_path(filepath), "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except OSError:
+        return []
+    records = []
+    for line in data.split(b"\n")[:-1]:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            break
+    return records
+
+
+def _write_header(filepath, fields):
+    import pandas as pd
+
+    pd.DataFrame(columns=fields).to_csv(filepath, index=False, encoding='utf-8-sig')
+
+
+def _append_csv_rows(filepath, records, fields):
+    """レコードをCSVに追記し、追記後のファイルサイズ（バイト）を返す"""
+    import pandas as pd
+
+    buffer = io.StringIO()
+    pd.DataFrame(records, columns=fields).to_csv(buffer, header=False, index=False)
+    with open(filepath, "ab") as f:
+        f.write(buffer.getvalue().encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def recover_csv_journal(filepath, fields):
+    """
+    前回の書き込みが途中で終わっていた場合にCSVを修復する
+
+    チェックポイントより後ろに残った書きかけの行を切り詰め、ジャーナルに残っている
+    レコードをCSVに書き戻す。正常に終了していた場合は何もしない。
+
+    Args:
+        filepath (str): CSVファイルのパス
+        fields (list): CSVの列
+
+    Returns:
+        int: ジャーナルから書き戻したレコード数
+    """
+    checkpoint = _read_checkpoint(filepath)
+    if checkpoint is None:
+        return 0
+    records = _read_journal(filepath, checkpoint["journal_bytes"])
+    csv_bytes = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+    if csv_bytes > checkpoint["csv_bytes"]:
+        with open(filepath, "r+b") as f:
+            f.truncate(checkpoint["csv_bytes"])
+        csv_bytes = checkpoint["csv_bytes"]
+    if records:
+        if csv_bytes == 0:
+            _write_header(filepath, fields)
+        csv_bytes = _append_csv_rows(filepath, records, fields)
+    _write_checkpoint(filepath, csv_bytes, 0)
+    with open(_journal_path(filepath), "wb"):
+        pass
+    return len(records)
+
+
+class BufferedRecordWriter:
+    """
+    レコードをまとめてCSVに書き込むライター
+
+    write()されたレコードはメモリに溜め、batch_size件かflush_interval秒ごとに
+    1行1レコードのJSONとしてジャーナルに追記してfsyncする（ここで永続化が確定する）。
+    ジャーナルへの書き込みに失敗したバッチはバッファに戻すので、永続化できた
+    レコードはon_flushに渡されたものだけである。
+    CSVへの反映はcheckpoint_every回のフラッシュごとと終了時にまとめて行い、
+    反映後のCSVのサイズをチェックポイントファイルに原子的に記録する。
+    途中で落ちても、失われるのはフラッシュ前の1バッチ分だけで、次回の
+    recover_csv_journal()が書きかけのCSV行を切り詰めてジャーナルから書き戻す。
+    """
+
+    def __init__(self, filepath, fields, batch_size=50, flush_interval=10.0, checkpoint_every=20, on_flush=None,
+                 metrics=None):
+        """
+        Args:
+            filepath (str): CSVファイルのパス
+            fields (list): CSVの列
+            batch_size (int): この件数が溜まったらフラッシュする
+            flush_interval (float): 前回のフラッシュからこの秒数が経っていたらフラッシュする
+            checkpoint_every (int): このフラッシュ回数ごとにCSVへ反映する
+            on_flush (callable): ジャーナルに永続化したレコードのリストを受け取る関数
+            metrics (MetricsRegistry): 指定時はフラッシュを "write"、CSVへの反映を "csv_checkpoint" ステージとして記録する
+        """
+        self.filepath = filepath
+        self.fields = list(fields)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.on_flush = on_flush
+        self.metrics = metrics
+        self.written = 0
+        self._buffer = []
+        self._flushes_since_checkpoint = 0
+        self._last_flush = time.monotonic()
+
+        recover_csv_journal(filepath, self.fields)
+        if not os.path.exists(filepath) or os.path.getsize(filepath) == 0:
+            _write_header(filepath, self.fields)
+        self._csv_bytes = os.path.getsize(filepath)
+        self._journal = open(_journal_path(filepath), "ab")
+        self._journal_start = self._journal.tell()
+        _write_checkpoint(filepath, self._csv_bytes, self._journal_start)
+
+    def write(self, record):
+        """
+        レコードを1件追加する（必要ならフラッシュする）
+
+        Args:
+            record (dict): {列名: 値}
+        """
+        self._buffer.append({field: record.get(field, "") for field in self.fields})
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """溜まっているレコードをジャーナルに追記してfsyncする"""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        start = time.perf_counter()
+        data = b"".join(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n" for record in batch)
+        journal_bytes = self._journal.tell()
+        try:
+            self._journal.write(data)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        except BaseException:
+            # 永続化できなかったバッチはバッファに戻し（次のフラッシュで書き直す）、書きかけの行を取り除く
+            self._buffer[:0] = batch
+            self._rollback_journal(journal_bytes)
+            raise
+        self.written += len(batch)
+        if self.on_flush is not None:
+            self.on_flush(batch)
+        if self.metrics is not None:
+            self.metrics.record_stage("write", time.perf_counter() - start, items=len(batch))
+        self._flushes_since_checkpoint += 1
+        if self._flushes_since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def _rollback_journal(self, journal_bytes):
+        """書き込みに失敗したジャーナルをjournal_bytesバイトに切り詰めて開き直す"""
+        try:
+            self._journal.close()
+        except OSError:
+            pass  # 書き込めなかった分はclose時のフラッシュでも失敗する（ファイルは閉じられる）
+        try:
+            os.truncate(_journal_path(self.filepath), journal_bytes)
+        finally:
+            self._journal = open(_journal_path(self.filepath), "ab")
+
+    def checkpoint(self):
+        """ジャーナルに溜まったレコードをCSVに反映し、ジャーナルを空にする"""
+        self._flushes_since_checkpoint = 0
+        start = time.perf_counter()
+        records = _read_journal(self.filepath, self._journal_start)
+        if records:
+            self._csv_bytes = _append_csv_rows(self.filepath, records, self.fields)
+        # CSVのサイズとジャーナルの消化位置を記録してからジャーナルを切り詰める
+        _write_checkpoint(self.filepath, self._csv_bytes, self._journal.tell())
+        self._journal.truncate(0)
+        self._journal.seek(0)
+        self._journal_start = 0
+        _write_checkpoint(self.filepath, self._csv_bytes, 0)
+        if self.metrics is not None:
+            self.metrics.record_stage("csv_checkpoint", time.perf_counter() - start, items=len(records))
+
+    def close(self):
+        """残りをフラッシュしてCSVに反映する"""
+        if self._journal.closed:
+            return
+        self.flush()
+        self.checkpoint()
+        self._journal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,190 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+from metrics import log_event
+
+# 時間をおけば成功する可能性があるステータスコード
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """回路遮断中のホストにリクエストしようとした"""
+
+
+class RetryableStatusError(Exception):
+    """リトライしても RETRY_STATUS_CODES が返り続けた"""
+
+    def __init__(self, url, status_code, retry_after=None):
+        super().__init__(f"ステータス: {status_code} ({url})")
+        self.url = url
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _retry_after_seconds(response):
+    """Retry-Afterヘッダー（秒数の形式のみ）を返す"""
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    ホストごとのサーキットブレーカー
+
+    連続してfailure_threshold回失敗したホストは、reset_timeout秒間リクエストせずに
+    CircuitOpenErrorで即座に失敗させる。時間が経ったら1件だけ試しに通し（半開状態）、
+    成功すれば元に戻し、失敗すれば再びreset_timeout秒間遮断する。
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0):
+        """
+        Args:
+            failure_threshold (int): 遮断するまでの連続失敗回数
+            reset_timeout (float): 遮断してから試しに通すまでの秒数
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        # ホスト → [連続失敗回数, 遮断した時刻（遮断していなければNone）, 試行中か]
+        self._hosts = {}
+
+    def _state(self, host):
+        return self._hosts.setdefault(host, [0, None, False])
+
+    def check(self, url):
+        """
+        リクエストしてよいか確認する
+
+        Raises:
+            CircuitOpenError: ホストが遮断中の場合
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            state = self._state(host)
+            opened_at = state[1]
+            if opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - opened_at)
+            if remaining > 0 or state[2]:
+                raise CircuitOpenError(f"{host} への接続を一時停止しています（連続{state[0]}回失敗）")
+            # 遮断時間が過ぎたので1件だけ試す
+            state[2] = True
+
+    def record_success(self, url):
+        with self._lock:
+            self._hosts[urlparse(url).netloc] = [0, None, False]
+
+    def record_failure(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            state = self._state(host)
+            state[0] += 1
+            if state[2] or state[0] >= self.failure_threshold:
+                if state[1] is None or state[2]:
+                    log_event("circuit_opened",
+                              f"{host} で{state[0]}回続けて失敗したため、{self.reset_timeout:.0f}秒間リクエストを停止します。",
+                              level=logging.WARNING, host=host, failures=state[0], reset_timeout=self.reset_timeout)
+                state[1] = time.monotonic()
+                state[2] = False
+
+    def release(self, url):
+        """
+        試行中の印を外す（試しに通した1件が成功とも失敗とも記録されずに終わったとき）
+
+        遮断中のままなので、次のcheck()で改めて1件だけ通す。
+        """
+        with self._lock:
+            state = self._hosts.get(urlparse(url).netloc)
+            if state is not None:
+                state[2] = False
+
+    def is_open(self, url):
+        """urlのホストが遮断中かどうか"""
+        with self._lock:
+            state = self._hosts.get(urlparse(url).netloc)
+            return state is not None and state[1] is not None
+
+
+class RetryPolicy:
+    """
+    指数バックオフ + ジッターでリトライする方針
+
+    接続エラー（OSError）と RETRY_STATUS_CODES のレスポンスを最大max_attempts回まで試す。
+    待ち時間は 0〜min(max_delay, base_delay * 2**試行回数) の一様乱数（full jitter）で、
+    Retry-Afterが指定されていればそれ以上待つ。
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0, retry_statuses=RETRY_STATUS_CODES):
+        """
+        Args:
+            max_attempts (int): 最初の1回を含む最大試行回数
+            base_delay (float): バックオフの基準秒数
+            max_delay (float): 1回の待ち時間の上限（秒）
+            retry_statuses (tuple): リトライするステータスコード
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = tuple(retry_statuses)
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        attempt回目の失敗の後に待つ秒数
+
+        Args:
+            attempt (int): 失敗した回数（1から）
+            retry_after (float): サーバーが指定した待ち時間
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def call(self, func, url, breaker=None):
+        """
+        func()をリトライ付きで呼び出す
+
+        Args:
+            func (callable): 引数なしで呼び出し、status_codeを持つレスポンスを返す関数
+            url (str): リクエスト先（サーキットブレーカーのホスト判定用）
+            breaker (CircuitBreaker): ホストごとのサーキットブレーカー
+
+        Returns:
+            レスポンス（RETRY_STATUS_CODES以外。404なども呼び出し側で判定する）
+
+        Raises:
+            CircuitOpenError: ホストが遮断中の場合
+            RetryableStatusError: 最後の試行でもリトライ対象のステータスが返った場合
+            OSError: 最後の試行でも接続エラーになった場合
+        """
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.check(url)
+            try:
+                response = func()
+                if response.status_code in self.retry_statuses:
+                    raise RetryableStatusError(url, response.status_code, _retry_after_seconds(response))
+            except (OSError, RetryableStatusError) as e:
+                if breaker is not None:
+                    breaker.record_failure(url)
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    raise
+                time.sleep(self.backoff(attempt, getattr(e, "retry_after", None)))
+                continue
+            except BaseException:
+                # キャッシュの読み込みエラーや中断などホストの状態と関係のない例外。
+                # 試行中の印が残るとホストが遮断されたままになるので外しておく
+                if breaker is not None:
+                    breaker.release(url)
+                raise
+            if breaker is not None:
+                breaker.record_success(url)
+            return response
@@ -1,16 +1,43 @@
-import requests
-from bs4 import BeautifulSoup
 import time
-from tqdm.notebook import tqdm
-import pandas as pd
+from progress import progress_bar as tqdm
 import os
-import re
+import json
+import hashlib
+import contextlib
 from dotenv import load_dotenv
 from datetime import datetime, timezone
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import threading
+import functools
+import logging
+import socket
+
+from throttle import AdaptiveScheduler, HostScheduler
+from resilience import CircuitBreaker, RetryPolicy
+from http_client import HttpClient
+from http_cache import ResponseCache, cached_get
+from song_parser import SONG_FIELDS, parse_song_page
+from listing_parser import listing_key, listing_page_url, parse_listing_page, parse_listing_url
+from state_store import StateStore
+from notion_uploader import NOTION_RATE_LIMIT, NotionUploader
+from csv_stream import iter_csv_records
+from columnar_store import (convert_csv_to_parquet, count_lyrics_rows, is_parquet_path, iter_lyrics_column,
+                            iter_lyrics_records, parquet_path_for, read_lyrics_head)
+from record_writer import BufferedRecordWriter, recover_csv_journal
+from lyrics_store import LyricsStore, LyricsStoreWriter, lyrics_store_path_for, open_lyrics_store
+from search_index import SEARCH_FIELDS, SearchIndex, search_index_path_for
+from work_queue import LEASE_BATCH_SIZE, LEASE_SECONDS, SharedHostScheduler, open_work_queue
+from pipeline import SongPipeline
+from metrics import MetricsRegistry, configure_logging, log_event
+from profiling import profiled, set_profile_dir
 
 # 環境変数を読み込み
 load_dotenv()
 
+# 接続先のURL（ベンチマークなどでローカルの代替サーバーに向けるときは環境変数で上書きする）
+UTA_NET_BASE_URL = os.getenv('UTA_NET_BASE_URL', 'https://www.uta-net.com').rstrip('/')
+NOTION_API_BASE_URL = os.getenv('NOTION_API_BASE_URL', 'https://api.notion.com/v1').rstrip('/')
+
 # Notion API設定
 NOTION_TOKEN = os.getenv('NOTION_TOKEN')
 NOTION_DATABASE_ID = os.getenv('NOTION_DATABASE_ID')
@@ -21,262 +48,1338 @@ NOTION_HEADERS = {
     "Notion-Version": "2022-06-28",
 }
 
+# uta-net.comへのリクエスト速度の調整。全スレッドで共有される
+# 開始時は1秒に1件で、応答が速く成功が続けば上限まで上げ、429/5xxや遅延があれば下げる
+UTA_NET_REQUEST_INTERVAL = 1.0
+UTA_NET_MIN_RATE = 0.2          # 件/秒の下限
+UTA_NET_MAX_RATE = 3.0          # 件/秒の上限
+UTA_NET_MAX_CONCURRENCY = 4     # 同時接続数の上限（実際の並列数はmax_workersも超えない）
+uta_net_scheduler = AdaptiveScheduler(
+    initial_rate=1.0 / UTA_NET_REQUEST_INTERVAL,
+    min_rate=UTA_NET_MIN_RATE,
+    max_rate=UTA_NET_MAX_RATE,
+    max_concurrency=UTA_NET_MAX_CONCURRENCY,
+)
+
+# uta-net.comへのリクエストのリトライ（指数バックオフ + ジッター）と、連続失敗時の一時停止
+uta_net_retry_policy = RetryPolicy(max_attempts=4, base_delay=2.0, max_delay=60.0)
+uta_net_breaker = CircuitBreaker(failure_threshold=5, reset_timeout=120.0)
+
+# 楽曲ページの解析に使うバックエンド（song_parser.PARSER_BACKENDSのキー）
+SONG_PARSER_BACKEND = "lxml-native"
+
+# uta-net.com / api.notion.com への全リクエストで共有する接続プール
+http_client = HttpClient()
+
+# ステージごとの所要時間・件数・エラー数の計測（show_metrics() / metrics.write() で出力）
+metrics = MetricsRegistry()
+# ログの出力形式（環境変数UTA_NET_LOG_FORMAT=jsonで1行1イベントのJSON）
+configure_logging()
+
+# uta-net.comのレスポンスキャッシュ設定（ディレクトリをNoneにすると無効）
+UTA_NET_CACHE_DIR = '.uta_net_cache'
+UTA_NET_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# アーティストページは毎回条件付きGETで再検証し、楽曲ページは期限なしで再利用する
+LISTING_CACHE_MAX_AGE = 0
+SONG_CACHE_MAX_AGE = None
+# Trueにするとネットワークにアクセスせず、キャッシュだけから再解析する
+UTA_NET_OFFLINE = False
+
+# パイプラインの状態DB（発見・取得・アップロード状況）。Noneにすると従来どおりCSVだけで判定する
+STATE_DB_PATH = 'pipeline_state.sqlite3'
+
+# CSVからNotionへアップロードするとき一度に読み込む行数（メモリ使用量の上限を決める）
+UPLOAD_CSV_CHUNKSIZE = 1000
+
+# 歌詞CSVへの書き込みをまとめる件数と間隔（秒）。異常終了時に失われるのは最大でこの1バッチ分
+LYRICS_WRITE_BATCH_SIZE = 50
+LYRICS_WRITE_FLUSH_INTERVAL = 10.0
+
+# 歌詞CSVと並べて、song_idから歌詞だけを直接引けるストア（.lyrics と索引の .lyrics.idx）も書き込むか
+LYRICS_STORE_ENABLED = True
+
+# 歌詞CSVと並べて、歌詞・タイトル・主題歌情報の全文検索用のn-gram索引（.search.sqlite3）も作るか
+SEARCH_INDEX_ENABLED = True
+
+# 歌詞CSVと並べて、歌詞がほぼ同じ曲（カバー・再録・別バージョン）をまとめるMinHash/LSHの索引（.dupes.sqlite3）も作るか
+NEAR_DUPLICATE_ENABLED = True
+
+# upload_csv_to_notion / sync_csv_to_notionで歌詞がほぼ同じ曲をどう扱うか
+#   all       すべての曲をアップロードする
+#   canonical 各クラスタの代表（最も小さいsong_id）だけをアップロードする
+#   link      代表だけをアップロードし、他のバージョンをNOTION_VARIANTS_PROPERTYに列挙する
+NOTION_DUPLICATE_MODE = os.environ.get("NOTION_DUPLICATE_MODE", "all")
+NOTION_DUPLICATE_MODES = ("all", "canonical", "link")
+
+# linkモードで他のバージョンを書き込むNotionのプロパティ（テキスト型をデータベースに追加しておく）
+# 更新時はこのプロパティも空にしてから書き込むので、sync_csv_to_notionではモードによらず必要
+NOTION_VARIANTS_PROPERTY = "variants"
+
+# 複数のプロセス・ホストで歌詞の取得を分担する作業キューの場所（SQLiteのパスか "sqlite:///共有ボリューム/..."）
+WORK_QUEUE_PATH = os.getenv('UTA_NET_WORK_QUEUE', 'work_queue.sqlite3')
+
+# 作業キューの全ワーカー合計での、uta-net.comへのリクエスト間隔（秒）。キューに記録した送信枠を全ワーカーで共有する
+# 環境変数UTA_NET_QUEUE_REQUEST_INTERVALで上書きできる
+WORK_QUEUE_REQUEST_INTERVAL = float(os.getenv('UTA_NET_QUEUE_REQUEST_INTERVAL', UTA_NET_REQUEST_INTERVAL))
+
+# 作業キューのワーカーが、他のワーカーの貸し出し中の曲しか残っていないときに次の貸し出しを試すまでの間隔（秒）
+WORK_QUEUE_POLL_INTERVAL = 5.0
+
+# 作業キューの結果を回収するときに1回に読み込んで書き込む曲数（歌詞を含むので全件を一度に読まない）
+WORK_QUEUE_COLLECT_PAGE_SIZE = 1000
+
+# Trueにすると、歌詞の取得後に同じ名前の.parquet（列指向・辞書符号化・zstd圧縮）も書き出す（pyarrowが必要）
+LYRICS_PARQUET_EXPORT = False
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+_state_store = None
+_state_store_lock = threading.Lock()
+_search_indexes = {}
+_search_indexes_lock = threading.Lock()
+
+def get_response_cache():
+    """
+    uta-net.comのレスポンスキャッシュを返す（初回呼び出し時に作成）
+
+    Returns:
+        ResponseCache | None: UTA_NET_CACHE_DIRがNoneの場合はNone
+    """
+    global _response_cache
+    if UTA_NET_CACHE_DIR is None:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None or _response_cache.directory != UTA_NET_CACHE_DIR:
+            _response_cache = ResponseCache(UTA_NET_CACHE_DIR, max_bytes=UTA_NET_CACHE_MAX_BYTES)
+        return _response_cache
+
+def get_state_store():
+    """
+    パイプラインの状態DBを返す（初回呼び出し時に作成）
+
+    Returns:
+        StateStore | None: STATE_DB_PATHがNoneの場合はNone
+    """
+    global _state_store
+    if STATE_DB_PATH is None:
+        return None
+    with _state_store_lock:
+        if _state_store is None or _state_store.path != STATE_DB_PATH:
+            _state_store = StateStore(STATE_DB_PATH)
+        return _state_store
+
+def fetch_uta_net_page(url, max_age=None, scheduler=None):
+    """
+    uta-net.comのページをキャッシュ経由で取得する
+
+    Args:
+        url (str): ページのURL
+        max_age (float | None): キャッシュをそのまま使う期間（秒）。Noneなら期限なし
+        scheduler (AdaptiveScheduler | HostScheduler): 実際にリクエストする場合の間隔調整（省略時は共有のもの）
+
+    Returns:
+        status_codeとtextを持つレスポンス
+
+    Raises:
+        CircuitOpenError / RetryableStatusError / OSError: リトライしても取得できなかった場合
+    """
+    scheduler = scheduler or uta_net_scheduler
+
+    def before_request(request_url):
+        start = time.monotonic()
+        scheduler.wait(request_url)
+        metrics.observe("throttle_wait_seconds", time.monotonic() - start, service="uta_net")
+
+    def after_request(request_url, status_code, elapsed):
+        scheduler.record(request_url, status_code, elapsed)
+        metrics.observe("http_request_seconds", elapsed, service="uta_net")
+        metrics.inc("http_responses_total", service="uta_net", status=status_code or "error")
+
+    # リトライとサーキットブレーカーは実際のリクエストだけに掛ける（キャッシュから返すページは遮断中でも返す）
+    response = cached_get(
+        http_client,
+        get_response_cache(),
+        url,
+        max_age=max_age,
+        offline=UTA_NET_OFFLINE,
+        before_request=before_request,
+        after_request=after_request,
+        retry_policy=uta_net_retry_policy,
+        breaker=uta_net_breaker,
+    )
+    metrics.inc("uta_net_fetches_total", source="cache" if getattr(response, "from_cache", False) else "network")
+    return response
+
+def _fetch_listing_page(kind, listing_id, page, first_url=None):
+    """
+    一覧ページ（アーティスト・作詞者・作曲者・編曲者）を1ページ取得して解析する
+
+    Args:
+        kind (str): 一覧の種類
+        listing_id (str): 一覧のID
+        page (int): ページ番号
+        first_url (str): 1ページ目に使うURL（入力されたURLをそのまま使う場合）
+
+    Returns:
+        tuple: (曲IDのリスト, 最大のページ番号またはNone, クレジットのリンクの集合)。取得に失敗した場合は例外を送出
+    """
+    if page == 1 and first_url:
+        current_url = first_url
+    else:
+        current_url = listing_page_url(kind, listing_id, page, base_url=UTA_NET_BASE_URL)
+    # ページのHTMLを取得（キャッシュを再検証し、リクエスト時は間隔を空ける）
+    with metrics.span("listing_fetch"):
+        response = fetch_uta_net_page(current_url, max_age=LISTING_CACHE_MAX_AGE)
+        if response.status_code != 200:
+            raise RuntimeError(f"ステータス: {response.status_code}")
+    with metrics.span("listing_parse"):
+        return parse_listing_page(response.text, kind, listing_id)
+
+def _crawl_listing_pages(listings, max_workers=4, pbar=None):
+    """
+    複数の一覧ページの全ページを1つのスレッドプールで並列取得する
+
+    各一覧の1ページ目を取得し、ページネーションから分かったページを順次追加する
+    （ページネーションが一部しか表示されない場合も、最大ページ番号が増えた分を追加で取得する）。
+
+    Args:
+        listings (dict): {(種類, ID): 1ページ目のURLまたはNone}
+        max_workers (int): 同時に取得するスレッド数
+        pbar: 進捗バー（ページ単位で更新する）
+
+    Returns:
+        dict: {(種類, ID): {"song_ids": 曲IDのリスト, "failed_pages": 取得に失敗したページ番号のリスト,
+                            "credits": クレジットのリンクの集合, "last_page": 最大のページ番号}}
+    """
+    results = {
+        listing: {"song_ids": [], "failed_pages": [], "credits": set(), "last_page": 1} for listing in listings
+    }
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pending = {}
+
+        def submit(listing, page):
+            kind, listing_id = listing
+            future = executor.submit(_fetch_listing_page, kind, listing_id, page, listings[listing])
+            pending[future] = (listing, page)
+
+        for listing in listings:
+            submit(listing, 1)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                listing, page = pending.pop(future)
+                result = results[listing]
+                try:
+                    page_song_ids, last_page, credits = future.result()
+                except Exception as e:
+                    result["failed_pages"].append(page)
+                    if pbar is not None:
+                        pbar.set_description(f"{listing_key(*listing)} ページ{page}でエラー: {str(e)[:30]}...")
+                        pbar.update(1)
+                    continue
+                result["song_ids"].extend(page_song_ids)
+                result["credits"] |= credits
+                if pbar is not None:
+                    pbar.set_description(f"{listing_key(*listing)} ページ{page}完了 ({len(page_song_ids)}曲)")
+                    pbar.update(1)
+                # 1ページ目に曲がなければ続きのページもない
+                if page == 1 and not page_song_ids:
+                    continue
+                if last_page and last_page > result["last_page"]:
+                    for p in range(result["last_page"] + 1, last_page + 1):
+                        submit(listing, p)
+                    if pbar is not None and pbar.total is not None:
+                        pbar.total += last_page - result["last_page"]
+                        pbar.refresh()
+                    result["last_page"] = last_page
+    return results
+
 # song_idのリストを取得し、CSVに保存/読み込みする（ページネーション対応）
-def get_and_save_song_ids(artist_page_url, filepath=None):
-    # アーティストIDを抽出（URLから）
-    artist_id = artist_page_url.rstrip('/').split('/')[-1]
+# アーティストページのほか、作詞者・作曲者・編曲者のページ（/lyricist/ など）のURLも指定できる
+# incremental=True の場合は既知の曲だけのページに達した時点で巡回を打ち切る
+# 全件巡回では1ページ目のページネーションから総ページ数を読み取り、残りをmax_workers並列で取得する
+def get_and_save_song_ids(artist_page_url, filepath=None, incremental=False, max_workers=4):
+    all_song_ids, _, _ = _discover_song_ids(artist_page_url, filepath, incremental, max_workers)
+    return all_song_ids
+
+# 一覧の種類とIDを抽出（URLから）。アーティストIDは従来どおりIDそのもの、それ以外は "lyricist:1234" など
+def _parse_artist_page_url(artist_page_url):
+    try:
+        return parse_listing_url(artist_page_url)
+    except ValueError:
+        return "artist", artist_page_url.rstrip('/').split('/')[-1]
+
+# get_and_save_song_idsの本体。
+# (全song_idのリスト, 取得に失敗したページ番号のリスト, ページ内のクレジットのリンクの集合) を返す
+def _discover_song_ids(artist_page_url, filepath=None, incremental=False, max_workers=4):
+    import pandas as pd
+
+    kind, listing_id = _parse_artist_page_url(artist_page_url)
+    listing = (kind, listing_id)
+    artist_id = listing_key(kind, listing_id)
     
     # ファイルパスが指定されていない場合、アーティストIDを含むファイル名を作成
     if filepath is None:
-        filepath = f'song_ids_{artist_id}.csv'
-    
-    existing_song_ids = []
-    if os.path.exists(filepath):
-        print(f"{filepath}が見つかりました。既存のsong_idを読み込みます。")
-        df = pd.read_csv(filepath)
-        existing_song_ids = df['song_id'].astype(str).tolist()
-        print(f"既存のsong_id数: {len(existing_song_ids)}件")
-    else:
-        print(f"{filepath}が見つかりません。新規でsong_idをスクレイピングします。")
+        filepath = f'song_ids_{artist_id.replace(":", "_")}.csv'
     
-    print(f"アーティストID {artist_id} の全ページをスクレイピングして最新の曲リストを取得します。")
+    store = get_state_store()
+    if store is not None and os.path.exists(filepath) and not store.is_imported(filepath):
+        # 初回のみ既存のCSVを状態DBに取り込む
+        log_event("state_import", f"{filepath}を状態DBに取り込みます。", path=filepath)
+        store.import_song_ids_csv(filepath, artist_id=artist_id)
+
+    existing_song_id_set = set()
+    if store is not None:
+        existing_song_id_set = store.song_ids(artist_id)
+        log_event("song_ids_loaded", f"状態DBに登録済みのsong_id数: {len(existing_song_id_set)}件",
+                  source="state", songs=len(existing_song_id_set))
+    elif os.path.exists(filepath):
+        log_event("song_ids_csv_found", f"{filepath}が見つかりました。既存のsong_idを読み込みます。", path=filepath)
+        df = pd.read_csv(filepath, dtype=str, usecols=['song_id'])
+        existing_song_id_set = set(df['song_id'].dropna())
+        log_event("song_ids_loaded", f"既存のsong_id数: {len(existing_song_id_set)}件",
+                  source="csv", songs=len(existing_song_id_set))
+    else:
+        log_event("song_ids_csv_missing", f"{filepath}が見つかりません。新規でsong_idをスクレイピングします。", path=filepath)
+
+    # 既存データがなければ増分巡回はできないので全件巡回にする
+    incremental = incremental and bool(existing_song_id_set)
+    if incremental:
+        log_event("listing_crawl_started",
+                  f"{kind} ID {listing_id} の新着ページのみをスクレイピングします（既知の曲だけのページで終了）。",
+                  kind=kind, listing_id=listing_id, incremental=True)
+    else:
+        log_event("listing_crawl_started", f"{kind} ID {listing_id} の全ページをスクレイピングして最新の曲リストを取得します。",
+                  kind=kind, listing_id=listing_id, incremental=False)
     
     song_id_list = []
-    page = 1
-    max_pages = 100  # 最大ページ数の推定値（実際の処理では動的に調整）
+    # リトライしても取得できなかったページ（曲リストが不完全になる）
+    failed_pages = []
+    credits = set()
     
     # ページ処理の進行状況バー
     page_pbar = tqdm(desc="ページを取得中", unit="page")
-    
-    while True:
-        page_pbar.set_description(f"ページ{page}を取得中")
-        page_pbar.update(0)  # 表示更新
-        
-        # ページURLを構築
-        if page == 1:
-            current_url = artist_page_url
-        else:
-            # 2ページ目以降のURL構造: /artist/{artist_id}/0/{page}/
-            current_url = f"https://www.uta-net.com/artist/{artist_id}/0/{page}/"
-        
-        try:
-            # ページのHTMLを取得
-            response = requests.get(current_url)
-            if response.status_code != 200:
-                page_pbar.set_description(f"ページ{page}の取得失敗 (ステータス: {response.status_code})")
+
+    if incremental:
+        # 新着順に並んでいる前提で、新しい曲を含むページが続く限り順に取得する
+        page = 0
+        last_page = 1
+        page_song_ids = []
+        while last_page > page and not (page_song_ids and set(page_song_ids) <= existing_song_id_set):
+            page += 1
+            page_pbar.set_description(f"ページ{page}を取得中")
+            try:
+                page_song_ids, page_last, page_credits = _fetch_listing_page(kind, listing_id, page, artist_page_url)
+            except Exception as e:
+                page_pbar.set_description(f"ページ{page}でエラー: {str(e)[:30]}...")
+                failed_pages.append(page)
                 break
-                
-            page_html = response.text
-            time.sleep(1)  # サーバー負荷軽減
-            
-            # BeautifulSoupで解析
-            soup = BeautifulSoup(page_html, "html.parser")
-            
-            # このページの曲リンクを取得
-            page_song_links = soup.find_all("a", class_="py-2 py-lg-0")
-            
-            if not page_song_links:
+            if not page_song_ids:
                 page_pbar.set_description(f"ページ{page}に曲が見つかりません")
                 break
-            
-            # 曲のIDを抽出（このページ用の進行状況バー）
-            page_song_count = 0
-            for song_link in tqdm(page_song_links, desc=f"ページ{page}の曲を処理中", leave=False):
-                href = song_link.get("href")
-                if href and "/song/" in href:
-                    try:
-                        song_id = href.split("/")[-2]
-                        song_id_list.append(song_id)
-                        page_song_count += 1
-                    except IndexError:
-                        continue  # エラーは静かに処理
-            
-            page_pbar.set_description(f"ページ{page}完了 ({page_song_count}曲)")
+            song_id_list.extend(page_song_ids)
+            credits |= page_credits
+            page_pbar.set_description(f"ページ{page}完了 ({len(page_song_ids)}曲)")
             page_pbar.update(1)
-            
-            # 次のページが存在するかチェック
-            next_page_exists = False
-            
-            # ページネーションのリンクをチェック
-            pagination_links = soup.find_all("a", class_="page-link")
-            for link in pagination_links:
-                href = link.get("href")
-                if href and f"/artist/{artist_id}/0/{page + 1}/" in href:
-                    next_page_exists = True
-                    break
-            
-            # または、現在のページに曲数が多い場合は次のページが存在する可能性が高い
-            if page_song_count >= 20:
-                next_page_exists = True
-            
-            if not next_page_exists:
-                page_pbar.set_description(f"全{page}ページ完了")
-                break
-                
-            page += 1
-            
-        except Exception as e:
-            page_pbar.set_description(f"ページ{page}でエラー: {str(e)[:30]}...")
-            break
+            last_page = max(last_page, page_last or 0)
+        page_pbar.set_description(f"{page}ページで巡回を終了")
+
+    else:
+        # 判明しているページをまとめて並列取得する
+        page_pbar.total = 1
+        result = _crawl_listing_pages({listing: artist_page_url}, max_workers=max_workers, pbar=page_pbar)[listing]
+        song_id_list = result["song_ids"]
+        failed_pages = result["failed_pages"]
+        credits = result["credits"]
+        if song_id_list:
+            page_pbar.set_description(f"全{result['last_page']}ページ完了")
     
     page_pbar.close()
+    if failed_pages:
+        log_event("listing_pages_failed",
+                  f"警告: {len(failed_pages)}ページの取得に失敗しました（ページ {', '.join(map(str, sorted(failed_pages)))}）。"
+                  "見つかった曲だけを既存のリストに追加します。曲リストが不完全な可能性があるため、後でもう一度実行してください。",
+                  level=logging.WARNING, listing=artist_id, pages=sorted(failed_pages))
     
     # 重複を除去してソート
-    song_id_list = sorted(list(set(song_id_list)))
-    print(f"スクレイピングで取得した総曲数: {len(song_id_list)}件")
+    song_id_list = sorted(set(song_id_list))
+    log_event("song_ids_scraped", f"スクレイピングで取得した総曲数: {len(song_id_list)}件", songs=len(song_id_list))
     
     # 新しいsong_idを特定
-    new_song_ids = [sid for sid in song_id_list if sid not in existing_song_ids]
+    new_song_ids = [sid for sid in song_id_list if sid not in existing_song_id_set]
     
+    # 最終的な全song_idのリスト（既存 + 新規）
+    all_song_ids = sorted(existing_song_id_set.union(song_id_list))
+
     if new_song_ids:
-        print(f"新しいsong_idが{len(new_song_ids)}件見つかりました。CSVに追加保存します。")
-        
+        log_event("song_ids_new", f"新しいsong_idが{len(new_song_ids)}件見つかりました。CSVに追加保存します。",
+                  new=len(new_song_ids))
+        if store is not None:
+            store.add_discovered(new_song_ids, artist_id=artist_id)
+    else:
+        log_event("song_ids_new", "新しいsong_idは見つかりませんでした。", new=0)
+
+    if new_song_ids or not os.path.exists(filepath):
         # 全てのsong_idをCSVに保存（既存 + 新規）
-        all_song_ids = sorted(list(set(existing_song_ids + song_id_list)))
         df = pd.DataFrame({'song_id': all_song_ids})
         df.to_csv(filepath, index=False)
-        print(f"{filepath}に合計{len(all_song_ids)}件のsong_idを保存しました。")
-    else:
-        print("新しいsong_idは見つかりませんでした。")
+        if store is not None:
+            store.mark_imported(filepath)
+        log_event("song_ids_saved", f"{filepath}に合計{len(all_song_ids)}件のsong_idを保存しました。",
+                  path=filepath, songs=len(all_song_ids))
     
-    # 最終的な全song_idのリストを返す
-    final_song_ids = sorted(list(set(existing_song_ids + song_id_list)))
-    return final_song_ids
+    return all_song_ids, failed_pages, credits
 
 # 歌詞をスクレイピングしてCSVに保存する
-def scrape_and_save_lyrics(song_id_list, filepath=None, artist_id=None):
-    
+# max_workers > 1 の場合はスレッドプールで並行取得する（間隔はrequest_intervalで制御）
+# parse_workers > 0 の場合は取得（max_workersスレッド）と解析（parse_workersプロセス）を分離したパイプラインで処理する
+# 戻り値は今回取得できた曲数と失敗した曲数 {"scraped": n, "failed": n}
+# profiling.PROFILE_DIR（環境変数UTA_NET_PROFILE_DIR / set_profile_dir()）を設定すると実行中のスタックを採取する
+@profiled("scrape_and_save_lyrics")
+def scrape_and_save_lyrics(song_id_list, filepath=None, artist_id=None, max_workers=1, request_interval=None,
+                           parse_workers=0, parquet=None, details_source=None):
+    """
+    楽曲の詳細情報と歌詞を取得し、CSVに追記する
+
+    CSVは途中で止まっても再開できる追記用の出力として常に書き込む。parquet（省略時は
+    LYRICS_PARQUET_EXPORT）がTrueなら、終了後にCSV全体を同じ名前の.parquetに書き出し直す。
+    details_sourceを渡すと、取得の代わりにdetails_source(未取得のsong_idのリスト)が返す
+    (song_id, song_data, error) を書き込む（作業キューのワーカーが取得した結果の回収に使う）。
+
+    Returns:
+        dict: {"scraped": 書き込んだ曲数, "failed": 取得に失敗した曲数,
+               "saved": song_id_listのうちCSVに保存済みのsong_idのリスト（以前から保存済みの曲を含む）,
+               "write_failed": 取得できたがジャーナルに永続化できなかったsong_idのリスト}
+    """
+    import pandas as pd
+
+    if parquet is None:
+        parquet = LYRICS_PARQUET_EXPORT
+
     # ファイルパスが指定されていない場合、アーティストIDを含むファイル名を作成
     if filepath is None:
         if artist_id:
             filepath = f'lyrics_data_{artist_id}.csv'
         else:
             filepath = 'lyrics_data.csv'
-    
-    # 既に取得済みのsong_idを読み込む
-    processed_ids = []
-    if os.path.exists(filepath):
+    elif is_parquet_path(filepath):
+        # Parquetは追記できないので、同じ名前のCSVに書き込んでから書き出す
+        filepath = os.path.splitext(filepath)[0] + '.csv'
+        parquet = True
+
+    # 前回が途中で終わっていた場合は、書きかけの行を捨ててジャーナルから書き戻す
+    recovered = recover_csv_journal(filepath, SONG_FIELDS)
+    if recovered:
+        log_event("journal_recovered", f"前回の書き込みジャーナルから{recovered}件を{filepath}に書き戻しました。",
+                  level=logging.WARNING, path=filepath, records=recovered)
+    
+    # このCSVに書き込み済みのsong_idを調べる（他のCSVに書き込んだ曲は改めて取得する）
+    store = get_state_store()
+    processed_ids = set()
+    if store is not None:
+        if not os.path.exists(filepath) or os.path.getsize(filepath) == 0:
+            # CSVが無くなっていれば、以前に書き込んだ記録も消す
+            store.reset_file(filepath)
+        elif not store.is_imported(filepath):
+            # 初回のみ既存のCSVを状態DBに取り込む
+            log_event("state_import", f"{filepath}を状態DBに取り込みます。", path=filepath)
+            store.import_lyrics_csv(filepath, artist_id=artist_id)
+        processed_ids = store.scraped_ids(song_id_list, path=filepath)
+    elif os.path.exists(filepath):
         try:
-            processed_df = pd.read_csv(filepath)
-            if 'song_id' in processed_df.columns:
-                processed_ids = processed_df['song_id'].astype(str).tolist()
-        except (pd.errors.EmptyDataError, FileNotFoundError):
-            print(f"{filepath}は空か、見つかりませんでした。")
+            processed_df = pd.read_csv(filepath, dtype=str, usecols=['song_id'])
+            processed_ids = set(processed_df['song_id'].dropna())
+        except (pd.errors.EmptyDataError, FileNotFoundError, ValueError):
+            log_event("lyrics_csv_empty", f"{filepath}は空か、見つかりませんでした。", path=filepath)
 
+    # 歌詞ストアが無いか、前回が異常終了していた場合はCSVにある曲をストアに補う
+    lyrics_store = None
+    if LYRICS_STORE_ENABLED:
+        lyrics_store = _open_lyrics_store_writer(filepath, reconcile=bool(recovered))
+    search_index = None
+    if SEARCH_INDEX_ENABLED:
+        search_index = _open_search_index_writer(filepath)
+    near_duplicates = None
+    if NEAR_DUPLICATE_ENABLED:
+        near_duplicates = _open_near_duplicate_writer(filepath, reconcile=bool(recovered))
 
     # これから処理するsong_idのリスト
     target_ids = [sid for sid in song_id_list if str(sid) not in processed_ids]
 
     if not target_ids:
-        print("すべての曲の歌詞を取得済みです。")
-        return
+        log_event("scrape_skipped", "すべての曲の歌詞を取得済みです。", path=filepath, songs=len(song_id_list))
+        if lyrics_store is not None:
+            lyrics_store.close()
+        if search_index is not None:
+            search_index.close()
+        if near_duplicates is not None:
+            near_duplicates.close()
+        if parquet:
+            export_lyrics_parquet(filepath, only_if_stale=True)
+        return {"scraped": 0, "failed": 0, "saved": list(song_id_list), "write_failed": []}
 
-    print(f"合計{len(song_id_list)}曲のうち、{len(target_ids)}件の新しい曲の歌詞を取得します。")
+    log_event("scrape_started", f"合計{len(song_id_list)}曲のうち、{len(target_ids)}件の新しい曲の歌詞を取得します。",
+              path=filepath, songs=len(song_id_list), targets=len(target_ids))
 
-    # ヘッダーの書き込み（ファイルが空か、存在しない場合）
-    if not os.path.exists(filepath) or os.path.getsize(filepath) == 0:
-        pd.DataFrame(columns=['song_id', 'title', 'artist', 'main_theme', 'lyricist', 'composer', 'arranger', 'release_date', 'cover_url', 'lyrics']).to_csv(filepath, index=False, encoding='utf-8-sig')
+    # リクエスト間隔が指定された場合は自動調整せず、その間隔に固定したスケジューラを使う
+    scheduler = uta_net_scheduler if request_interval is None else HostScheduler(min_interval=request_interval)
 
-    # 曲の詳細情報と歌詞を取得してCSVに追記
-    for song_id in tqdm(target_ids, desc="楽曲情報を取得中"):
-        try:
-            song_data = get_song_details_and_lyrics(song_id)
-            
-            # データをDataFrameにしてCSVに追記
-            new_data = pd.DataFrame([song_data])
-            new_data.to_csv(filepath, mode='a', header=False, index=False, encoding='utf-8-sig')
+    # ジャーナルに永続化できたsong_id（ライターがon_flushに渡したものだけ）
+    written_ids = set()
 
-        except Exception as e:
-            print(f"song_id: {song_id} の処理中にエラーが発生しました: {e}")
-            # エラーログなどをここに記述可能
+    def on_flush(batch):
+        # ジャーナルに永続化できたバッチだけを状態DBに反映する
+        written_ids.update(str(song_data['song_id']) for song_data in batch)
+        if lyrics_store is not None:
+            for song_data in batch:
+                lyrics_store.append(song_data['song_id'], song_data.get('lyrics'))
+            lyrics_store.flush()
+        if search_index is not None:
+            for song_data in batch:
+                search_index.add(song_data)
+        if near_duplicates is not None:
+            for song_data in batch:
+                near_duplicates.add(song_data, commit=False)
+            near_duplicates.commit()
+        if store is not None:
+            for song_data in batch:
+                store.mark_scraped(song_data, artist_id=artist_id, commit=False, path=filepath)
+            store.commit()
+
+    # 曲の詳細情報と歌詞を取得してCSVに追記（書き込みはこのスレッドのみで行う）
+    # ヘッダーはファイルが空か、存在しない場合にライターが書き込む
+    writer = BufferedRecordWriter(
+        filepath,
+        SONG_FIELDS,
+        batch_size=LYRICS_WRITE_BATCH_SIZE,
+        flush_interval=LYRICS_WRITE_FLUSH_INTERVAL,
+        on_flush=on_flush,
+        metrics=metrics,
+    )
+    pipeline = None
+    if parse_workers > 0 and details_source is None:
+        pipeline = SongPipeline(
+            lambda song_id: _fetch_song_page(song_id, scheduler=scheduler),
+            functools.partial(parse_song_page, backend=SONG_PARSER_BACKEND),
+            fetch_workers=max_workers,
+            parse_workers=parse_workers,
+            metrics=metrics,
+        )
+    failed_count = 0
+    write_attempted = []
+    # withは逆順に閉じるので、ライターが残りのバッチを書き出してから歌詞ストアの索引を書く
+    with contextlib.ExitStack() as cleanup, writer:
+        if lyrics_store is not None:
+            cleanup.callback(lyrics_store.close)
+        if search_index is not None:
+            cleanup.callback(search_index.close)
+        if near_duplicates is not None:
+            cleanup.callback(near_duplicates.close)
+        if details_source is not None:
+            results = details_source(target_ids)
+        elif pipeline is not None:
+            results = pipeline.run(target_ids)
+        else:
+            results = _iter_song_details(target_ids, max_workers=max_workers, scheduler=scheduler)
+        for song_id, song_data, error in tqdm(results, total=len(target_ids), desc="楽曲情報を取得中"):
+            if error is not None:
+                log_event("song_failed", f"song_id: {song_id} の処理中にエラーが発生しました: {error}",
+                          level=logging.WARNING, song_id=song_id, error=str(error), error_type=type(error).__name__)
+                failed_count += 1
+                if store is not None:
+                    store.mark_scrape_failed(song_id, error, artist_id=artist_id)
+                continue
+
+            # 書き込みの例外でもレコードはバッファに残り、次のフラッシュで書き直されることがある
+            write_attempted.append(song_id)
+            try:
+                writer.write(song_data)
+            except Exception as e:
+                log_event("song_write_failed", f"song_id: {song_id} の処理中にエラーが発生しました: {e}",
+                          level=logging.ERROR, song_id=song_id, error=str(e))
+                continue
+
+    log_event("scrape_finished", "楽曲情報の取得と保存が完了しました。",
+              filepath=filepath, scraped=writer.written, failed=failed_count)
+    if failed_count:
+        if store is not None:
+            hint = "retry_failed_songs()で失敗した曲だけを再取得できます。"
+        else:
+            hint = "もう一度実行すると未取得の曲だけを再取得します。"
+        log_event("scrape_failures", f"{failed_count}曲の取得に失敗しました。{hint}",
+                  level=logging.WARNING, failed=failed_count)
+    if pipeline is not None:
+        log_event("pipeline_stats", pipeline.format_stats())
+    if parquet:
+        export_lyrics_parquet(filepath, only_if_stale=True)
+    saved = [song_id for song_id in song_id_list if str(song_id) in processed_ids or str(song_id) in written_ids]
+    write_failed = [song_id for song_id in write_attempted if str(song_id) not in written_ids]
+    return {"scraped": writer.written, "failed": failed_count, "saved": saved, "write_failed": write_failed}
+
+def _open_lyrics_store_writer(filepath, reconcile=False):
+    """
+    歌詞CSVと並べて置く歌詞ストアのライターを開く
+
+    ストアが無い場合と、reconcile（前回が異常終了していた）の場合は、CSVにあって
+    ストアに無い曲を先に書き込む（歌詞本文とsong_idの列だけを読む）。
+    """
+    store_path = lyrics_store_path_for(filepath)
+    exists = os.path.exists(store_path)
+    known = set()
+    if exists and reconcile:
+        with LyricsStore(store_path) as store:
+            known = set(store.song_ids())
+    writer = LyricsStoreWriter(store_path)
+    if (not exists or reconcile) and os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+        for record in iter_csv_records(filepath, chunksize=UPLOAD_CSV_CHUNKSIZE, columns=['song_id', 'lyrics']):
+            if record['song_id'] and record['song_id'] not in known:
+                writer.append(record['song_id'], record['lyrics'])
+        if writer.written:
+            log_event("lyrics_store_reconciled", f"{filepath}の{writer.written}件を歌詞ストア{store_path}に書き込みました。",
+                      path=filepath, records=writer.written)
+    return writer
+
+def _open_search_index_writer(filepath):
+    """
+    歌詞CSVと並べて置く全文検索の索引を書き込み用に開く
+
+    索引が新しく作られた場合と、前回の書き込みが閉じられずに終わっていた場合は、
+    CSVにあって索引に無い曲を先に追加する。
+    """
+    index = SearchIndex(search_index_path_for(filepath))
+    if (index.needs_reconcile or len(index) == 0) and os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+        added = 0
+        for record in iter_csv_records(filepath, chunksize=UPLOAD_CSV_CHUNKSIZE,
+                                       columns=['song_id', 'title', 'main_theme', 'lyrics']):
+            if record['song_id'] and index.add(record):
+                added += 1
+        if added:
+            log_event("search_index_reconciled", f"{filepath}の{added}件を検索用の索引{index.path}に追加しました。",
+                      path=filepath, records=added)
+    return index
+
+def export_search_index(csv_filepath):
+    """
+    既存の歌詞CSVから全文検索の索引を作る・補う
+
+    Args:
+        csv_filepath (str): 歌詞CSVのパス
+
+    Returns:
+        str: 索引のパス（CSVが無い場合はNone）
+    """
+    if not os.path.exists(csv_filepath):
+        log_event("csv_missing", f"CSVファイルが見つかりません: {csv_filepath}", level=logging.WARNING, path=csv_filepath)
+        return None
+    with _open_search_index_writer(csv_filepath) as index:
+        pass
+    return index.path
+
+def get_search_index(filepath='lyrics_data.csv'):
+    """
+    歌詞CSVの全文検索の索引を返す（初回のみ開き、以降は使い回す。索引が無ければNone）
+
+    フレーズの照合には、同じCSVの歌詞ストア（無ければCSV）から歌詞を読む。
+    """
+    index_path = search_index_path_for(filepath)
+    with _search_indexes_lock:
+        index = _search_indexes.get(index_path)
+        if index is None:
+            if not os.path.exists(index_path):
+                return None
+            index = SearchIndex(index_path, text_source=functools.partial(_read_lyrics_texts, filepath=filepath))
+            _search_indexes[index_path] = index
+        return index
+
+def _read_lyrics_texts(song_ids, filepath='lyrics_data.csv'):
+    """
+    検索のフレーズ照合用に、song_idsの歌詞を歌詞ストアから読む
+
+    ストアが無い（LYRICS_STORE_ENABLED=Falseで書き出していないなど）か、ストアに無い曲は
+    歌詞CSVを1回だけ先頭から読み、該当する曲の歌詞だけを取り出す。
+
+    Returns:
+        dict: {song_id: 歌詞}（ストアにもCSVにも無い曲は含まない）
+    """
+    texts = {}
+    for song_id in song_ids:
+        lyrics = get_lyrics(song_id, filepath)
+        if lyrics is not None:
+            texts[song_id] = lyrics
+    missing = set(song_ids) - texts.keys()
+    if missing and os.path.exists(filepath):
+        log_event("search_verify_from_csv",
+                  f"歌詞ストアに無い{len(missing)}曲は、{filepath}から歌詞を読んで照合します。",
+                  level=logging.WARNING, path=filepath, songs=len(missing))
+        for record in iter_lyrics_records(filepath, chunksize=UPLOAD_CSV_CHUNKSIZE, columns=['song_id', 'lyrics']):
+            song_id = _normalize_song_id(record.get('song_id'))
+            if song_id in missing:
+                texts[song_id] = record.get('lyrics') or ''
+                missing.discard(song_id)
+                if not missing:
+                    break
+    return texts
+
+def search_lyrics(query, filepath='lyrics_data.csv', fields=SEARCH_FIELDS, limit=20):
+    """
+    歌詞・タイトル・主題歌情報から検索語をすべて含む曲を探す
+
+    Args:
+        query (str): 空白区切りの検索語（"..."で空白を含むフレーズ）
+        filepath (str): 歌詞CSVのパス（並べて置いた索引を使う）
+        fields (tuple): 探す列（lyrics / title / main_theme）
+        limit (int): 返す件数の上限
+
+    Returns:
+        list: [{"song_id": 楽曲ID, "title": タイトル}]（索引が無い場合は空のリスト）
+    """
+    index = get_search_index(filepath)
+    if index is None:
+        log_event("search_index_missing",
+                  f"検索用の索引が見つかりません: {search_index_path_for(filepath)}（export_search_index()で作成できます）",
+                  level=logging.WARNING, path=filepath)
+        return []
+    with metrics.span("search"):
+        song_ids = index.search(query, fields=fields, limit=limit)
+        titles = index.titles(song_ids)
+    return [{"song_id": song_id, "title": titles.get(song_id, "")} for song_id in song_ids]
+
+def _open_near_duplicate_writer(filepath, reconcile=False):
+    """
+    歌詞CSVと並べて置く重複検出の索引を書き込み用に開く
+
+    索引が空の場合と、reconcile（前回が異常終了していた）の場合は、CSVにあって索引に無い曲を先に追加する。
+    """
+    from near_duplicates import NearDuplicateIndex, near_duplicate_path_for
+
+    index = NearDuplicateIndex(near_duplicate_path_for(filepath))
+    if (reconcile or len(index) == 0) and os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+        known = index.song_ids()
+        added = 0
+        for record in iter_lyrics_records(filepath, chunksize=UPLOAD_CSV_CHUNKSIZE,
+                                          columns=['song_id', 'title', 'artist', 'lyrics']):
+            song_id = _normalize_song_id(record.get('song_id'))
+            if song_id and song_id not in known and index.add({**record, 'song_id': song_id}, commit=False) is not None:
+                added += 1
+        index.commit()
+        if added:
+            log_event("near_duplicates_reconciled", f"{filepath}の{added}件を重複検出の索引{index.path}に追加しました。",
+                      path=filepath, records=added)
+    return index
+
+def export_near_duplicates(csv_filepath):
+    """
+    既存の歌詞CSV（.parquetも可）から重複検出の索引を作る・補う
+
+    Args:
+        csv_filepath (str): 歌詞CSVのパス
+
+    Returns:
+        str: 索引のパス（CSVが無い場合はNone）
+    """
+    if not os.path.exists(csv_filepath):
+        log_event("csv_missing", f"CSVファイルが見つかりません: {csv_filepath}", level=logging.WARNING, path=csv_filepath)
+        return None
+    with metrics.span("near_duplicates"):
+        with _open_near_duplicate_writer(csv_filepath, reconcile=True) as index:
+            pass
+    return index.path
+
+def get_near_duplicate_clusters(filepath='lyrics_data.csv', build=True):
+    """
+    歌詞がほぼ同じ曲のクラスタを返す
+
+    Args:
+        filepath (str): 歌詞CSVのパス（並べて置いた索引を使う）
+        build (bool): 索引が無い場合にCSVから作るか
+
+    Returns:
+        dict: {代表のsong_id: [{"song_id", "title", "artist"}, ...（代表を含む）]}（2曲以上のクラスタのみ）
+    """
+    from near_duplicates import NearDuplicateIndex, near_duplicate_path_for
+
+    index_path = near_duplicate_path_for(filepath)
+    if not os.path.exists(index_path):
+        if not build or export_near_duplicates(filepath) is None:
+            return {}
+    with NearDuplicateIndex(index_path) as index:
+        return index.clusters()
+
+def export_lyrics_store(csv_filepath):
+    """
+    既存の歌詞CSVから歌詞ストア（.lyrics と .lyrics.idx）を作る・補う
+
+    Args:
+        csv_filepath (str): 歌詞CSVのパス
+
+    Returns:
+        str: 歌詞ストアのパス（CSVが無い場合はNone）
+    """
+    if not os.path.exists(csv_filepath):
+        log_event("csv_missing", f"CSVファイルが見つかりません: {csv_filepath}", level=logging.WARNING, path=csv_filepath)
+        return None
+    with _open_lyrics_store_writer(csv_filepath, reconcile=True) as writer:
+        pass
+    return writer.path
+
+def get_lyrics(song_id, filepath='lyrics_data.csv'):
+    """
+    歌詞ストアからsong_idの歌詞だけを引く
+
+    CSV全体を読み込まず、索引の二分探索とmmapで該当する範囲だけを読む。
+    同じストアは開いたまま使い回し、書き込みがあれば開き直す。
+
+    Args:
+        song_id (str): 楽曲ID
+        filepath (str): 歌詞CSV（またはストアの.lyrics）のパス
+
+    Returns:
+        str: 歌詞（ストアが無いか、曲が見つからない場合はNone）
+    """
+    store_path = filepath if filepath.endswith('.lyrics') else lyrics_store_path_for(filepath)
+    store = open_lyrics_store(store_path)
+    if store is None:
+        return None
+    return store.get(song_id)
+
+def export_lyrics_parquet(csv_filepath, parquet_filepath=None, only_if_stale=False):
+    """
+    歌詞CSVを列指向のParquetに書き出す
+
+    artist・lyricist・composerなど値の種類が少ない列は辞書符号化し、全列をzstdで圧縮する。
+    書き出したファイルはupload_csv_to_notion / check_csv_data などにそのまま渡せる。
+
+    Args:
+        csv_filepath (str): 歌詞CSVのパス
+        parquet_filepath (str): 出力先（省略時は拡張子を .parquet にしたパス）
+        only_if_stale (bool): Parquetが既にあり、CSVより新しければ書き出さない
+
+    Returns:
+        str: 書き出したParquetのパス（書き出さなかった場合はNone）
+    """
+    parquet_filepath = parquet_filepath or parquet_path_for(csv_filepath)
+    if not os.path.exists(csv_filepath):
+        log_event("csv_missing", f"CSVファイルが見つかりません: {csv_filepath}", level=logging.WARNING, path=csv_filepath)
+        return None
+    if only_if_stale and os.path.exists(parquet_filepath) \
+            and os.path.getmtime(parquet_filepath) >= os.path.getmtime(csv_filepath):
+        return None
+    with metrics.span("parquet_export"):
+        parquet_filepath, written = convert_csv_to_parquet(csv_filepath, parquet_filepath,
+                                                          chunksize=UPLOAD_CSV_CHUNKSIZE)
+    log_event("parquet_written",
+              f"{parquet_filepath}に{written}件を書き出しました"
+              f"（CSV {os.path.getsize(csv_filepath) / 1024 / 1024:.1f} MB → "
+              f"Parquet {os.path.getsize(parquet_filepath) / 1024 / 1024:.1f} MB）。",
+              filepath=parquet_filepath, rows=written)
+    return parquet_filepath
+
+def retry_failed_songs(artist_id=None, filepath=None, max_workers=1, request_interval=None):
+    """
+    デッドレターリスト（状態DBで取得失敗になっている曲）だけを再取得する
+
+    Args:
+        artist_id (str): アーティストIDで絞り込む（出力先のファイル名にも使う）
+        filepath (str): 歌詞CSVのパス（省略時は lyrics_data_{artist_id}.csv）
+        max_workers (int): 同時に取得するスレッド数
+        request_interval (float): uta-net.comへのリクエスト間隔（秒）。省略時は自動調整
+
+    Returns:
+        dict: 再取得前のデッドレターリスト {song_id: エラーメッセージ}
+    """
+    store = get_state_store()
+    if store is None:
+        log_event("state_db_required", "デッドレターリストには状態DBが必要です（STATE_DB_PATHを設定してください）。",
+                  level=logging.WARNING)
+        return {}
+    failed = store.failed_songs(artist_id)
+    if not failed:
+        log_event("retry_skipped", "取得に失敗した曲はありません。")
+        return failed
+    log_event("retry_started", f"取得に失敗した{len(failed)}曲を再取得します。", songs=len(failed))
+    scrape_and_save_lyrics(list(failed), filepath=filepath, artist_id=artist_id, max_workers=max_workers,
+                           request_interval=request_interval)
+    return failed
+
+def enqueue_artist_songs(artist_page_url, queue=None, incremental=False, max_workers=4, filepath=None):
+    """
+    アーティストページからsong_idを集め、作業キューに取得待ちとして登録する
+
+    状態DBでfilepathに書き込み済みの曲は登録しない。登録した曲は、別のプロセス・ホストで
+    run_queue_worker()を実行して取得し、collect_queue_results()でCSVに書き込む。
+
+    Args:
+        artist_page_url (str): アーティスト（または作詞者・作曲者・編曲者）のページのURL
+        queue (str): 作業キューの場所（省略時はWORK_QUEUE_PATH）
+        incremental (bool): 新着ページだけを巡回する
+        max_workers (int): ページを並列取得するスレッド数
+        filepath (str): 結果を回収するCSV（省略時は lyrics_data_{artist_id}.csv）
+
+    Returns:
+        int: 新しく登録した件数
+    """
+    artist_id = listing_key(*_parse_artist_page_url(artist_page_url))
+    song_ids = get_and_save_song_ids(artist_page_url, incremental=incremental, max_workers=max_workers)
+    if filepath is None:
+        # collect_queue_results()の既定の出力先と同じ
+        filepath = f'lyrics_data_{artist_id}.csv'
+    store = get_state_store()
+    if store is not None:
+        scraped = store.scraped_ids(song_ids, path=filepath)
+        song_ids = [song_id for song_id in song_ids if str(song_id) not in scraped]
+    with open_work_queue(queue or WORK_QUEUE_PATH) as work_queue:
+        added = work_queue.enqueue(song_ids, artist_id=artist_id)
+    log_event("queue_enqueued", f"{artist_id}の{len(song_ids)}曲のうち{added}曲を作業キューに登録しました。",
+              artist_id=artist_id, songs=len(song_ids), added=added)
+    return added
+
+def run_queue_worker(queue=None, worker_id=None, max_workers=1, request_interval=None,
+                     batch_size=LEASE_BATCH_SIZE, lease_seconds=LEASE_SECONDS, wait=True):
+    """
+    作業キューから曲を借りて楽曲ページを取得し、結果をキューに書き込むワーカー
+
+    LEASE_BATCH_SIZE曲ずつ期限付きで借り、取得中は別スレッドが期限の1/3ごとにハートビートで延長する。
+    取得した楽曲データはまとめてキューに書き込む（CSVには書かないので、複数のワーカーが同じファイルを
+    取り合わない）。ワーカーが止まった場合、借りていた曲は期限切れ後に他のワーカーが引き取る。
+    uta-net.comへの送信枠はキューに記録して全ワーカーで共有するので（SharedHostScheduler）、
+    ワーカーを何台増やしても合計の速度は1/request_interval件/秒を超えない。各ワーカーはその中で
+    uta_net_schedulerによる同時接続数と速度の自動調整も行う。送信枠を共有できないキューの実装では、
+    request_intervalをワーカーごとの間隔として必ず指定する（合計の速度は ワーカー数/request_interval 件/秒）。
+
+    Args:
+        queue (str): 作業キューの場所（省略時はWORK_QUEUE_PATH）
+        worker_id (str): ワーカーID（省略時は ホスト名-プロセスID）
+        max_workers (int): 同時に取得するスレッド数
+        request_interval (float): 全ワーカー合計でのuta-net.comへのリクエスト間隔（秒）。
+            省略時はWORK_QUEUE_REQUEST_INTERVAL（送信枠を共有できないキューでは省略できない）
+        batch_size (int): 1回に借りる曲数
+        lease_seconds (float): 貸し出しの期限（秒）
+        wait (bool): 他のワーカーが借りている曲しか残っていない場合に、期限切れを待って引き取るか
+
+    Returns:
+        dict: {"completed": 書き込んだ曲数, "failed": 取得に失敗した曲数, "lost": 期限切れで他のワーカーに渡った曲数}
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    counts = {"completed": 0, "failed": 0, "lost": 0}
+    held = set()
+    held_lock = threading.Lock()
+    stop = threading.Event()
+
+    work_queue = open_work_queue(queue or WORK_QUEUE_PATH)
+    if hasattr(work_queue, "reserve_slot"):
+        scheduler = SharedHostScheduler(work_queue, request_interval or WORK_QUEUE_REQUEST_INTERVAL,
+                                        local=uta_net_scheduler)
+    elif request_interval is None:
+        work_queue.close()
+        raise ValueError(f"{queue or WORK_QUEUE_PATH} のキューは全ワーカーで送信枠を共有できません。request_intervalで"
+                         "ワーカーごとのリクエスト間隔を指定してください（合計の速度は ワーカー数/request_interval 件/秒）。")
+    else:
+        scheduler = HostScheduler(min_interval=request_interval)
+
+    def heartbeat():
+        while not stop.wait(lease_seconds / 3):
+            with held_lock:
+                song_ids = set(held)
+            if not song_ids:
+                continue
+            try:
+                kept = work_queue.heartbeat(worker_id, song_ids, lease_seconds=lease_seconds)
+            except Exception as e:
+                log_event("queue_heartbeat_failed", f"ハートビートに失敗しました: {e}",
+                          level=logging.WARNING, worker_id=worker_id, error=str(e))
+                continue
+            if song_ids - kept:
+                log_event("queue_lease_lost", f"{len(song_ids - kept)}曲の貸し出しが期限切れで他のワーカーに渡りました。",
+                          level=logging.WARNING, worker_id=worker_id, songs=len(song_ids - kept))
+
+    heartbeat_thread = threading.Thread(target=heartbeat, name="queue-heartbeat", daemon=True)
+    work_queue.register_worker(worker_id)
+    heartbeat_thread.start()
+    log_event("queue_worker_started", f"ワーカー{worker_id}を開始しました（キュー: {work_queue.path}）。",
+              worker_id=worker_id, queue=work_queue.path, shared_rate=isinstance(scheduler, SharedHostScheduler))
+    try:
+        while True:
+            song_ids = work_queue.lease(worker_id, limit=batch_size, lease_seconds=lease_seconds)
+            if not song_ids:
+                if not wait or work_queue.is_drained():
+                    break
+                time.sleep(WORK_QUEUE_POLL_INTERVAL)
+                continue
+            with held_lock:
+                held.update(song_ids)
+
+            completed = []
+            for song_id, song_data, error in _iter_song_details(song_ids, max_workers=max_workers, scheduler=scheduler):
+                if error is not None:
+                    log_event("song_failed", f"song_id: {song_id} の処理中にエラーが発生しました: {error}",
+                              level=logging.WARNING, song_id=song_id, error=str(error),
+                              error_type=type(error).__name__)
+                    work_queue.fail(worker_id, song_id, error)
+                    # 取得待ちに戻した（または失敗にした）曲はもう借りていない
+                    with held_lock:
+                        held.discard(song_id)
+                    counts["failed"] += 1
+                    metrics.inc("queue_songs_failed")
+                else:
+                    completed.append(song_data)
+            with metrics.span("queue_commit", items=len(completed)):
+                accepted = work_queue.complete(worker_id, completed)
+            counts["completed"] += len(accepted)
+            counts["lost"] += len(completed) - len(accepted)
+            metrics.inc("queue_songs_completed", len(accepted))
+            with held_lock:
+                held.clear()
+    finally:
+        stop.set()
+        heartbeat_thread.join()
+        with held_lock:
+            if held:
+                # 途中で止めた場合は、借りていた曲をすぐに他のワーカーが引き取れるように返す
+                work_queue.release(worker_id, held)
+        work_queue.close()
+    log_event("queue_worker_finished",
+              f"ワーカー{worker_id}が終了しました: 取得 {counts['completed']}曲, 失敗 {counts['failed']}曲, "
+              f"期限切れ {counts['lost']}曲, 引き取り {work_queue.reclaimed}曲",
+              worker_id=worker_id, reclaimed=work_queue.reclaimed, **counts)
+    return counts
+
+def collect_queue_results(queue=None, filepath=None, artist_id=None, parquet=None,
+                          page_size=WORK_QUEUE_COLLECT_PAGE_SIZE):
+    """
+    作業キューのワーカーが取得した結果を歌詞CSVに書き込む
+
+    scrape_and_save_lyricsと同じ経路（ジャーナル・歌詞ストア・索引・状態DB）で書き込むので、
+    ワーカーの実行中に何度呼んでもよい（書き込み済みの曲は飛ばす）。取得に失敗した曲は
+    状態DBのデッドレターリストに入る。結果はsong_id順にpage_size曲ずつ読み込んで書き込み、
+    ライターがジャーナルへの永続化を確認した曲（以前から保存済みの曲を含む）と、失敗を記録した曲
+    だけを回収済みにする（永続化できなかった曲は次回も回収する）。
+
+    Args:
+        queue (str): 作業キューの場所（省略時はWORK_QUEUE_PATH）
+        filepath (str): 歌詞CSVのパス（省略時は lyrics_data_{artist_id}.csv）
+        artist_id (str): このアーティストとして登録した曲だけを回収する
+        parquet (bool): 書き込み後に.parquetも書き出す
+        page_size (int): 1回に読み込んで書き込む曲数
+
+    Returns:
+        dict: {"scraped": 書き込んだ曲数, "failed": 失敗していた曲数, "write_failed": 回収できなかった曲数}
+    """
+    if parquet is None:
+        parquet = LYRICS_PARQUET_EXPORT
+    if filepath is None:
+        filepath = f'lyrics_data_{artist_id}.csv' if artist_id else 'lyrics_data.csv'
+    elif is_parquet_path(filepath):
+        filepath = os.path.splitext(filepath)[0] + '.csv'
+        parquet = True
+    totals = {"scraped": 0, "failed": 0, "write_failed": 0}
+    collected = 0
+    with open_work_queue(queue or WORK_QUEUE_PATH) as work_queue:
+        after = None
+        while True:
+            results = work_queue.results(artist_id, after=after, limit=page_size)
+            if not results:
+                break
+            after = next(reversed(results))
+
+            def details_source(target_ids):
+                for song_id in target_ids:
+                    song_data, error = results[str(song_id)]
+                    yield song_id, song_data, None if song_data is not None else RuntimeError(error)
+
+            # Parquetは最後に1回だけ書き出す
+            result = scrape_and_save_lyrics(list(results), filepath=filepath, artist_id=artist_id, parquet=False,
+                                            details_source=details_source)
+            saved = {str(song_id) for song_id in result["saved"]}
+            done = [song_id for song_id, (song_data, _) in results.items() if song_data is None or song_id in saved]
+            work_queue.mark_collected(done)
+            collected += len(done)
+            totals["scraped"] += result["scraped"]
+            totals["failed"] += result["failed"]
+            totals["write_failed"] += len(results) - len(done)
+    if not collected and not totals["write_failed"]:
+        log_event("queue_collect_skipped", "作業キューに未回収の結果はありません。")
+        return totals
+    if parquet:
+        export_lyrics_parquet(filepath, only_if_stale=True)
+    return totals
+
+def show_queue_status(queue=None):
+    """
+    作業キューの状態ごとの件数と、ワーカーごとの最終ハートビートを表示する
+
+    Returns:
+        dict: 状態ごとの件数
+    """
+    with open_work_queue(queue or WORK_QUEUE_PATH) as work_queue:
+        counts = work_queue.counts()
+        workers = work_queue.workers()
+    print("作業キュー: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    now = time.time()
+    for worker_id, heartbeat_at, completed, failed in workers:
+        print(f"  {worker_id}: 取得 {completed}曲, 失敗 {failed}曲, 最終ハートビート {now - heartbeat_at:.0f}秒前")
+    return counts
+
+def _export_artist_lyrics(store, artist_ids, lyrics_filepath):
+    """
+    lyrics_filepathの曲を lyrics_data_{artist_id}.csv に書き足す
+
+    各アーティストのCSVにまだ書き込んでいない曲だけを、lyrics_filepathを1回読みながら追記する。
+
+    Returns:
+        int: 書き足した行数
+    """
+    missing = {}  # song_id → 書き足すアーティストのCSV
+    for artist_id in artist_ids:
+        artist_filepath = f'lyrics_data_{artist_id.replace(":", "_")}.csv'
+        # 単独で実行したときのCSVが残っていれば、書き足す前に取り込んでおく
+        recover_csv_journal(artist_filepath, SONG_FIELDS)
+        if not os.path.exists(artist_filepath) or os.path.getsize(artist_filepath) == 0:
+            store.reset_file(artist_filepath)
+        elif not store.is_imported(artist_filepath):
+            store.import_lyrics_csv(artist_filepath, artist_id=artist_id)
+        song_ids = store.song_ids(artist_id)
+        for song_id in song_ids - store.scraped_ids(song_ids, path=artist_filepath):
+            missing.setdefault(song_id, []).append(artist_filepath)
+    if not missing:
+        return 0
+
+    def on_flush(artist_filepath, batch):
+        for song_data in batch:
+            store.mark_scraped(song_data, commit=False, path=artist_filepath)
+        store.commit()
+
+    written = 0
+    with contextlib.ExitStack() as stack:
+        writers = {}
+        for record in iter_csv_records(lyrics_filepath, chunksize=UPLOAD_CSV_CHUNKSIZE):
+            for artist_filepath in missing.get(str(record.get('song_id')), ()):
+                if artist_filepath not in writers:
+                    writers[artist_filepath] = stack.enter_context(BufferedRecordWriter(
+                        artist_filepath, SONG_FIELDS, batch_size=LYRICS_WRITE_BATCH_SIZE,
+                        flush_interval=LYRICS_WRITE_FLUSH_INTERVAL,
+                        on_flush=functools.partial(on_flush, artist_filepath),
+                    ))
+                writers[artist_filepath].write(record)
+                written += 1
+    return written
+
+def crawl_artists(artist_urls, lyrics_filepath='lyrics_data_all.csv', incremental=True, listing_workers=4,
+                  max_workers=1, parse_workers=0, export_per_artist=True, batch_name=None, parquet=None):
+    """
+    複数アーティストの楽曲IDの収集と歌詞の取得をまとめて実行する
+
+    全アーティストのページと楽曲ページは共有のスケジューラ（uta_net_scheduler）を通して取得する。
+    複数のアーティストに載っている曲は1回だけ取得し、lyrics_filepathに書き込み済みの曲は取得しない。
+    アーティストごとの巡回の完了は状態DBに記録するため、途中で止まっても同じ引数で
+    再実行すれば未完了のアーティストと未取得の曲から再開する。
+
+    Args:
+        artist_urls (list): アーティストページのURL
+        lyrics_filepath (str): 全アーティスト分の歌詞を書き込むCSV
+        incremental (bool): 既に楽曲IDを持っているアーティストは新着ページだけを巡回する
+        listing_workers (int): アーティストページを並列取得するスレッド数
+        max_workers (int): 楽曲ページを同時に取得するスレッド数
+        parse_workers (int): 解析に使うプロセス数（0なら取得スレッド内で解析）
+        export_per_artist (bool): 終了後に lyrics_data_{artist_id}.csv にアーティストごとの未保存の曲を書き足す
+        batch_name (str): 再開に使うバッチ名（省略時はアーティストIDの組み合わせから決める）
+        parquet (bool): lyrics_filepathのParquetも書き出す（省略時はLYRICS_PARQUET_EXPORT）
+
+    Returns:
+        dict: {artist_id: {"songs": 曲数, "scraped": 取得済み, "failed": 取得失敗}}
+    """
+    store = get_state_store()
+    if store is None:
+        log_event("state_db_required", "複数アーティストの一括取得には状態DBが必要です（STATE_DB_PATHを設定してください）。",
+                  level=logging.WARNING)
+        return {}
+
+    # キーは_discover_song_idsが状態DBに記録するものと同じ（作詞者などは "lyricist:1234"）
+    artists = {}
+    for artist_url in artist_urls:
+        artists.setdefault(listing_key(*_parse_artist_page_url(artist_url)), artist_url)
+    if batch_name is None:
+        batch_name = hashlib.sha1(",".join(sorted(artists)).encode("utf-8")).hexdigest()[:12]
+    batch_key = f"artist_batch:{batch_name}"
+    batch = json.loads(store.get_meta(batch_key) or "{}")
+    if not batch or batch.get("finished_at"):
+        batch = {"discovered": [], "started_at": time.time()}
+    else:
+        log_event("artist_batch_resumed",
+                  f"バッチ {batch_name} を再開します（巡回済み {len(batch['discovered'])}/{len(artists)}アーティスト）。",
+                  batch=batch_name, discovered=len(batch['discovered']), artists=len(artists))
+
+    # Step 1: アーティストごとに楽曲IDを収集（全ページ取得できたアーティストは記録して再実行時に飛ばす）
+    incomplete = []
+    for index, (artist_id, artist_url) in enumerate(artists.items(), 1):
+        if artist_id in batch["discovered"]:
             continue
-            
-    print("楽曲情報の取得と保存が完了しました。")
+        log_event("artist_discovery_started", f"[{index}/{len(artists)}] アーティストID {artist_id}", artist_id=artist_id)
+        _, failed_pages, _ = _discover_song_ids(artist_url, incremental=incremental, max_workers=listing_workers)
+        if failed_pages:
+            incomplete.append(artist_id)
+            continue
+        batch["discovered"].append(artist_id)
+        store.set_meta(batch_key, json.dumps(batch))
+
+    # Step 2: 全アーティストの曲をまとめて重複を除き、未取得の曲だけを取得
+    listed = 0
+    all_song_ids = set()
+    for artist_id in artists:
+        artist_song_ids = store.song_ids(artist_id)
+        listed += len(artist_song_ids)
+        all_song_ids |= artist_song_ids
+    # scrape_and_save_lyricsはParquetを指定しても同じ名前のCSVに書き込む
+    lyrics_csv = os.path.splitext(lyrics_filepath)[0] + '.csv' if is_parquet_path(lyrics_filepath) else lyrics_filepath
+    pending = sorted(all_song_ids - store.scraped_ids(all_song_ids, path=lyrics_csv))
+    log_event("artist_batch_pending", f"{len(artists)}アーティストの掲載曲 {listed}件（重複を除くと{len(all_song_ids)}件）のうち、"
+              f"未取得 {len(pending)}件を取得します。", listed=listed, songs=len(all_song_ids), pending=len(pending))
+    if pending:
+        scrape_and_save_lyrics(sorted(all_song_ids), filepath=lyrics_filepath, max_workers=max_workers,
+                               parse_workers=parse_workers, parquet=parquet)
+    elif parquet or (parquet is None and LYRICS_PARQUET_EXPORT):
+        export_lyrics_parquet(lyrics_filepath, only_if_stale=True)
+
+    if export_per_artist and os.path.exists(lyrics_csv):
+        _export_artist_lyrics(store, artists, lyrics_csv)
+
+    if not incomplete:
+        batch["finished_at"] = time.time()
+        store.set_meta(batch_key, json.dumps(batch))
+
+    summary = store.artist_summary(artists)
+    log_event("artist_batch_finished", "アーティスト別の結果:\n" + "\n".join(
+        f"  {artist_id}: 掲載 {counts['songs']}曲 / 取得済み {counts['scraped']}曲 / 失敗 {counts['failed']}曲"
+        for artist_id, counts in summary.items()), batch=batch_name, summary=summary)
+    if incomplete:
+        log_event("artist_batch_incomplete",
+                  f"ページの取得に失敗したアーティスト: {', '.join(incomplete)}。同じ引数で再実行すると続きから巡回します。",
+                  level=logging.WARNING, batch=batch_name, artist_ids=incomplete)
+    return summary
+
+def crawl_listings(start_urls, depth=1, follow_kinds=("lyricist", "composer", "arranger"), max_listings=200,
+                   max_workers=4, filepath='song_ids_catalogue.csv'):
+    """
+    一覧ページ（アーティスト・作詞者・作曲者・編曲者）を巡回し、クレジットをたどって曲IDを集める
+
+    開始URLの一覧を深さ0として、各一覧の曲の行に載っている作詞者・作曲者などの一覧を
+    depthの深さまでたどる。同じ深さの一覧は全ページをまとめてmax_workers並列で取得する
+    （リクエストは共有のスケジューラで間隔を調整する）。
+
+    Args:
+        start_urls (list): 一覧ページのURL（https://www.uta-net.com/lyricist/1234/ など）
+        depth (int): クレジットをたどる深さ（0なら開始URLの一覧のみ）
+        follow_kinds (tuple): たどる一覧の種類（LISTING_KINDSのうち）
+        max_listings (int): 巡回する一覧の数の上限（Noneなら無制限）
+        max_workers (int): 同時に取得するスレッド数
+        filepath (str): 一覧ごとの曲IDを書き出すCSV（Noneなら書き出さない）
+
+    Returns:
+        dict: {一覧のキー: 曲IDのリスト}。キーはアーティストならID、それ以外は "lyricist:1234" の形式
+    """
+    import pandas as pd
+
+    store = get_state_store()
+    frontier = {}
+    for url in start_urls:
+        frontier.setdefault(parse_listing_url(url), url)
+
+    visited = set()
+    catalogue = {}
+    incomplete = {}
+    for level in range(depth + 1):
+        if not frontier:
+            break
+        log_event("listing_level_started", f"深さ{level}: {len(frontier)}件の一覧を巡回します。", depth=level, listings=len(frontier))
+        page_pbar = tqdm(total=len(frontier), desc=f"深さ{level}の一覧を取得中", unit="page")
+        results = _crawl_listing_pages(frontier, max_workers=max_workers, pbar=page_pbar)
+        page_pbar.close()
+        visited.update(frontier)
+
+        next_frontier = {}
+        for listing, result in results.items():
+            key = listing_key(*listing)
+            song_ids = sorted(set(result["song_ids"]))
+            catalogue[key] = song_ids
+            if result["failed_pages"]:
+                incomplete[key] = sorted(result["failed_pages"])
+            if store is not None and song_ids:
+                store.add_discovered(song_ids, artist_id=key)
+            if level < depth:
+                for credit in sorted(result["credits"]):
+                    if credit[0] in follow_kinds and credit not in visited:
+                        next_frontier.setdefault(credit, None)
+
+        if max_listings is not None and len(visited) + len(next_frontier) > max_listings:
+            allowed = max(0, max_listings - len(visited))
+            log_event("listing_limit_reached", f"巡回する一覧の上限（{max_listings}件）に達したため、"
+                      f"深さ{level + 1}の{len(next_frontier) - allowed}件は巡回しません。", level=logging.WARNING,
+                      max_listings=max_listings, depth=level + 1, skipped=len(next_frontier) - allowed)
+            next_frontier = dict(list(next_frontier.items())[:allowed])
+        frontier = next_frontier
+
+    all_song_ids = set()
+    for song_ids in catalogue.values():
+        all_song_ids.update(song_ids)
+    log_event("listing_crawl_finished", f"{len(catalogue)}件の一覧から合計{len(all_song_ids)}曲（重複を除く）を見つけました。",
+              listings=len(catalogue), songs=len(all_song_ids))
+    if incomplete:
+        log_event("listing_crawl_incomplete", f"警告: {len(incomplete)}件の一覧でページの取得に失敗しました"
+                  f"（{', '.join(f'{key} ページ{pages}' for key, pages in list(incomplete.items())[:5])}）。"
+                  "後でもう一度実行してください。", level=logging.WARNING, incomplete=incomplete)
+
+    if filepath is not None:
+        df = pd.DataFrame(
+            [(key, song_id) for key, song_ids in catalogue.items() for song_id in song_ids],
+            columns=['listing', 'song_id'],
+        )
+        df.to_csv(filepath, index=False)
+        log_event("listing_catalogue_saved", f"{filepath}に{len(df)}行を保存しました。", path=filepath, rows=len(df))
+    return catalogue
+
+def _iter_song_details(target_ids, max_workers=1, scheduler=None):
+    """
+    song_idごとに楽曲詳細を取得し、(song_id, song_data, error)を順次返す
+
+    max_workersが1以下なら逐次処理、それ以外はスレッドプールで並行処理する。
+    並行処理時は完了した順に返すため、入力順とは一致しない。
+    """
+    if max_workers <= 1:
+        for song_id in target_ids:
+            try:
+                yield song_id, get_song_details_and_lyrics(song_id, scheduler=scheduler), None
+            except Exception as e:
+                yield song_id, None, e
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(get_song_details_and_lyrics, song_id, scheduler=scheduler): song_id
+            for song_id in target_ids
+        }
+        for future in as_completed(futures):
+            song_id = futures[future]
+            try:
+                yield song_id, future.result(), None
+            except Exception as e:
+                yield song_id, None, e
 
 # 曲のIDを渡すと、その曲の詳細情報と歌詞を取得する
-def get_song_details_and_lyrics(song_id):
-    # 曲のページのURLを作成
-    song_page_url = f"https://www.uta-net.com/song/{song_id}/"
-    
-    # 曲のページのHTMLを取得
-    song_page_html = requests.get(song_page_url).text
-    time.sleep(1) # サーバー負荷軽減
-    
-    # BeautifulSoupで解析の準備
-    soup_song = BeautifulSoup(song_page_html, "html.parser")
-    
-    # 楽曲詳細情報を含むエリアを取得
-    song_details = soup_song.find("div", class_="blur-filter row py-3")
-    
-    # デフォルト値を設定
-    song_data = {
-        "song_id": song_id,
-        "title": "",
-        "artist": "",
-        "main_theme": "",
-        "lyricist": "",
-        "composer": "",
-        "arranger": "",
-        "release_date": "",
-        "cover_url": "",
-        "lyrics": ""
-    }
-    
-    try:
-        # 曲のタイトルを取得
-        title_tag = song_details.find("h2", class_="ms-2 ms-md-3 kashi-title")
-        if not title_tag:
-            title_tag = soup_song.find("h2", class_="ms-2")
-        song_data["title"] = title_tag.text.strip() if title_tag else ""
-        
-        # アーティスト名を取得
-        artist_tag = song_details.find("h3", class_="ms-2 ms-md-3")
-        song_data["artist"] = artist_tag.text.strip() if artist_tag else ""
-        
-        # 主題歌情報を取得
-        main_theme_tag = song_details.find("p", class_="ms-2 ms-md-3 mb-0")
-        song_data["main_theme"] = main_theme_tag.text.strip().replace("\xa0", "") if main_theme_tag else ""
-        
-        # 詳細情報（作詞者、作曲者、編曲者、発売日）を取得
-        detail_section = song_details.find("p", class_="ms-2 ms-md-3 detail mb-0")
-        if detail_section:
-            # 作詞者
-            lyricist_link = detail_section.find("a", href=re.compile(r"/lyricist/"))
-            song_data["lyricist"] = lyricist_link.text.strip() if lyricist_link else ""
-            
-            # 作曲者
-            composer_link = detail_section.find("a", href=re.compile(r"/composer/"))
-            song_data["composer"] = composer_link.text.strip() if composer_link else ""
-            
-            # 編曲者
-            arranger_link = detail_section.find("a", href=re.compile(r"/arranger/"))
-            song_data["arranger"] = arranger_link.text.strip() if arranger_link else ""
-            
-            # 発売日
-            detail_text = detail_section.text
-            if "発売日：" in detail_text:
-                release_date_match = detail_text.split("発売日：")[1].split()[0]
-                song_data["release_date"] = release_date_match
-        
-        # カバー画像URLを取得
-        cover_img = song_details.find("img", class_="img-fluid")
-        song_data["cover_url"] = cover_img["src"] if cover_img and cover_img.get("src") else ""
-        
-    except Exception as e:
-        print(f"楽曲詳細情報の取得中にエラーが発生しました (song_id: {song_id}): {e}")
+def get_song_details_and_lyrics(song_id, scheduler=None):
+    # 曲のページのHTMLを取得（キャッシュになければ間隔を空けてリクエスト）
+    song_page_html = _fetch_song_page(song_id, scheduler=scheduler)
     
-    try:
-        # 曲の歌詞を取得
-        kashi_area = soup_song.find("div", id="kashi_area")
-        if kashi_area:
-            # <br>タグを改行文字に置換
-            for br in kashi_area.find_all("br"):
-                br.replace_with("\n")
-            song_data["lyrics"] = kashi_area.get_text().strip()
-    except Exception as e:
-        print(f"歌詞の取得中にエラーが発生しました (song_id: {song_id}): {e}")
+    # 必要な部分だけを解析してsong_dataを組み立てる
+    with metrics.span("parse"):
+        return parse_song_page(song_id, song_page_html, backend=SONG_PARSER_BACKEND)
 
-    return song_data
+def _fetch_song_page(song_id, scheduler=None):
+    """曲のページのHTMLを取得する（解析は行わない）。200以外なら例外を送出"""
+    song_page_url = f"{UTA_NET_BASE_URL}/song/{song_id}/"
+    with metrics.span("song_fetch"):
+        response = fetch_uta_net_page(song_page_url, max_age=SONG_CACHE_MAX_AGE, scheduler=scheduler)
+        if response.status_code != 200:
+            raise RuntimeError(f"ステータス: {response.status_code}")
+    return response.text
 
 # 後方互換性のために古い関数名も残す
 def get_song_title_and_lyrics(song_id):
@@ -284,54 +1387,160 @@ def get_song_title_and_lyrics(song_id):
     song_data = get_song_details_and_lyrics(song_id)
     return song_data["title"], song_data["lyrics"]
 
+def _normalize_song_id(value):
+    """CSV由来のsong_id（int / float / str）を状態DBのキー形式の文字列にそろえる"""
+    try:
+        return str(int(float(value)))
+    except (TypeError, ValueError):
+        return None
+
+def notion_properties_hash(notion_data):
+    """
+    convert_to_notion_formatの出力のハッシュを計算する（差分同期で変更の有無を判定する）
+
+    Args:
+        notion_data (dict): Notion API形式のプロパティ
+
+    Returns:
+        str: SHA-256の16進文字列
+    """
+    payload = json.dumps(notion_data, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _send_notion_request(method, url, payload, song_data, max_retries=3, limiter=None):
+    """
+    Notion APIにリクエストを送信する（429と通信エラーはリトライする）
+
+    Returns:
+        requests.Response | None: 成功したレスポンス。失敗した場合はNone
+    """
+    # ページの作成（POST）と更新（PATCH）を別のステージとして計測する
+    stage = "notion_create" if method == "POST" else "notion_update"
+    song_id = song_data.get('song_id', 'unknown')
+    for attempt in range(max_retries):
+        try:
+            if limiter is not None:
+                start = time.monotonic()
+                limiter.acquire()
+                metrics.observe("throttle_wait_seconds", time.monotonic() - start, service="notion")
+            with metrics.span(stage):
+                response = http_client.request(method, url, headers=NOTION_HEADERS, json=payload)
+            metrics.inc("http_responses_total", service="notion", status=response.status_code)
+            
+            if response.status_code == 200 or response.status_code == 201:
+                return response
+            elif response.status_code == 429:  # Rate limit
+                retry_after = float(response.headers.get('Retry-After', 1))
+                metrics.observe("rate_limit_pause_seconds", retry_after, service="notion")
+                log_event("notion_rate_limited", f"レートリミットが発生しました。{retry_after}秒待機します...",
+                          level=logging.WARNING, song_id=song_id, retry_after=retry_after)
+                if limiter is not None:
+                    limiter.pause(retry_after)  # 全ワーカーを停止
+                else:
+                    time.sleep(retry_after)
+                continue
+            else:
+                log_event("notion_error", f"Notion APIエラー (song_id: {song_id}): {response.status_code} - {response.text}",
+                          level=logging.ERROR, song_id=song_id, status=response.status_code, stage=stage)
+                return None
+                
+        except Exception as e:
+            log_event("notion_request_failed", f"リクエスト中にエラーが発生しました (song_id: {song_id}): {e}",
+                      level=logging.WARNING, song_id=song_id, error=str(e), attempt=attempt + 1, stage=stage)
+            if attempt < max_retries - 1:
+                time.sleep(2 ** attempt)  # 指数バックオフ
+                continue
+            return None
+    
+    return None
+
+def _record_notion_upload(song_data, response, notion_hash):
+    """アップロード結果（ページIDとプロパティのハッシュ）を状態DBに記録する"""
+    store = get_state_store()
+    song_id = _normalize_song_id(song_data.get('song_id'))
+    if store is not None and song_id is not None:
+        page = response.json()
+        store.mark_uploaded(song_id, page.get('id'), notion_hash=notion_hash)
+        if page.get('id'):
+            store.upsert_mirror([(song_id, page['id'], page.get('last_edited_time'))])
+
 # Notionにデータを送信する関数
-def upload_to_notion(song_data, max_retries=3):
+def upload_to_notion(song_data, max_retries=3, limiter=None):
     """
     楽曲データをNotionデータベースに追加する
     
     Args:
         song_data (dict): 楽曲データ
         max_retries (int): 最大リトライ回数
+        limiter (TokenBucket): 共有レートリミッタ。指定時は送信前にトークンを取得し、
+            429を受けたらRetry-Afterの間リミッタ全体を停止する
     
     Returns:
         bool: 成功した場合True、失敗した場合False
     """
     if not NOTION_TOKEN or not NOTION_DATABASE_ID:
-        print("Notion APIの設定が不完全です。NOTION_TOKENとNOTION_DATABASE_IDを環境変数に設定してください。")
+        log_event("notion_not_configured", "Notion APIの設定が不完全です。NOTION_TOKENとNOTION_DATABASE_IDを環境変数に設定してください。",
+                  level=logging.ERROR)
         return False
     
     # NotionAPIに送信するためのデータ形式に変換
     notion_data = convert_to_notion_format(song_data)
     
-    url = "https://api.notion.com/v1/pages"
+    url = f"{NOTION_API_BASE_URL}/pages"
     payload = {
         "parent": {"database_id": NOTION_DATABASE_ID},
         "properties": notion_data
     }
     
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(url, headers=NOTION_HEADERS, json=payload)
-            
-            if response.status_code == 200 or response.status_code == 201:
-                return True
-            elif response.status_code == 429:  # Rate limit
-                retry_after = int(response.headers.get('Retry-After', 1))
-                print(f"レートリミットが発生しました。{retry_after}秒待機します...")
-                time.sleep(retry_after)
-                continue
-            else:
-                print(f"Notion APIエラー (song_id: {song_data.get('song_id', 'unknown')}): {response.status_code} - {response.text}")
-                return False
-                
-        except Exception as e:
-            print(f"リクエスト中にエラーが発生しました (song_id: {song_data.get('song_id', 'unknown')}): {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)  # 指数バックオフ
-                continue
-            return False
-    
-    return False
+    response = _send_notion_request("POST", url, payload, song_data, max_retries=max_retries, limiter=limiter)
+    if response is None:
+        return False
+    _record_notion_upload(song_data, response, notion_properties_hash(notion_data))
+    return True
+
+# 更新時に値が無くなったプロパティを空にするための値
+NOTION_EMPTY_PROPERTIES = {
+    "title": {"title": []},
+    "artist": {"rich_text": []},
+    "main_theme": {"rich_text": []},
+    "lyricist": {"rich_text": []},
+    "composer": {"rich_text": []},
+    "arranger": {"rich_text": []},
+    "release_date": {"date": None},
+    "cover": {"files": []},
+    "lyrics": {"rich_text": []},
+    NOTION_VARIANTS_PROPERTY: {"rich_text": []},
+}
+
+def update_notion_page(page_id, song_data, max_retries=3, limiter=None):
+    """
+    既存のNotionページのプロパティを楽曲データで更新する
+
+    Args:
+        page_id (str): NotionページのID
+        song_data (dict): 楽曲データ
+        max_retries (int): 最大リトライ回数
+        limiter (TokenBucket): 共有レートリミッタ
+
+    Returns:
+        bool: 成功した場合True、失敗した場合False
+    """
+    if not NOTION_TOKEN or not NOTION_DATABASE_ID:
+        log_event("notion_not_configured", "Notion APIの設定が不完全です。NOTION_TOKENとNOTION_DATABASE_IDを環境変数に設定してください。",
+                  level=logging.ERROR)
+        return False
+
+    notion_data = convert_to_notion_format(song_data)
+    # 値が無くなった項目は明示的に空にする（PATCHでは省略したプロパティは変更されないため）
+    properties = {**NOTION_EMPTY_PROPERTIES, **notion_data}
+
+    url = f"{NOTION_API_BASE_URL}/pages/{page_id}"
+    response = _send_notion_request("PATCH", url, {"properties": properties}, song_data,
+                                    max_retries=max_retries, limiter=limiter)
+    if response is None:
+        return False
+    _record_notion_upload(song_data, response, notion_properties_hash(notion_data))
+    return True
 
 def convert_to_notion_format(song_data):
     """
@@ -343,6 +1552,8 @@ def convert_to_notion_format(song_data):
     Returns:
         dict: Notion API形式のデータ
     """
+    import pandas as pd
+
     def is_valid_data(value):
         """データが有効かどうかをチェック（nan、None、空文字列を除外）"""
         if value is None:
@@ -451,76 +1662,104 @@ def convert_to_notion_format(song_data):
             notion_data["lyrics"] = {
                 "rich_text": [{"text": {"content": chunk}} for chunk in chunks[:100]]  # 最大100ブロック
             }
+
+    # variants (text) - 歌詞がほぼ同じ別バージョン（upload_csv_to_notionのlinkモード）
+    variants_text = get_clean_text(song_data.get('variants'))
+    if variants_text:
+        notion_data[NOTION_VARIANTS_PROPERTY] = {
+            "rich_text": [{"text": {"content": variants_text}}]
+        }
     
     return notion_data
 
-def upload_csv_to_notion(csv_filepath, batch_size=10, delay_between_requests=1.0):
+@profiled("upload_csv_to_notion")
+def upload_csv_to_notion(csv_filepath, batch_size=3, delay_between_requests=None, max_workers=3, rate_limit=NOTION_RATE_LIMIT,
+                         chunksize=None, duplicates=None):
     """
     CSVファイルの全データをNotionにアップロードする
+
+    複数ワーカーが共有のトークンバケットからリクエスト枠を取得して並行アップロードする。
+    CSVはchunksize行ずつ読み込んでアップローダーに流すため、ファイルが大きくてもメモリ使用量は増えない。
+    duplicatesが canonical / link の場合は、歌詞がほぼ同じ曲のクラスタ（重複検出の索引）ごとに
+    代表の1曲だけをアップロードする。
     
     Args:
         csv_filepath (str): CSVファイルのパス
-        batch_size (int): バッチサイズ（一度に処理する件数）
-        delay_between_requests (float): リクエスト間の待機時間（秒）
+        batch_size (int): 連続して送信できる最大件数（トークンバケットの容量）
+        delay_between_requests (float): リクエスト間の最小間隔（秒）。指定時はrate_limitより優先して遅くする
+        max_workers (int): 同時にアップロードするワーカー数
+        rate_limit (float): 平均リクエスト数の上限（件/秒）
+        chunksize (int): CSVを一度に読み込む行数（省略時はUPLOAD_CSV_CHUNKSIZE）
+        duplicates (str): 歌詞がほぼ同じ曲の扱い（all / canonical / link。省略時はNOTION_DUPLICATE_MODE）
     
     Returns:
         dict: アップロード結果の統計情報
     """
     if not os.path.exists(csv_filepath):
-        print(f"CSVファイルが見つかりません: {csv_filepath}")
+        log_event("csv_missing", f"CSVファイルが見つかりません: {csv_filepath}", level=logging.WARNING, path=csv_filepath)
         return {"success": 0, "failed": 0, "total": 0}
+
+    # 歌詞がほぼ同じ曲は代表以外をアップロードしない
+    variant_song_ids, variants_by_canonical = _near_duplicate_variants(csv_filepath, duplicates)
     
-    # CSVファイルを読み込み
+    # 既にNotionに存在するsong_idをチェック（オプション）
+    existing_song_ids = set(get_existing_notion_song_ids())
+    skipped_song_ids = existing_song_ids | variant_song_ids
+
+    # 件数だけを先にsong_id列から数える（歌詞本文は読み込まない）
     try:
-        df = pd.read_csv(csv_filepath)
-        print(f"CSVファイルを読み込みました: {len(df)}件のデータ")
+        row_count = 0
+        total_count = 0
+        for song_id in iter_lyrics_column(csv_filepath, 'song_id'):
+            row_count += 1
+            if _normalize_song_id(song_id) not in skipped_song_ids:
+                total_count += 1
+        log_event("csv_loaded", f"CSVファイルを読み込みました: {row_count}件のデータ", path=csv_filepath, rows=row_count)
     except Exception as e:
-        print(f"CSVファイルの読み込みに失敗しました: {e}")
+        log_event("csv_read_failed", f"CSVファイルの読み込みに失敗しました: {e}", level=logging.ERROR,
+                  path=csv_filepath, error=str(e), error_type=type(e).__name__)
         return {"success": 0, "failed": 0, "total": 0}
     
-    # 既にNotionに存在するsong_idをチェック（オプション）
-    existing_song_ids = get_existing_notion_song_ids()
-    
     # アップロード対象をフィルタリング
-    if existing_song_ids:
-        df_to_upload = df[~df['song_id'].astype(str).isin(existing_song_ids)]
-        print(f"既にNotionに存在する{len(df) - len(df_to_upload)}件をスキップします。")
-        print(f"新規アップロード対象: {len(df_to_upload)}件")
+    if skipped_song_ids:
+        log_event("upload_targets", f"既にNotionに存在する曲と別バージョンの{row_count - total_count}件をスキップします。\n"
+                  f"新規アップロード対象: {total_count}件", skipped=row_count - total_count, total=total_count)
     else:
-        df_to_upload = df
-        print(f"全{len(df_to_upload)}件をアップロードします。")
+        log_event("upload_targets", f"全{total_count}件をアップロードします。", skipped=0, total=total_count)
     
-    if len(df_to_upload) == 0:
-        print("アップロードする新しいデータがありません。")
+    if total_count == 0:
+        log_event("upload_skipped", "アップロードする新しいデータがありません。")
         return {"success": 0, "failed": 0, "total": 0}
-    
-    # 結果カウンター
-    success_count = 0
-    failed_count = 0
-    total_count = len(df_to_upload)
-    
-    # プログレスバーを設定
-    progress_bar = tqdm(df_to_upload.iterrows(), total=total_count, desc="Notionにアップロード中")
-    
-    # バッチ処理
-    for i, (index, row) in enumerate(progress_bar):
-        song_data = row.to_dict()
-        
-        # Notionにアップロード
-        if upload_to_notion(song_data):
-            success_count += 1
-            progress_bar.set_description(f"成功: {success_count}, 失敗: {failed_count}")
-        else:
-            failed_count += 1
-            progress_bar.set_description(f"成功: {success_count}, 失敗: {failed_count}")
-        
-        # バッチ間での待機
-        if (i + 1) % batch_size == 0:
-            time.sleep(delay_between_requests * 2)  # バッチ後は長めに待機
-        else:
-            time.sleep(delay_between_requests)
+
+    # レートを決定（リクエスト間隔が指定されていればそれ以下に抑える）
+    rate = rate_limit
+    if delay_between_requests:
+        rate = min(rate, 1.0 / delay_between_requests)
+    uploader = NotionUploader(
+        lambda song_data, limiter: upload_to_notion(song_data, limiter=limiter),
+        max_workers=max_workers,
+        rate=rate,
+        burst=batch_size,
+    )
+    
+    # プログレスバーを設定（スループットと待ち行列の長さを表示）
+    progress_bar = tqdm(total=total_count, desc="Notionにアップロード中")
+
+    def on_progress(stats):
+        progress_bar.update(1)
+        progress_bar.set_description(f"成功: {stats['success']}, 失敗: {stats['failed']}")
+        progress_bar.set_postfix(rate=f"{stats['throughput']:.2f}/s", queued=stats['queued'], refresh=False)
+
+    records = (
+        _with_variants(record, variants_by_canonical)
+        for record in iter_lyrics_records(csv_filepath, chunksize=chunksize or UPLOAD_CSV_CHUNKSIZE)
+        if _normalize_song_id(record.get('song_id')) not in skipped_song_ids
+    )
+    counts = uploader.run(records, on_progress=on_progress)
     
     progress_bar.close()
+    success_count = counts["success"]
+    failed_count = counts["failed"]
     
     result = {
         "success": success_count,
@@ -528,13 +1767,46 @@ def upload_csv_to_notion(csv_filepath, batch_size=10, delay_between_requests=1.0
         "total": total_count
     }
     
-    print(f"\nアップロード完了!")
-    print(f"成功: {success_count}件")
-    print(f"失敗: {failed_count}件")
-    print(f"合計: {total_count}件")
+    log_event("upload_finished", f"\nアップロード完了!\n成功: {success_count}件\n失敗: {failed_count}件\n合計: {total_count}件",
+              filepath=csv_filepath, **result)
     
     return result
 
+def _near_duplicate_variants(csv_filepath, duplicates=None):
+    """
+    歌詞がほぼ同じ曲のうち、代表以外の曲（Notionに送らない曲）を調べる
+
+    Args:
+        csv_filepath (str): CSVファイルのパス
+        duplicates (str): all / canonical / link（省略時はNOTION_DUPLICATE_MODE）
+
+    Returns:
+        tuple: (代表以外のsong_idの集合, linkモードの場合は {代表のsong_id: 他のバージョンのリスト})
+    """
+    duplicates = duplicates or NOTION_DUPLICATE_MODE
+    if duplicates not in NOTION_DUPLICATE_MODES:
+        raise ValueError(f"duplicatesは{'/'.join(NOTION_DUPLICATE_MODES)}のいずれかです: {duplicates!r}")
+    variant_song_ids = set()
+    variants_by_canonical = {}
+    if duplicates != "all":
+        for canonical_id, members in get_near_duplicate_clusters(csv_filepath).items():
+            variants = [member for member in members if member['song_id'] != canonical_id]
+            variant_song_ids.update(member['song_id'] for member in variants)
+            if duplicates == "link":
+                variants_by_canonical[canonical_id] = variants
+        if variant_song_ids:
+            log_event("near_duplicates_skipped", f"歌詞がほぼ同じ別バージョン{len(variant_song_ids)}件は代表の曲だけを送信します。",
+                      mode=duplicates, variants=len(variant_song_ids))
+    return variant_song_ids, variants_by_canonical
+
+def _with_variants(record, variants_by_canonical):
+    """代表の曲の楽曲データに、他のバージョンの一覧（variants）を加える"""
+    variants = variants_by_canonical.get(_normalize_song_id(record.get('song_id')))
+    if not variants:
+        return record
+    lines = [f"{member['song_id']} {member['title']} / {member['artist']}" for member in variants]
+    return {**record, 'variants': "\n".join(lines)}
+
 def get_existing_notion_song_ids():
     """
     Notionデータベースから既存のsong_idリストを取得する
@@ -542,11 +1814,35 @@ def get_existing_notion_song_ids():
     Returns:
         list: 既存のsong_idのリスト
     """
+    return list(get_existing_notion_pages().keys())
+
+def get_existing_notion_pages():
+    """
+    Notionデータベースから既存ページのsong_id → ページIDの対応を取得する
+
+    状態DBが有効な場合はローカルミラーを差分更新して返す（全件走査しない）。
+
+    Returns:
+        dict: {song_id: page_id}
+    """
+    if get_state_store() is not None:
+        return refresh_notion_mirror()
+    return {song_id: page_id for song_id, page_id, _ in _iter_notion_pages()}
+
+def _iter_notion_pages(query_filter=None, filter_properties=None, errors=None):
+    """
+    Notionデータベースのページを順に取得し、(song_id, page_id, last_edited_time) を返す
+
+    Args:
+        query_filter (dict): データベースクエリのfilter
+        filter_properties (list): 取得するプロパティのID（省略時は全プロパティ）
+        errors (list): 取得に失敗した場合にエラー内容を追加するリスト
+    """
     if not NOTION_TOKEN or not NOTION_DATABASE_ID:
-        return []
+        return
     
-    url = f"https://api.notion.com/v1/databases/{NOTION_DATABASE_ID}/query"
-    existing_ids = []
+    url = f"{NOTION_API_BASE_URL}/databases/{NOTION_DATABASE_ID}/query"
+    params = {"filter_properties": filter_properties} if filter_properties else None
     start_cursor = None
     
     try:
@@ -554,11 +1850,18 @@ def get_existing_notion_song_ids():
             payload = {"page_size": 100}
             if start_cursor:
                 payload["start_cursor"] = start_cursor
+            if query_filter:
+                payload["filter"] = query_filter
             
-            response = requests.post(url, headers=NOTION_HEADERS, json=payload)
+            with metrics.span("notion_query"):
+                response = http_client.post(url, headers=NOTION_HEADERS, json=payload, params=params)
+            metrics.inc("http_responses_total", service="notion", status=response.status_code)
             
             if response.status_code != 200:
-                print(f"Notionからのデータ取得でエラーが発生しました: {response.status_code}")
+                log_event("notion_query_error", f"Notionからのデータ取得でエラーが発生しました: {response.status_code}",
+                          level=logging.ERROR, status=response.status_code)
+                if errors is not None:
+                    errors.append(response.status_code)
                 break
             
             data = response.json()
@@ -567,20 +1870,227 @@ def get_existing_notion_song_ids():
                 props = page.get("properties", {})
                 song_id_prop = props.get("song_id", {})
                 if song_id_prop.get("number") is not None:
-                    existing_ids.append(str(song_id_prop["number"]))
+                    song_id = _normalize_song_id(song_id_prop["number"])
+                    yield song_id, page.get("id"), page.get("last_edited_time")
             
             if not data.get("has_more", False):
                 break
             
             start_cursor = data.get("next_cursor")
             time.sleep(0.5)  # レートリミット対策
+            metrics.observe("throttle_wait_seconds", 0.5, service="notion")
             
     except Exception as e:
-        print(f"既存データの取得中にエラーが発生しました: {e}")
-    
-    return existing_ids
+        log_event("notion_query_failed", f"既存データの取得中にエラーが発生しました: {e}", level=logging.ERROR,
+                  error=str(e), error_type=type(e).__name__)
+        if errors is not None:
+            errors.append(e)
+
+def _get_notion_song_id_property_id(store):
+    """song_idプロパティのIDを取得する（filter_properties用。状態DBにキャッシュする）"""
+    property_id = store.get_meta('notion_song_id_property_id')
+    if property_id:
+        return property_id
+    try:
+        url = f"{NOTION_API_BASE_URL}/databases/{NOTION_DATABASE_ID}"
+        response = http_client.get(url, headers=NOTION_HEADERS)
+        if response.status_code == 200:
+            property_id = response.json().get("properties", {}).get("song_id", {}).get("id")
+    except Exception as e:
+        log_event("notion_database_failed", f"Notionデータベースの情報取得中にエラーが発生しました: {e}",
+                  level=logging.WARNING, error=str(e), error_type=type(e).__name__)
+    if property_id:
+        store.set_meta('notion_song_id_property_id', property_id)
+    return property_id
+
+def refresh_notion_mirror(full=False):
+    """
+    Notionデータベースのローカルミラー（song_id → page_id）を更新する
+
+    前回の更新以降に編集されたページだけをlast_edited_timeで絞り込み、
+    song_idプロパティだけを取得する。Notion側で削除・アーカイブされたページは
+    差分更新では検出できないため、必要に応じてfull=Trueで取り直す。
+
+    Args:
+        full (bool): Trueならミラーを空にして全件取得する
+
+    Returns:
+        dict: {song_id: page_id}
+    """
+    store = get_state_store()
+    if store is None:
+        return get_existing_notion_pages()
+    if not NOTION_TOKEN or not NOTION_DATABASE_ID:
+        return {}
+
+    cursor_key = f'notion_mirror_cursor:{NOTION_DATABASE_ID}'
+    cursor = None if full else store.get_meta(cursor_key)
+    if cursor is None:
+        # 初回（または別のデータベース）は全件取り直す
+        store.clear_mirror()
+
+    query_filter = None
+    if cursor:
+        query_filter = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": cursor}}
+    property_id = _get_notion_song_id_property_id(store)
+
+    errors = []
+    entries = list(_iter_notion_pages(query_filter, [property_id] if property_id else None, errors=errors))
+    store.upsert_mirror(entries)
+
+    # 全ページを取得できた場合だけ次回の起点を進める
+    edited_times = [edited for _, _, edited in entries if edited]
+    if not errors and edited_times:
+        store.set_meta(cursor_key, max(edited_times + ([cursor] if cursor else [])))
+
+    mode = "全件" if cursor is None else "差分"
+    log_event("notion_mirror_refreshed", f"Notionミラーを{mode}更新しました: 取得 {len(entries)}件",
+              full=cursor is None, pages=len(entries))
+    return store.mirror_pages()
+
+def sync_csv_to_notion(csv_filepath, batch_size=3, max_workers=3, rate_limit=NOTION_RATE_LIMIT, duplicates=None):
+    """
+    CSVファイルの内容をNotionに差分同期する（作成 + 変更があったページのみ更新）
+
+    各行をconvert_to_notion_formatで変換したプロパティのハッシュを、状態DBに記録された
+    前回送信時のハッシュと比較する。同じならAPIを呼ばずにスキップし、
+    異なるページだけをPATCHする。Notionに無い曲は新規作成する。
+    歌詞がほぼ同じ曲はupload_csv_to_notionと同じく代表の曲だけを送信する（linkモードでは
+    他のバージョンの一覧を含めてハッシュを計算するので、一覧が変わらなければ送信しない）。
+
+    Args:
+        csv_filepath (str): CSVファイルのパス
+        batch_size (int): 連続して送信できる最大件数（トークンバケットの容量）
+        max_workers (int): 同時に処理するワーカー数
+        rate_limit (float): 平均リクエスト数の上限（件/秒）
+        duplicates (str): 歌詞がほぼ同じ曲の扱い（all / canonical / link。省略時はNOTION_DUPLICATE_MODE）
+
+    Returns:
+        dict: {"created", "updated", "unchanged", "failed", "total"} の件数
+    """
+    result = {"created": 0, "updated": 0, "unchanged": 0, "failed": 0, "total": 0}
+    store = get_state_store()
+    if store is None:
+        log_event("state_db_required", "差分同期には状態DBが必要です（STATE_DB_PATHを設定してください）。", level=logging.WARNING)
+        return result
+    if not os.path.exists(csv_filepath):
+        log_event("csv_missing", f"CSVファイルが見つかりません: {csv_filepath}", level=logging.WARNING, path=csv_filepath)
+        return result
+    variant_song_ids, variants_by_canonical = _near_duplicate_variants(csv_filepath, duplicates)
+
+    # 状態DBに無いページIDだけNotionから補完する（この段階ではsong_id列だけを読む）
+    sync_state = store.notion_sync_state()
+    known_pages = {song_id: page_id for song_id, (page_id, _) in sync_state.items()}
+    song_ids = [song_id for song_id in map(_normalize_song_id, iter_lyrics_column(csv_filepath, 'song_id'))
+                if song_id not in variant_song_ids]
+    result["total"] = len(song_ids)
+    log_event("csv_loaded", f"CSVファイルを読み込みました: {len(song_ids)}件のデータ", path=csv_filepath, rows=len(song_ids))
+    if any(song_id not in known_pages for song_id in song_ids if song_id is not None):
+        for song_id, page_id in get_existing_notion_pages().items():
+            known_pages.setdefault(song_id, page_id)
+    del song_ids
+
+    counts_lock = threading.Lock()
+
+    def sync_one(item, limiter):
+        page_id, record = item
+        if page_id is None:
+            ok, key = upload_to_notion(record, limiter=limiter), "created"
+        else:
+            ok, key = update_notion_page(page_id, record, limiter=limiter), "updated"
+        with counts_lock:
+            result[key if ok else "failed"] += 1
+        return ok
+
+    uploader = NotionUploader(sync_one, max_workers=max_workers, rate=rate_limit, burst=batch_size)
+    # 変更の無い行も進捗に数える（送信対象の件数は読み終わるまで分からないため）
+    progress_bar = tqdm(total=result["total"], desc="Notionと同期中")
+    sent = 0
+
+    def on_progress(stats):
+        progress_bar.update(1)
+        progress_bar.set_postfix(rate=f"{stats['throughput']:.2f}/s", queued=stats['queued'], refresh=False)
+
+    def changed_records():
+        # 送信が必要な行だけを読みながら渡す（CSV全体をメモリに載せない）
+        nonlocal sent
+        for record in iter_lyrics_records(csv_filepath, chunksize=UPLOAD_CSV_CHUNKSIZE):
+            song_id = _normalize_song_id(record.get('song_id'))
+            if song_id in variant_song_ids:
+                continue
+            record = _with_variants(record, variants_by_canonical)
+            page_id = known_pages.get(song_id)
+            stored_hash = sync_state.get(song_id, (None, None))[1]
+            if page_id is not None and stored_hash == notion_properties_hash(convert_to_notion_format(record)):
+                result["unchanged"] += 1
+                progress_bar.update(1)
+                continue
+            sent += 1
+            yield page_id, record
+
+    uploader.run(changed_records(), on_progress=on_progress)
+    progress_bar.close()
+    # 例外で終了した項目も失敗として数える
+    result["failed"] = sent - result["created"] - result["updated"]
+
+    log_event("sync_finished", f"作成: {result['created']}件, 更新: {result['updated']}件, "
+              f"変更なし: {result['unchanged']}件, 失敗: {result['failed']}件", filepath=csv_filepath, **result)
+    return result
 
 # Jupyter notebook用の簡潔な関数群
+def show_pipeline_status():
+    """
+    状態DBに記録された発見・取得・アップロードの件数を表示する
+
+    Returns:
+        dict: StateStore.status_counts()の結果（状態DBが無効ならNone）
+    """
+    store = get_state_store()
+    if store is None:
+        print("状態DBは無効です（STATE_DB_PATH = None）。")
+        return None
+    counts = store.status_counts()
+    print(f"登録曲数: {counts['total']}件")
+    print(f"スクレイピング: " + ", ".join(f"{k}={v}" for k, v in sorted(counts['scrape'].items())))
+    print(f"アップロード: " + ", ".join(f"{k}={v}" for k, v in sorted(counts['upload'].items())))
+    return counts
+
+def show_http_stats():
+    """
+    HTTP接続の再利用状況を表示する
+
+    Returns:
+        dict: ホストごとの統計（requests, connections, reused）
+    """
+    stats = http_client.stats()
+    if not stats:
+        print("まだHTTPリクエストは送信されていません。")
+        return stats
+    for host, host_stats in stats.items():
+        print(f"{host}: リクエスト {host_stats['requests']}件 / 新規接続 {host_stats['connections']}件 / "
+              f"再利用 {host_stats['reused']}件")
+    return stats
+
+def show_metrics(filepath=None):
+    """
+    ステージごとの所要時間（ネットワーク・解析・書き込み・Notionの待ち時間など）を表示する
+
+    Args:
+        filepath (str): 指定時は集計をファイルにも書き出す（.promならPrometheus形式、それ以外はJSON）
+
+    Returns:
+        dict: metrics.snapshot()の結果
+    """
+    snapshot = metrics.snapshot()
+    print(metrics.format_summary())
+    waits = {entry["labels"].get("service"): entry["sum"] for entry in snapshot["histograms"].get("throttle_wait_seconds", [])}
+    if waits:
+        print("レート制御の待ち時間: " + ", ".join(f"{service} {seconds:.1f}秒" for service, seconds in sorted(waits.items())))
+    if filepath:
+        metrics.write(filepath)
+        print(f"計測結果を{filepath}に書き出しました。")
+    return snapshot
+
 def check_notion_setup():
     """
     Notion APIの設定状況を確認し、結果を表示する
@@ -604,26 +2114,30 @@ def check_notion_setup():
             return True
             
     except Exception as e:
-        print(f"❌ 設定確認中にエラーが発生しました: {e}")
+        log_event("notion_config_check_failed", f"❌ 設定確認中にエラーが発生しました: {e}", level=logging.ERROR,
+                  error=str(e), error_type=type(e).__name__)
         return False
 
 def check_csv_data(csv_file='lyrics_data.csv'):
     """
     CSVファイルの存在と内容を確認し、結果を表示する
+
+    歌詞本文は読み込まない（件数はParquetならメタデータ、CSVならsong_id列だけから数え、
+    サンプルは先頭の数行の表示する列だけを読む）。
     
     Args:
-        csv_file (str): チェック対象のCSVファイルパス
+        csv_file (str): チェック対象のCSV（またはParquet）ファイルパス
     
     Returns:
         bool: CSVファイルが存在し、読み込み可能な場合True
     """
     try:
         if os.path.exists(csv_file):
-            df = pd.read_csv(csv_file)
+            row_count = count_lyrics_rows(csv_file)
             print(f"✅ {csv_file}が見つかりました。")
-            print(f"総レコード数: {len(df)}件")
+            print(f"総レコード数: {row_count}件")
             print(f"\nデータサンプル:")
-            print(df[['song_id', 'title', 'artist', 'release_date']].head())
+            print(read_lyrics_head(csv_file, columns=['song_id', 'title', 'artist', 'release_date']))
             return True
         else:
             print(f"❌ {csv_file}が見つかりません。")
@@ -631,7 +2145,8 @@ def check_csv_data(csv_file='lyrics_data.csv'):
             return False
             
     except Exception as e:
-        print(f"❌ CSVファイル確認中にエラーが発生しました: {e}")
+        log_event("csv_check_failed", f"❌ CSVファイル確認中にエラーが発生しました: {e}", level=logging.ERROR,
+                  path=csv_file, error=str(e), error_type=type(e).__name__)
         return False
 
 def check_existing_notion_data():
@@ -654,7 +2169,8 @@ def check_existing_notion_data():
         return existing_ids
         
     except Exception as e:
-        print(f"❌ 既存データ確認中にエラーが発生しました: {e}")
+        log_event("notion_query_failed", f"❌ 既存データ確認中にエラーが発生しました: {e}", level=logging.ERROR,
+                  error=str(e), error_type=type(e).__name__)
         return []
 
 def test_notion_upload(csv_file='lyrics_data.csv'):
@@ -672,10 +2188,8 @@ def test_notion_upload(csv_file='lyrics_data.csv'):
             print(f"❌ {csv_file}が見つかりません。")
             return False
         
-        df = pd.read_csv(csv_file)
-        
         # 最初の1件を取得
-        test_data = df.iloc[0].to_dict()
+        test_data = read_lyrics_head(csv_file, n=1).iloc[0].to_dict()
         
         print(f"🧪 テストデータ: song_id={test_data['song_id']}, title={test_data['title']}")
         
@@ -692,17 +2206,20 @@ def test_notion_upload(csv_file='lyrics_data.csv'):
             return False
             
     except Exception as e:
-        print(f"❌ テストアップロード中にエラーが発生しました: {e}")
+        log_event("notion_test_upload_failed", f"❌ テストアップロード中にエラーが発生しました: {e}",
+                  level=logging.ERROR, path=csv_file, error=str(e), error_type=type(e).__name__)
         return False
 
-def run_full_notion_upload(csv_file='lyrics_data.csv', batch_size=5, delay=1.5):
+def run_full_notion_upload(csv_file='lyrics_data.csv', batch_size=3, delay=None, max_workers=3, duplicates=None):
     """
     全データのNotionアップロードを実行する（エラーハンドリング込み）
     
     Args:
         csv_file (str): CSVファイルのパス
-        batch_size (int): バッチサイズ
-        delay (float): リクエスト間隔（秒）
+        batch_size (int): 連続して送信できる最大件数
+        delay (float): リクエスト間の最小間隔（秒）。Noneならレート上限（NOTION_RATE_LIMIT）まで送信する
+        max_workers (int): 同時にアップロードするワーカー数
+        duplicates (str): 歌詞がほぼ同じ曲の扱い（all / canonical / link）
     
     Returns:
         dict: アップロード結果の統計情報
@@ -713,12 +2230,15 @@ def run_full_notion_upload(csv_file='lyrics_data.csv', batch_size=5, delay=1.5):
             return {"success": 0, "failed": 0, "total": 0, "error": "CSV file not found"}
         
         print("🚀 全データのアップロードを開始します...")
-        print(f"設定: バッチサイズ={batch_size}件, リクエスト間隔={delay}秒")
+        rate_text = f"リクエスト間隔={delay}秒" if delay else f"平均{NOTION_RATE_LIMIT}件/秒"
+        print(f"設定: バッチサイズ={batch_size}件, ワーカー数={max_workers}, {rate_text}")
         
         result = upload_csv_to_notion(
             csv_filepath=csv_file,
             batch_size=batch_size,
-            delay_between_requests=delay
+            delay_between_requests=delay,
+            max_workers=max_workers,
+            duplicates=duplicates,
         )
         
         print(f"\n📊 最終結果:")
@@ -735,18 +2255,23 @@ def run_full_notion_upload(csv_file='lyrics_data.csv', batch_size=5, delay=1.5):
         return result
         
     except Exception as e:
-        print(f"❌ アップロード中に予期しないエラーが発生しました: {e}")
+        log_event("upload_failed", f"❌ アップロード中に予期しないエラーが発生しました: {e}", level=logging.ERROR,
+                  path=csv_file, error=str(e), error_type=type(e).__name__)
         return {"success": 0, "failed": 0, "total": 0, "error": str(e)}
 
-def notion_upload_workflow(csv_file='lyrics_data.csv', skip_test=False, batch_size=5, delay=1.5):
+@profiled("notion_upload_workflow")
+def notion_upload_workflow(csv_file='lyrics_data.csv', skip_test=False, batch_size=3, delay=None, max_workers=3,
+                           duplicates=None):
     """
     Notionアップロードの全ワークフローを実行する
     
     Args:
         csv_file (str): CSVファイルのパス
         skip_test (bool): テストアップロードをスキップするか
-        batch_size (int): バッチサイズ
-        delay (float): リクエスト間隔（秒）
+        batch_size (int): 連続して送信できる最大件数
+        delay (float): リクエスト間の最小間隔（秒）。Noneならレート上限まで送信する
+        max_workers (int): 同時にアップロードするワーカー数
+        duplicates (str): 歌詞がほぼ同じ曲の扱い（all / canonical / link）
     
     Returns:
         dict: 実行結果
@@ -778,7 +2303,7 @@ def notion_upload_workflow(csv_file='lyrics_data.csv', skip_test=False, batch_si
         print("\n" + "="*50 + "\n")
     
     # Step 5: 全データアップロード
-    result = run_full_notion_upload(csv_file, batch_size, delay)
+    result = run_full_notion_upload(csv_file, batch_size, delay, max_workers, duplicates=duplicates)
     
     if result.get("error"):
         return {"status": "failed", "step": "full_upload", "message": result["error"], "result": result}
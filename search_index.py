@@ -0,0 +1,366 @@
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+import zlib
+from array import array
+from collections import defaultdict
+from itertools import accumulate, chain
+
+from metrics import log_event
+
+# 索引する列（postingsのfield列にはこの並びの番号を入れる）
+SEARCH_FIELDS = ("lyrics", "title", "main_theme")
+
+# 索引するn-gramの文字数。日本語は空白で単語に分けられないので文字単位で切る
+# （1文字の検索語のためにユニグラムも持つ。3文字以上の検索語はトライグラムで引く）
+NGRAM_SIZES = (1, 2, 3)
+
+# この件数の曲がたまるたびに、1つのセグメントとしてposting listを書き出す
+FLUSH_DOCS = 1000
+
+# 閉じるときにセグメントがこの数を超えていれば、1つにまとめ直す
+MAX_SEGMENTS = 16
+
+# 候補がこの件数以下になったら、残りのn-gramを引かずに本文と照合して絞り込む
+VERIFY_THRESHOLD = 200
+
+_WHITESPACE = re.compile(r"\s+")
+_QUERY_TERM = re.compile(r'"([^"]+)"|(\S+)')
+
+
+def search_index_path_for(csv_filepath):
+    """歌詞CSVと同じ名前の索引のパス（lyrics_data_134.csv → lyrics_data_134.search.sqlite3）"""
+    root, _ = os.path.splitext(csv_filepath)
+    return root + ".search.sqlite3"
+
+
+def normalize_text(value):
+    """索引と検索語で表記をそろえる（NFKC正規化・小文字化・空白の連続を1つに）"""
+    if value is None or value != value:  # NaN
+        return ""
+    text = unicodedata.normalize("NFKC", str(value)).lower()
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def text_ngrams(text):
+    """正規化済みの文字列に含まれるn-gramの集合"""
+    grams = set()
+    for size in NGRAM_SIZES:
+        grams.update(text[i:i + size] for i in range(len(text) - size + 1))
+    return grams
+
+
+def parse_query(query):
+    """
+    検索文字列を検索語に分ける
+
+    空白で区切った語はすべてを含む曲（AND）を探す。空白を含むフレーズは "..." で囲む。
+    """
+    terms = []
+    for quoted, bare in _QUERY_TERM.findall(query or ""):
+        term = normalize_text(quoted or bare)
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def encode_postings(song_ids):
+    """昇順のsong_idのリストを差分にして32ビット整数の配列にし、zlibで圧縮する"""
+    deltas = array("I", chain(song_ids[:1], (b - a for a, b in zip(song_ids, song_ids[1:]))))
+    if sys.byteorder == "big":
+        deltas.byteswap()
+    return zlib.compress(deltas.tobytes())
+
+
+def decode_postings(data):
+    """encode_postingsの逆（展開・差分の累積はどちらもCで行われる）"""
+    deltas = array("I")
+    deltas.frombytes(zlib.decompress(data))
+    if sys.byteorder == "big":
+        deltas.byteswap()
+    return list(accumulate(deltas))
+
+
+class SearchIndex:
+    """
+    歌詞・タイトル・主題歌情報の文字n-gramの転置索引（SQLite）
+
+    曲を追加するたびにメモリ上のposting listに積み、FLUSH_DOCS件ごとにn-gram・列ごとの
+    圧縮したposting list（セグメント）として書き出す。検索語はn-gramに分け、件数の少ない
+    posting listから順に積集合を取る。n-gramがすべて含まれていても連続しているとは限らないので、
+    検索語がn-gramより長い場合は最後に本文と照合する（歌詞の本文はtext_sourceから読む。
+    text_sourceが無い場合はn-gramの一致だけで判定し、text_sourceで読めなかった曲は結果から除く）。
+    """
+
+    def __init__(self, path, text_source=None):
+        """
+        Args:
+            path (str): データベースファイルのパス
+            text_source (callable): song_idのリストを受け取って {song_id: 歌詞} を返す関数（フレーズの照合に使う）
+        """
+        self.path = path
+        self.text_source = text_source
+        # 直前の検索で、歌詞を読めず照合できなかったために除いた候補の数
+        self.unverified = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                song_id INTEGER PRIMARY KEY,
+                title TEXT,
+                main_theme TEXT
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                gram TEXT NOT NULL,
+                field INTEGER NOT NULL,
+                segment INTEGER NOT NULL,
+                doc_count INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (gram, field, segment)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+        self._conn.commit()
+        # 前回の書き込みが閉じられずに終わっていれば、書き出していない曲が抜けている
+        self.needs_reconcile = self._get_meta("dirty") == "1"
+        # 列ごとの {n-gram: [song_id, ...]}
+        self._buffers = [defaultdict(list) for _ in SEARCH_FIELDS]
+        self._pending = {}
+        self._dirty = False
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def add(self, song_data):
+        """
+        1曲を索引に追加する（索引済みの曲は追加しない）
+
+        Returns:
+            bool: 追加した場合True
+        """
+        song_id = int(str(song_data["song_id"]).strip())
+        with self._lock:
+            if song_id in self._pending or self._conn.execute(
+                    "SELECT 1 FROM docs WHERE song_id = ?", (song_id,)).fetchone():
+                return False
+            if not self._dirty:
+                self._set_meta("dirty", 1)
+                self._conn.commit()
+                self._dirty = True
+            for field, buffer in zip(SEARCH_FIELDS, self._buffers):
+                for gram in text_ngrams(normalize_text(song_data.get(field))):
+                    buffer[gram].append(song_id)
+            self._pending[song_id] = (song_data.get("title") or "", song_data.get("main_theme") or "")
+            should_flush = len(self._pending) >= FLUSH_DOCS
+        if should_flush:
+            self.flush()
+        return True
+
+    def flush(self):
+        """たまっている曲を1つのセグメントとして書き出す"""
+        with self._lock:
+            if not self._pending:
+                return
+            segment = int(self._get_meta("next_segment") or 0)
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO postings (gram, field, segment, doc_count, data) VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (gram, field_index, segment, len(song_ids), encode_postings(sorted(song_ids)))
+                        for field_index, buffer in enumerate(self._buffers)
+                        for gram, song_ids in buffer.items()
+                    ),
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO docs (song_id, title, main_theme) VALUES (?, ?, ?)",
+                    ((song_id, title, main_theme) for song_id, (title, main_theme) in self._pending.items()),
+                )
+                self._set_meta("next_segment", segment + 1)
+                self._set_meta("segments", int(self._get_meta("segments") or 0) + 1)
+            self._buffers = [defaultdict(list) for _ in SEARCH_FIELDS]
+            self._pending = {}
+
+    def optimize(self):
+        """全セグメントをn-gram・列ごとに1つのposting listにまとめ直す"""
+        self.flush()
+        with self._lock, self._conn:
+            self._conn.execute("DROP TABLE IF EXISTS postings_merged")
+            self._conn.execute(
+                "CREATE TABLE postings_merged (gram TEXT NOT NULL, field INTEGER NOT NULL, segment INTEGER NOT NULL, "
+                "doc_count INTEGER NOT NULL, data BLOB NOT NULL, PRIMARY KEY (gram, field, segment)) WITHOUT ROWID"
+            )
+            rows = self._conn.execute("SELECT gram, field, data FROM postings ORDER BY gram, field")
+            merged = []
+            current, song_ids = None, []
+            for gram, field_index, data in chain(rows, [(None, None, None)]):
+                if (gram, field_index) != current:
+                    if current is not None:
+                        song_ids.sort()
+                        merged.append((current[0], current[1], 0, len(song_ids), encode_postings(song_ids)))
+                        if len(merged) >= 10000:
+                            self._insert_merged(merged)
+                            merged = []
+                    current, song_ids = (gram, field_index), []
+                if data is not None:
+                    song_ids.extend(decode_postings(data))
+            self._insert_merged(merged)
+            self._conn.execute("DROP TABLE postings")
+            self._conn.execute("ALTER TABLE postings_merged RENAME TO postings")
+            self._set_meta("next_segment", 1)
+            self._set_meta("segments", 1)
+        with self._lock:
+            # 古いセグメントの分の空きページをファイルから取り除く
+            self._conn.execute("VACUUM")
+
+    def _insert_merged(self, rows):
+        self._conn.executemany(
+            "INSERT INTO postings_merged (gram, field, segment, doc_count, data) VALUES (?, ?, ?, ?, ?)", rows
+        )
+
+    def close(self):
+        """たまっている曲を書き出し、セグメントが多ければまとめ直して閉じる"""
+        if self._conn is None:
+            return
+        self.flush()
+        if int(self._get_meta("segments") or 0) > MAX_SEGMENTS:
+            self.optimize()
+        if self._dirty:
+            with self._conn:
+                self._set_meta("dirty", 0)
+        self._conn.close()
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0] + len(self._pending)
+
+    def _doc_count(self, gram, field_index):
+        row = self._conn.execute(
+            "SELECT SUM(doc_count) FROM postings WHERE gram = ? AND field = ?", (gram, field_index)
+        ).fetchone()
+        return row[0] or 0
+
+    def _postings(self, gram, field_index):
+        rows = self._conn.execute(
+            "SELECT data FROM postings WHERE gram = ? AND field = ?", (gram, field_index)
+        ).fetchall()
+        if len(rows) == 1:
+            return decode_postings(rows[0][0])
+        return list(chain.from_iterable(decode_postings(data) for data, in rows))
+
+    def _texts(self, song_ids, field):
+        """候補の曲の正規化した本文 {song_id: 本文}（読めない曲は含めない）"""
+        if field == "lyrics":
+            lyrics = self.text_source([str(song_id) for song_id in song_ids])
+            return {int(song_id): normalize_text(text) for song_id, text in lyrics.items() if text is not None}
+        texts = {}
+        ordered = list(song_ids)
+        for start in range(0, len(ordered), 500):
+            chunk = ordered[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT song_id, {field} FROM docs WHERE song_id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            texts.update((song_id, normalize_text(value)) for song_id, value in rows)
+        return texts
+
+    def _match_term(self, term, field, restrict=None):
+        """1つの検索語をfieldに含む曲の集合（restrictを指定するとその中から探す）"""
+        field_index = SEARCH_FIELDS.index(field)
+        size = min(max(NGRAM_SIZES), len(term))
+        grams = {term[i:i + size] for i in range(len(term) - size + 1)}
+        counts = {gram: self._doc_count(gram, field_index) for gram in grams}
+        if not all(counts.values()):
+            return set()
+
+        can_verify = field != "lyrics" or self.text_source is not None
+        candidates = restrict
+        exhausted = True
+        for gram in sorted(grams, key=counts.get):
+            if candidates is not None and can_verify and len(candidates) <= VERIFY_THRESHOLD:
+                exhausted = False
+                break
+            postings = self._postings(gram, field_index)
+            candidates = set(postings) if candidates is None else candidates.intersection(postings)
+            if not candidates:
+                return set()
+
+        # 検索語そのものがn-gramなら、posting listの一致で確定している
+        if exhausted and len(grams) == 1 and size == len(term):
+            return candidates
+        if not can_verify:
+            return candidates
+        texts = self._texts(candidates, field)
+        # 本文を読めなかった曲はフレーズを含むか確かめられないので、結果に含めない
+        self.unverified += len(candidates) - len(texts)
+        return {song_id for song_id, text in texts.items() if term in text}
+
+    def search(self, query, fields=SEARCH_FIELDS, limit=None):
+        """
+        検索語をすべて含む曲を探す
+
+        Args:
+            query (str): 空白区切りの検索語（すべてを含む曲を探す。"..."で空白を含むフレーズ）
+            fields (tuple): 探す列（lyrics / title / main_theme。いずれかの列に含まれればよい）
+            limit (int): 返す件数の上限
+
+        Returns:
+            list: 一致した曲のsong_id（昇順）
+        """
+        unknown = [field for field in fields if field not in SEARCH_FIELDS]
+        if unknown:
+            raise ValueError(f"検索できない列です: {', '.join(unknown)}")
+        terms = parse_query(query)
+        if not terms:
+            return []
+        with self._lock:
+            self.unverified = 0
+            result = None
+            # 長い検索語ほど候補が少ないので先に引く
+            for term in sorted(terms, key=len, reverse=True):
+                matches = set()
+                for field in fields:
+                    matches |= self._match_term(term, field, restrict=result)
+                result = matches
+                if not result:
+                    break
+        if self.unverified:
+            log_event("search_unverified",
+                      f"歌詞を読めなかった{self.unverified}件の候補は、検索語を含むか照合できないため結果から除きました。",
+                      level=logging.WARNING, path=self.path, query=query, unverified=self.unverified)
+        song_ids = sorted(result)
+        if limit is not None:
+            song_ids = song_ids[:limit]
+        return [str(song_id) for song_id in song_ids]
+
+    def titles(self, song_ids):
+        """索引に保存したタイトル {song_id: タイトル}"""
+        song_ids = [int(song_id) for song_id in song_ids]
+        with self._lock:
+            texts = {}
+            for start in range(0, len(song_ids), 500):
+                chunk = song_ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT song_id, title FROM docs WHERE song_id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                texts.update((str(song_id), title) for song_id, title in rows)
+        return texts
@@ -0,0 +1,292 @@
+import functools
+import re
+
+# 楽曲ページから取得する項目（CSVの列順と同じ）
+SONG_FIELDS = ['song_id', 'title', 'artist', 'main_theme', 'lyricist', 'composer', 'arranger', 'release_date', 'cover_url', 'lyrics']
+
+# 既定のパーサーバックエンド
+DEFAULT_BACKEND = "lxml-native"
+
+# 楽曲詳細エリアのクラス（完全一致）とタイトルのフォールバック用クラス
+DETAILS_CLASS = "blur-filter row py-3"
+TITLE_FALLBACK_CLASS = "ms-2"
+
+class SongParseError(ValueError):
+    """楽曲ページが想定した構造ではなく、解析できなかった"""
+
+
+# get_text()の対象外になる要素（BeautifulSoupの既定の挙動に合わせる）
+_SKIP_TEXT_TAGS = ("script", "style", "template")
+
+
+class _SoupDom:
+    """BeautifulSoupのツリーを操作するアダプタ"""
+
+    @staticmethod
+    def find(node, tag, class_=None, href=None):
+        kwargs = {}
+        if class_ is not None:
+            kwargs["class_"] = class_
+        if href is not None:
+            kwargs["href"] = re.compile(href)
+        return node.find(tag, **kwargs)
+
+    @staticmethod
+    def text(node):
+        return node.get_text()
+
+    @staticmethod
+    def attr(node, name):
+        return node.get(name)
+
+    @staticmethod
+    def lyrics(node):
+        # <br>タグを改行文字に置換
+        for br in node.find_all("br"):
+            br.replace_with("\n")
+        return node.get_text()
+
+
+class _LxmlDom:
+    """lxml.htmlのツリーをBeautifulSoupと同じ意味で操作するアダプタ"""
+
+    @staticmethod
+    def _class_matches(element, class_):
+        classes = element.get("class")
+        if classes is None:
+            return False
+        values = classes.split()
+        # BeautifulSoupと同様、空白を含む指定はclass属性全体との完全一致になる
+        return class_ == " ".join(values) or class_ in values
+
+    @classmethod
+    def find(cls, node, tag, class_=None, href=None):
+        for element in node.iterdescendants(tag):
+            if class_ is not None and not cls._class_matches(element, class_):
+                continue
+            if href is not None:
+                value = element.get("href")
+                if value is None or not re.search(href, value):
+                    continue
+            return element
+        return None
+
+    @staticmethod
+    def _collect_text(node, parts, br_text=None):
+        if node.text and node.tag not in _SKIP_TEXT_TAGS:
+            parts.append(node.text)
+        for child in node:
+            if isinstance(child.tag, str):
+                if child.tag == "br" and br_text is not None:
+                    parts.append(br_text)
+                else:
+                    _LxmlDom._collect_text(child, parts, br_text)
+            if child.tail:
+                parts.append(child.tail)
+
+    @classmethod
+    def text(cls, node):
+        parts = []
+        cls._collect_text(node, parts)
+        return "".join(parts)
+
+    @staticmethod
+    def attr(node, name):
+        return node.get(name)
+
+    @classmethod
+    def lyrics(cls, node):
+        parts = []
+        cls._collect_text(node, parts, br_text="\n")
+        return "".join(parts)
+
+
+def _extract_song_data(song_id, dom, root, song_details, kashi_area):
+    """
+    解析済みのツリーからsong_dataを組み立てる（全バックエンド共通）
+
+    Args:
+        song_id: 楽曲ID
+        dom: ツリー操作用のアダプタ
+        root: タイトルのフォールバック検索に使うルート要素
+        song_details: 楽曲詳細エリアの要素（見つからなければNone）
+        kashi_area: 歌詞エリアの要素（見つからなければNone）
+
+    Returns:
+        dict: 楽曲データ
+
+    Raises:
+        SongParseError: 楽曲詳細エリアが無い場合（それ以外の想定外の例外もそのまま送出する）
+    """
+    # デフォルト値を設定
+    song_data = {field: "" for field in SONG_FIELDS}
+    song_data["song_id"] = song_id
+
+    if song_details is None:
+        # 削除された曲や構造の変わったページ。空の行を書き込まず、解析の失敗として扱う
+        raise SongParseError(f"楽曲詳細エリアが見つかりません (song_id: {song_id})")
+
+    # 曲のタイトルを取得
+    title_tag = dom.find(song_details, "h2", class_="ms-2 ms-md-3 kashi-title")
+    if title_tag is None:
+        title_tag = dom.find(root, "h2", class_=TITLE_FALLBACK_CLASS)
+    song_data["title"] = dom.text(title_tag).strip() if title_tag is not None else ""
+
+    # アーティスト名を取得
+    artist_tag = dom.find(song_details, "h3", class_="ms-2 ms-md-3")
+    song_data["artist"] = dom.text(artist_tag).strip() if artist_tag is not None else ""
+
+    # 主題歌情報を取得
+    main_theme_tag = dom.find(song_details, "p", class_="ms-2 ms-md-3 mb-0")
+    song_data["main_theme"] = dom.text(main_theme_tag).strip().replace("\xa0", "") if main_theme_tag is not None else ""
+
+    # 詳細情報（作詞者、作曲者、編曲者、発売日）を取得
+    detail_section = dom.find(song_details, "p", class_="ms-2 ms-md-3 detail mb-0")
+    if detail_section is not None:
+        # 作詞者
+        lyricist_link = dom.find(detail_section, "a", href=r"/lyricist/")
+        song_data["lyricist"] = dom.text(lyricist_link).strip() if lyricist_link is not None else ""
+
+        # 作曲者
+        composer_link = dom.find(detail_section, "a", href=r"/composer/")
+        song_data["composer"] = dom.text(composer_link).strip() if composer_link is not None else ""
+
+        # 編曲者
+        arranger_link = dom.find(detail_section, "a", href=r"/arranger/")
+        song_data["arranger"] = dom.text(arranger_link).strip() if arranger_link is not None else ""
+
+        # 発売日
+        detail_text = dom.text(detail_section)
+        if "発売日：" in detail_text:
+            release_date_match = detail_text.split("発売日：")[1].split()
+            song_data["release_date"] = release_date_match[0] if release_date_match else ""
+
+    # カバー画像URLを取得
+    cover_img = dom.find(song_details, "img", class_="img-fluid")
+    cover_src = dom.attr(cover_img, "src") if cover_img is not None else None
+    song_data["cover_url"] = cover_src if cover_src else ""
+
+    # 曲の歌詞を取得
+    if kashi_area is not None:
+        song_data["lyrics"] = dom.lyrics(kashi_area).strip()
+
+    return song_data
+
+
+def _parse_with_html_parser(song_id, html):
+    """ページ全体をhtml.parserで解析する（従来の実装。基準として残す）"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    song_details = soup.find("div", class_=DETAILS_CLASS)
+    kashi_area = soup.find("div", id="kashi_area")
+    return _extract_song_data(song_id, _SoupDom, soup, song_details, kashi_area)
+
+
+def _is_needed_class(value):
+    return value in (DETAILS_CLASS, TITLE_FALLBACK_CLASS)
+
+
+@functools.lru_cache(maxsize=None)
+def _strainers():
+    """必要な部分木だけを残すストレイナー（楽曲詳細エリアとタイトル, 歌詞エリア）"""
+    from bs4 import SoupStrainer
+
+    return SoupStrainer(["div", "h2"], class_=_is_needed_class), SoupStrainer("div", id="kashi_area")
+
+
+def _parse_with_lxml_strainer(song_id, html):
+    """lxmlで解析し、楽曲詳細エリア・タイトル・歌詞エリアの部分木だけを構築する"""
+    from bs4 import BeautifulSoup
+
+    details_strainer, kashi_strainer = _strainers()
+    soup = BeautifulSoup(html, "lxml", parse_only=details_strainer)
+    song_details = soup.find("div", class_=DETAILS_CLASS)
+    kashi_soup = BeautifulSoup(html, "lxml", parse_only=kashi_strainer)
+    kashi_area = kashi_soup.find("div", id="kashi_area")
+    return _extract_song_data(song_id, _SoupDom, soup, song_details, kashi_area)
+
+
+def _parse_with_lxml_native(song_id, html):
+    """BeautifulSoupを介さず、lxml.htmlのツリーを直接走査する"""
+    import lxml.etree
+    import lxml.html
+
+    try:
+        root = lxml.html.document_fromstring(html)
+    except lxml.etree.ParserError:
+        # 空のページなど。他のバックエンドと同じく楽曲詳細エリアが無いページとして扱う
+        return _extract_song_data(song_id, _LxmlDom, None, None, None)
+    song_details = _LxmlDom.find(root, "div", class_=DETAILS_CLASS)
+    kashi_area = None
+    for element in root.iterdescendants("div"):
+        if element.get("id") == "kashi_area":
+            kashi_area = element
+            break
+    return _extract_song_data(song_id, _LxmlDom, root, song_details, kashi_area)
+
+
+# バックエンド名 → 解析関数
+PARSER_BACKENDS = {
+    "html.parser": _parse_with_html_parser,
+    "lxml": _parse_with_lxml_strainer,
+    "lxml-native": _parse_with_lxml_native,
+}
+
+
+def parse_song_page(song_id, html, backend=None):
+    """
+    楽曲ページのHTMLを解析してsong_dataを返す
+
+    Args:
+        song_id: 楽曲ID
+        html (str): 楽曲ページのHTML
+        backend (str): PARSER_BACKENDSのキー（省略時はDEFAULT_BACKEND）
+
+    Returns:
+        dict: 楽曲データ（どのバックエンドでも同じ形式）
+
+    Raises:
+        SongParseError: ページを解析できなかった場合
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"未対応のパーサーバックエンドです: {backend} (選択肢: {', '.join(PARSER_BACKENDS)})")
+    return PARSER_BACKENDS[backend](song_id, html)
+
+
+def _parse_or_error(song_id, html, backend):
+    """parse_song_pageの結果（解析できなければSongParseErrorのメッセージ）"""
+    try:
+        return parse_song_page(song_id, html, backend=backend)
+    except SongParseError as e:
+        return str(e)
+
+
+def compare_backends(pages, reference="html.parser", backends=None):
+    """
+    各バックエンドの解析結果が基準バックエンドと一致するか確認する
+
+    Args:
+        pages (dict): {song_id: HTML}
+        reference (str): 基準にするバックエンド
+        backends (list): 比較するバックエンド（省略時は基準以外の全て）
+
+    Returns:
+        list: 不一致の一覧 [(backend, song_id, field, 基準の値, 実際の値)]
+              （解析できなかったページはfieldを"error"とし、SongParseErrorのメッセージを比べる）
+    """
+    backends = backends or [name for name in PARSER_BACKENDS if name != reference]
+    mismatches = []
+    for song_id, html in pages.items():
+        expected = _parse_or_error(song_id, html, reference)
+        for backend in backends:
+            actual = _parse_or_error(song_id, html, backend)
+            if isinstance(expected, str) or isinstance(actual, str):
+                if expected != actual:
+                    mismatches.append((backend, song_id, "error", expected, actual))
+                continue
+            for field in SONG_FIELDS:
+                if expected[field] != actual[field]:
+                    mismatches.append((backend, song_id, field, expected[field], actual[field]))
+    return mismatches
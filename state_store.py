@@ -0,0 +1,495 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from song_parser import SONG_FIELDS
+
+# スクレイピング / アップロードの状態
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# song_id IN (...) で1回に問い合わせる件数（SQLiteのパラメータ数の上限より小さくする）
+QUERY_CHUNK_SIZE = 500
+
+
+def song_content_hash(song_data):
+    """
+    楽曲データの内容ハッシュを計算する（項目の順序や型の揺れに影響されない）
+
+    Args:
+        song_data (dict): 楽曲データ
+
+    Returns:
+        str: SHA-256の16進文字列
+    """
+    normalized = {field: "" if song_data.get(field) is None else str(song_data.get(field)) for field in SONG_FIELDS}
+    payload = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StateStore:
+    """
+    パイプラインの状態を1曲1行で管理するSQLiteデータベース
+
+    発見・スクレイピング・Notionアップロードの状態、NotionのページID、
+    内容ハッシュ、各時刻と、どの歌詞CSVにどの曲を書き込んだかを保持する
+    （楽曲データ自体は歌詞CSVにだけ置く）。取得済み判定はsong_idの主キー・
+    状態列のインデックスで行うため、曲数が増えても線形探索にならない。
+    """
+
+    def __init__(self, path="pipeline_state.sqlite3"):
+        """
+        Args:
+            path (str): データベースファイルのパス
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        has_file_songs = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_songs'"
+        ).fetchone() is not None
+        self._conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS songs (
+                song_id TEXT PRIMARY KEY,
+                artist_id TEXT,
+                discovered_at REAL,
+                scrape_status TEXT NOT NULL DEFAULT '{STATUS_PENDING}',
+                scraped_at REAL,
+                upload_status TEXT NOT NULL DEFAULT '{STATUS_PENDING}',
+                uploaded_at REAL,
+                notion_page_id TEXT,
+                notion_hash TEXT,
+                content_hash TEXT,
+                data TEXT,
+                error TEXT,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS songs_artist_id ON songs (artist_id);
+            CREATE INDEX IF NOT EXISTS songs_scrape_status ON songs (scrape_status);
+            CREATE INDEX IF NOT EXISTS songs_upload_status ON songs (upload_status);
+            CREATE TABLE IF NOT EXISTS imported_files (
+                path TEXT PRIMARY KEY,
+                imported_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS notion_mirror (
+                song_id TEXT PRIMARY KEY,
+                page_id TEXT NOT NULL,
+                last_edited_time TEXT
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS artist_songs (
+                artist_id TEXT NOT NULL,
+                song_id TEXT NOT NULL,
+                PRIMARY KEY (artist_id, song_id)
+            );
+            CREATE INDEX IF NOT EXISTS artist_songs_song_id ON artist_songs (song_id);
+            CREATE TABLE IF NOT EXISTS file_songs (
+                path TEXT NOT NULL,
+                song_id TEXT NOT NULL,
+                PRIMARY KEY (path, song_id)
+            );
+            """
+        )
+        # 古いスキーマのDBに不足している列を追加する
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(songs)")}
+        if "notion_hash" not in columns:
+            self._conn.execute("ALTER TABLE songs ADD COLUMN notion_hash TEXT")
+        # 1曲が複数のアーティストに載っている場合に備えた対応表。古いDBではsongs.artist_idから作る
+        if self._conn.execute("SELECT 1 FROM artist_songs LIMIT 1").fetchone() is None:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO artist_songs (artist_id, song_id)"
+                " SELECT artist_id, song_id FROM songs WHERE artist_id IS NOT NULL"
+            )
+        if not has_file_songs:
+            # 古いDBは楽曲データの写しをdata列に持ち、CSVごとの曲を記録していない。
+            # 写しを消し、CSVを取り込み直して（次に使うときに1回だけ）CSVごとの曲を記録する
+            self._conn.execute("UPDATE songs SET data = NULL WHERE data IS NOT NULL")
+            self._conn.execute("DELETE FROM imported_files")
+        self._conn.commit()
+
+    def _query_ids(self, sql, params=()):
+        with self._lock:
+            return {row[0] for row in self._conn.execute(sql, params)}
+
+    def _query_ids_in(self, sql, params, song_ids):
+        # sql（WHERE句まで）にsong_idの条件を付け、QUERY_CHUNK_SIZE件ずつ問い合わせる
+        song_ids = list(dict.fromkeys(str(song_id) for song_id in song_ids))
+        found = set()
+        for start in range(0, len(song_ids), QUERY_CHUNK_SIZE):
+            chunk = song_ids[start:start + QUERY_CHUNK_SIZE]
+            found |= self._query_ids(f"{sql} AND song_id IN ({','.join('?' * len(chunk))})", [*params, *chunk])
+        return found
+
+    def _link_artist(self, song_ids, artist_id):
+        # ロックを取った状態で呼ぶ
+        if artist_id is None:
+            return
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO artist_songs (artist_id, song_id) VALUES (?, ?)",
+            [(str(artist_id), str(song_id)) for song_id in song_ids],
+        )
+
+    # --- 発見 ---
+
+    def add_discovered(self, song_ids, artist_id=None):
+        """
+        発見したsong_idを登録する
+
+        songs.artist_idは最初に見つけたアーティストのまま変えず、
+        アーティストとの対応はartist_songsに追加する（他のアーティストで取得済みの曲は再取得しない）
+
+        Args:
+            song_ids (iterable): song_idのリスト
+            artist_id (str): アーティストID
+
+        Returns:
+            int: 新しく登録された件数
+        """
+        now = time.time()
+        artist_id = None if artist_id is None else str(artist_id)
+        rows = [(str(song_id), artist_id, now, now) for song_id in song_ids]
+        with self._lock:
+            before = self._conn.execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+            self._conn.executemany(
+                """
+                INSERT INTO songs (song_id, artist_id, discovered_at, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(song_id) DO UPDATE SET
+                    artist_id = COALESCE(songs.artist_id, excluded.artist_id),
+                    discovered_at = COALESCE(songs.discovered_at, excluded.discovered_at)
+                """,
+                rows,
+            )
+            self._link_artist([row[0] for row in rows], artist_id)
+            self._conn.commit()
+            return self._conn.execute("SELECT COUNT(*) FROM songs").fetchone()[0] - before
+
+    def song_ids(self, artist_id=None):
+        """登録済みのsong_idの集合を返す（artist_idで絞り込むと、そのアーティストのページに載っていた曲）"""
+        if artist_id is None:
+            return self._query_ids("SELECT song_id FROM songs")
+        return self._query_ids("SELECT song_id FROM artist_songs WHERE artist_id = ?", (str(artist_id),))
+
+    def artist_summary(self, artist_ids):
+        """
+        アーティストごとの曲数と取得状況を返す
+
+        Args:
+            artist_ids (iterable): アーティストID
+
+        Returns:
+            dict: {artist_id: {"songs": 曲数, "scraped": 取得済み, "failed": 取得失敗}}
+        """
+        summary = {str(artist_id): {"songs": 0, "scraped": 0, "failed": 0} for artist_id in artist_ids}
+        if not summary:
+            return summary
+        placeholders = ",".join("?" * len(summary))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT a.artist_id, COUNT(*),
+                       SUM(s.scrape_status = ?), SUM(s.scrape_status = ?)
+                FROM artist_songs a JOIN songs s ON s.song_id = a.song_id
+                WHERE a.artist_id IN ({placeholders})
+                GROUP BY a.artist_id
+                """,
+                [STATUS_DONE, STATUS_FAILED, *summary],
+            ).fetchall()
+        for artist_id, songs, scraped, failed in rows:
+            summary[artist_id] = {"songs": songs, "scraped": scraped or 0, "failed": failed or 0}
+        return summary
+
+    # --- スクレイピング ---
+
+    def scraped_ids(self, song_ids=None, path=None):
+        """
+        スクレイピング済みのsong_idの集合を返す
+
+        Args:
+            song_ids (iterable): 調べるsong_id（省略時は全件）
+            path (str): 指定時は、この歌詞CSVに書き込んだ曲だけを返す（他のCSVに書き込んだ曲は含まない）
+        """
+        if path is None:
+            sql, params = "SELECT song_id FROM songs WHERE scrape_status = ?", [STATUS_DONE]
+        else:
+            sql, params = "SELECT song_id FROM file_songs WHERE path = ?", [os.path.abspath(path)]
+        if song_ids is None:
+            return self._query_ids(sql, params)
+        return self._query_ids_in(sql, params, song_ids)
+
+    def mark_scraped(self, song_data, artist_id=None, commit=True, path=None):
+        """
+        スクレイピング結果を保存する
+
+        楽曲データ自体は保存せず、状態と内容ハッシュだけを記録する。
+
+        Args:
+            song_data (dict): 楽曲データ
+            artist_id (str): アーティストID（未登録の曲の場合に使う）
+            commit (bool): Falseの場合は呼び出し側でcommit()する
+            path (str): 楽曲データを書き込んだ歌詞CSV
+        """
+        now = time.time()
+        song_id = str(song_data["song_id"])
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO songs (song_id, artist_id, discovered_at, scrape_status, scraped_at, content_hash, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, NULL, ?)
+                ON CONFLICT(song_id) DO UPDATE SET
+                    artist_id = COALESCE(songs.artist_id, excluded.artist_id),
+                    scrape_status = excluded.scrape_status,
+                    scraped_at = excluded.scraped_at,
+                    content_hash = excluded.content_hash,
+                    error = NULL,
+                    updated_at = excluded.updated_at
+                """,
+                (song_id, None if artist_id is None else str(artist_id), now, STATUS_DONE, now,
+                 song_content_hash(song_data), now),
+            )
+            self._link_artist([song_id], artist_id)
+            if path is not None:
+                self._conn.execute("INSERT OR IGNORE INTO file_songs (path, song_id) VALUES (?, ?)",
+                                   (os.path.abspath(path), song_id))
+            if commit:
+                self._conn.commit()
+
+    def mark_scrape_failed(self, song_id, error, artist_id=None):
+        """スクレイピングの失敗を記録する（failed_songs()で再取得の対象として取り出せる）"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO songs (song_id, artist_id, discovered_at, scrape_status, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(song_id) DO UPDATE SET
+                    artist_id = COALESCE(songs.artist_id, excluded.artist_id),
+                    scrape_status = excluded.scrape_status, error = excluded.error, updated_at = excluded.updated_at
+                WHERE songs.scrape_status != ?
+                """,
+                (str(song_id), None if artist_id is None else str(artist_id), now, STATUS_FAILED, str(error), now,
+                 STATUS_DONE),
+            )
+            self._link_artist([song_id], artist_id)
+            self._conn.commit()
+
+    def failed_songs(self, artist_id=None):
+        """
+        スクレイピングに失敗したままの曲（デッドレターリスト）を返す
+
+        Args:
+            artist_id (str): アーティストIDで絞り込む
+
+        Returns:
+            dict: {song_id: 最後のエラーメッセージ}
+        """
+        sql = "SELECT song_id, error FROM songs WHERE scrape_status = ?"
+        params = [STATUS_FAILED]
+        if artist_id is not None:
+            sql += " AND song_id IN (SELECT song_id FROM artist_songs WHERE artist_id = ?)"
+            params.append(str(artist_id))
+        with self._lock:
+            return dict(self._conn.execute(sql + " ORDER BY song_id", params).fetchall())
+
+    # --- Notionアップロード ---
+
+    def uploaded_ids(self):
+        """Notionにアップロード済みのsong_idの集合を返す"""
+        return self._query_ids("SELECT song_id FROM songs WHERE upload_status = ?", (STATUS_DONE,))
+
+    def mark_uploaded(self, song_id, notion_page_id=None, notion_hash=None):
+        """
+        Notionへのアップロード結果を記録する
+
+        Args:
+            song_id: 楽曲ID
+            notion_page_id (str): 作成・更新したNotionページのID
+            notion_hash (str): 送信したNotionプロパティのハッシュ（差分同期の比較に使う）
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO songs (song_id, discovered_at, upload_status, uploaded_at, notion_page_id, notion_hash, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(song_id) DO UPDATE SET
+                    upload_status = excluded.upload_status,
+                    uploaded_at = excluded.uploaded_at,
+                    notion_page_id = COALESCE(excluded.notion_page_id, songs.notion_page_id),
+                    notion_hash = COALESCE(excluded.notion_hash, songs.notion_hash),
+                    updated_at = excluded.updated_at
+                """,
+                (str(song_id), now, STATUS_DONE, now, notion_page_id, notion_hash, now),
+            )
+            self._conn.commit()
+
+    def notion_sync_state(self, song_ids=None):
+        """
+        song_idごとのNotionページIDと最後に送信したプロパティのハッシュを返す
+
+        Args:
+            song_ids (iterable): 調べるsong_id（省略時は全件）
+
+        Returns:
+            dict: {song_id: (notion_page_id, notion_hash)}（ページIDが記録されている曲のみ）
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT song_id, notion_page_id, notion_hash FROM songs WHERE notion_page_id IS NOT NULL"
+            ).fetchall()
+        state = {song_id: (page_id, notion_hash) for song_id, page_id, notion_hash in rows}
+        if song_ids is None:
+            return state
+        wanted = {str(song_id) for song_id in song_ids}
+        return {song_id: value for song_id, value in state.items() if song_id in wanted}
+
+    def notion_page_id(self, song_id):
+        """song_idに対応するNotionページIDを返す（未アップロードならNone）"""
+        with self._lock:
+            row = self._conn.execute("SELECT notion_page_id FROM songs WHERE song_id = ?", (str(song_id),)).fetchone()
+        return row[0] if row else None
+
+    # --- Notionデータベースのローカルミラー ---
+
+    def upsert_mirror(self, entries):
+        """
+        ミラーにNotionページを登録・更新する
+
+        Args:
+            entries (iterable): (song_id, page_id, last_edited_time) のイテラブル
+
+        Returns:
+            int: 処理した件数
+        """
+        rows = [(str(song_id), page_id, last_edited_time) for song_id, page_id, last_edited_time in entries]
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT INTO notion_mirror (song_id, page_id, last_edited_time) VALUES (?, ?, ?)
+                ON CONFLICT(song_id) DO UPDATE SET
+                    page_id = excluded.page_id, last_edited_time = excluded.last_edited_time
+                """,
+                rows,
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def mirror_pages(self):
+        """ミラーの song_id → page_id を返す"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT song_id, page_id FROM notion_mirror"))
+
+    def clear_mirror(self):
+        """ミラーを空にする（全件取り直す前に使う）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM notion_mirror")
+            self._conn.commit()
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+
+    # --- 集計 ---
+
+    def status_counts(self):
+        """
+        状態ごとの件数を返す
+
+        Returns:
+            dict: {"total": 件数, "scrape": {状態: 件数}, "upload": {状態: 件数}}
+        """
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+            scrape = dict(self._conn.execute("SELECT scrape_status, COUNT(*) FROM songs GROUP BY scrape_status"))
+            upload = dict(self._conn.execute("SELECT upload_status, COUNT(*) FROM songs GROUP BY upload_status"))
+        return {"total": total, "scrape": scrape, "upload": upload}
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- 既存のCSV形式との相互変換 ---
+
+    def is_imported(self, path):
+        """CSVファイルが取り込み済みかどうか"""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM imported_files WHERE path = ?", (os.path.abspath(path),)).fetchone()
+        return row is not None
+
+    def mark_imported(self, path):
+        """CSVファイルを取り込み済み（状態DBと同期済み）として記録する"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO imported_files (path, imported_at) VALUES (?, ?)",
+                (os.path.abspath(path), time.time()),
+            )
+            self._conn.commit()
+
+    def reset_file(self, path):
+        """歌詞CSVに書き込んだ曲の記録を消し、空のCSVとして取り込み済みにする（CSVが無いか空の場合に使う）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM file_songs WHERE path = ?", (os.path.abspath(path),))
+            self._conn.commit()
+        self.mark_imported(path)
+
+    def import_song_ids_csv(self, filepath, artist_id=None):
+        """
+        song_ids_{artist_id}.csv を取り込む
+
+        Returns:
+            int: 新しく登録された件数
+        """
+        import pandas as pd
+
+        df = pd.read_csv(filepath, dtype=str, usecols=['song_id'])
+        added = self.add_discovered(df['song_id'].dropna().tolist(), artist_id=artist_id)
+        self.mark_imported(filepath)
+        return added
+
+    def import_lyrics_csv(self, filepath, artist_id=None):
+        """
+        lyrics_data_{artist_id}.csv を取り込み、スクレイピング済み（このCSVに書き込み済み）として登録する
+
+        Returns:
+            int: 取り込んだ行数
+        """
+        import pandas as pd
+
+        try:
+            df = pd.read_csv(filepath, dtype=str, keep_default_na=False)
+        except pd.errors.EmptyDataError:
+            df = pd.DataFrame(columns=SONG_FIELDS)
+        count = 0
+        for record in df.to_dict('records'):
+            if record.get('song_id'):
+                self.mark_scraped(record, artist_id=artist_id, commit=False, path=filepath)
+                count += 1
+        self.commit()
+        self.mark_imported(filepath)
+        return count
+
+    def export_song_ids_csv(self, filepath, artist_id=None):
+        """登録済みのsong_idを song_ids_{artist_id}.csv 形式で書き出す"""
+        import pandas as pd
+
+        song_ids = sorted(self.song_ids(artist_id))
+        pd.DataFrame({'song_id': song_ids}).to_csv(filepath, index=False)
+        return len(song_ids)
@@ -0,0 +1,37 @@
+import csv
+import os
+
+from conftest import FIXTURES_DIR
+
+
+class _Page:
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+
+def test_crawl_artists_uses_the_listing_key_stored_by_discovery(tmp_path, monkeypatch):
+    import scripts
+
+    with open(os.path.join(FIXTURES_DIR, "listing", "lyricist_1001.html"), encoding="utf-8") as f:
+        page = _Page(f.read())
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scripts, "STATE_DB_PATH", str(tmp_path / "pipeline_state.sqlite3"))
+    monkeypatch.setattr(scripts, "fetch_uta_net_page", lambda url, max_age=None: page)
+    scraped = []
+    scrape = scripts.scrape_and_save_lyrics
+
+    def details_source(song_ids):
+        scraped.extend(song_ids)
+        return ((song_id, {"song_id": song_id, "title": f"曲{song_id}", "lyrics": "あいうえお"}, None)
+                for song_id in song_ids)
+
+    monkeypatch.setattr(scripts, "scrape_and_save_lyrics",
+                        lambda song_ids, **kwargs: scrape(song_ids, details_source=details_source, **kwargs))
+
+    summary = scripts.crawl_artists(["https://www.uta-net.com/lyricist/1001/"], export_per_artist=True)
+    assert summary == {"lyricist:1001": {"songs": 2, "scraped": 2, "failed": 0}}
+    assert scraped == ["12345", "12346"]
+    with open(tmp_path / "lyrics_data_lyricist_1001.csv", encoding="utf-8-sig", newline="") as f:
+        assert sorted(row["song_id"] for row in csv.DictReader(f)) == ["12345", "12346"]
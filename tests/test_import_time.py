@@ -0,0 +1,8 @@
+import bench_import_time
+
+
+def test_cli_startup_stays_within_budget_without_heavy_imports():
+    result = bench_import_time.check(repeat=3)
+    assert result["help_loaded"] == []
+    assert result["status_loaded"] == []
+    assert result["problems"] == []
@@ -0,0 +1,22 @@
+import os
+
+from conftest import FIXTURES_DIR
+from listing_parser import parse_listing_page
+
+
+def _read(name):
+    with open(os.path.join(FIXTURES_DIR, "listing", name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_credits_are_taken_only_from_song_rows():
+    song_ids, last_page, credits = parse_listing_page(_read("lyricist_1001.html"), "lyricist", "1001")
+
+    assert song_ids == ["12345", "12346"]
+    assert last_page == 3
+    # ヘッダー・サイドバー・ランキングのリンク（artist/77, artist/88, lyricist/5001, composer/6001）は含まない
+    assert credits == {
+        ("artist", "134"), ("artist", "135"),
+        ("composer", "2001"), ("composer", "2002"),
+        ("arranger", "3001"),
+    }
@@ -0,0 +1,54 @@
+import csv
+
+from song_parser import SONG_FIELDS
+
+SONGS = [
+    {"song_id": "1", "title": "曲1", "artist": "歌手A", "lyrics": "あいうえお"},
+    {"song_id": "2", "title": "曲1 (Live)", "artist": "歌手A", "lyrics": "あいうえお"},
+    {"song_id": "3", "title": "曲3", "artist": "歌手B", "lyrics": "かきくけこ"},
+]
+
+
+class _Response:
+    def __init__(self, page_id):
+        self._page_id = page_id
+
+    def json(self):
+        return {"id": self._page_id, "last_edited_time": "2026-01-01T00:00:00.000Z"}
+
+
+def test_sync_sends_only_canonical_songs_and_skips_them_when_unchanged(tmp_path, monkeypatch):
+    import scripts
+
+    csv_path = tmp_path / "lyrics_data_1.csv"
+    with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SONG_FIELDS, restval="")
+        writer.writeheader()
+        writer.writerows(SONGS)
+
+    monkeypatch.setattr(scripts, "STATE_DB_PATH", str(tmp_path / "pipeline_state.sqlite3"))
+    monkeypatch.setattr(scripts, "NOTION_TOKEN", "token")
+    monkeypatch.setattr(scripts, "NOTION_DATABASE_ID", "database")
+    monkeypatch.setattr(scripts, "get_existing_notion_pages", lambda: {})
+    monkeypatch.setattr(scripts, "get_near_duplicate_clusters", lambda path: {
+        "1": [{"song_id": song["song_id"], "title": song["title"], "artist": song["artist"]} for song in SONGS[:2]],
+    })
+    sent = []
+
+    def send(method, url, payload, song_data, max_retries=3, limiter=None):
+        sent.append((method, song_data["song_id"], payload))
+        return _Response(f"page-{song_data['song_id']}")
+
+    monkeypatch.setattr(scripts, "_send_notion_request", send)
+
+    result = scripts.sync_csv_to_notion(str(csv_path), duplicates="link")
+    assert result == {"created": 2, "updated": 0, "unchanged": 0, "failed": 0, "total": 2}
+    assert sorted(song_id for _, song_id, _ in sent) == ["1", "3"]
+    properties = next(payload["properties"] for _, song_id, payload in sent if song_id == "1")
+    assert properties[scripts.NOTION_VARIANTS_PROPERTY]["rich_text"][0]["text"]["content"] == "2 曲1 (Live) / 歌手A"
+
+    # 他のバージョンの一覧を含めて前回と同じなので、何も送信しない
+    sent.clear()
+    result = scripts.sync_csv_to_notion(str(csv_path), duplicates="link")
+    assert result == {"created": 0, "updated": 0, "unchanged": 2, "failed": 0, "total": 2}
+    assert sent == []
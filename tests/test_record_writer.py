@@ -0,0 +1,61 @@
+import csv
+
+import pytest
+
+from record_writer import BufferedRecordWriter, recover_csv_journal
+
+FIELDS = ["song_id", "title"]
+
+
+class FlakyJournal:
+    """最初のfailures回のwriteで途中まで書いてOSErrorを送出するジャーナル"""
+
+    def __init__(self, journal, failures=1):
+        self._journal = journal
+        self.failures = failures
+
+    def write(self, data):
+        if self.failures:
+            self.failures -= 1
+            self._journal.write(data[:5])
+            raise OSError("disk full")
+        return self._journal.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._journal, name)
+
+
+def _rows(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return [row["song_id"] for row in csv.DictReader(f)]
+
+
+def test_batch_that_fails_to_reach_the_journal_is_kept_and_retried(tmp_path):
+    path = str(tmp_path / "lyrics.csv")
+    flushed = []
+    writer = BufferedRecordWriter(path, FIELDS, batch_size=2, on_flush=lambda batch: flushed.extend(batch))
+    writer._journal = FlakyJournal(writer._journal)
+    writer.write({"song_id": "1"})
+    with pytest.raises(OSError):
+        writer.write({"song_id": "2"})
+    assert flushed == [] and writer.written == 0
+
+    writer.write({"song_id": "3"})
+    writer.close()
+    assert [record["song_id"] for record in flushed] == ["1", "2", "3"]
+    assert _rows(path) == ["1", "2", "3"]
+
+
+def test_failed_flush_leaves_no_partial_line_in_the_journal(tmp_path):
+    path = str(tmp_path / "lyrics.csv")
+    writer = BufferedRecordWriter(path, FIELDS, batch_size=1)
+    writer.write({"song_id": "1"})
+    writer._journal = FlakyJournal(writer._journal)
+    with pytest.raises(OSError):
+        writer.write({"song_id": "2"})
+    writer.write({"song_id": "3"})
+    writer._journal.flush()
+
+    # ここで落ちたとして、次回の回復でジャーナルの全件が書き戻される
+    assert recover_csv_journal(path, FIELDS) == 3
+    assert _rows(path) == ["1", "2", "3"]
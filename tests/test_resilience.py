@@ -0,0 +1,92 @@
+import pytest
+
+from http_cache import ResponseCache, cached_get
+from resilience import CircuitBreaker, CircuitOpenError, RetryableStatusError, RetryPolicy
+
+URL = "https://www.uta-net.com/song/1/"
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+
+
+def _open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure(URL)
+    assert breaker.is_open(URL)
+    return breaker
+
+
+def test_probe_that_raises_an_unrelated_error_does_not_keep_the_host_blocked():
+    breaker = _open_breaker()
+    policy = RetryPolicy(max_attempts=1)
+
+    def fail():
+        raise KeyError("cache")
+
+    with pytest.raises(KeyError):
+        policy.call(fail, URL, breaker=breaker)
+    # 試行中の印が外れているので、次の1件を試しに通せる
+    response = policy.call(lambda: _Response(200), URL, breaker=breaker)
+    assert response.status_code == 200
+    assert not breaker.is_open(URL)
+
+
+def test_only_one_probe_is_let_through_while_half_open():
+    breaker = _open_breaker()
+    breaker.check(URL)
+    with pytest.raises(CircuitOpenError):
+        breaker.check(URL)
+    breaker.record_failure(URL)
+    assert breaker.is_open(URL)
+
+
+class _Client:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.requests = 0
+
+    def get(self, url, headers=None):
+        self.requests += 1
+        response = _Response(self.status_code)
+        response.text = "<html></html>"
+        return response
+
+
+def test_cache_hits_bypass_the_breaker(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+    policy = RetryPolicy(max_attempts=1)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    client = _Client()
+    cached_get(client, cache, URL, retry_policy=policy, breaker=breaker)
+    assert client.requests == 1
+
+    # 遮断中でもキャッシュにあるページは返し、連続失敗回数も変えない
+    breaker.record_failure(URL)
+    breaker.record_failure(URL)
+    assert breaker.is_open(URL)
+    response = cached_get(client, cache, URL, retry_policy=policy, breaker=breaker)
+    assert response.from_cache and client.requests == 1
+    assert breaker.is_open(URL)
+    with pytest.raises(CircuitOpenError):
+        cached_get(client, cache, "https://www.uta-net.com/song/2/", retry_policy=policy, breaker=breaker)
+    cache.close()
+
+
+def test_cache_hits_do_not_reset_the_failure_count(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+    policy = RetryPolicy(max_attempts=1)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    cached_get(_Client(), cache, URL, retry_policy=policy, breaker=breaker)
+
+    failing = _Client(status_code=503)
+    other = "https://www.uta-net.com/song/2/"
+    with pytest.raises(RetryableStatusError):
+        cached_get(failing, cache, other, retry_policy=policy, breaker=breaker)
+    cached_get(failing, cache, URL, retry_policy=policy, breaker=breaker)
+    with pytest.raises(RetryableStatusError):
+        cached_get(failing, cache, other, retry_policy=policy, breaker=breaker)
+    assert breaker.is_open(URL)
+    cache.close()
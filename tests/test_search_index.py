@@ -0,0 +1,42 @@
+import csv
+
+from search_index import SearchIndex
+from song_parser import SONG_FIELDS
+
+# 2曲目は検索語のn-gramをすべて含むが、改行で分かれていて連続していない
+SONGS = [
+    {"song_id": "1", "title": "一", "lyrics": "あいうえおかき"},
+    {"song_id": "2", "title": "二", "lyrics": "あいうえ\nうえおか"},
+]
+PHRASE = '"あいうえおか"'
+
+
+def _write_csv(path):
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SONG_FIELDS)
+        writer.writeheader()
+        for song in SONGS:
+            writer.writerow({field: song.get(field, "") for field in SONG_FIELDS})
+
+
+def test_candidates_whose_lyrics_cannot_be_read_are_dropped(tmp_path):
+    path = str(tmp_path / "index.search.sqlite3")
+    with SearchIndex(path) as index:
+        for song in SONGS:
+            index.add(song)
+    with SearchIndex(path, text_source=lambda song_ids: {}) as index:
+        assert index.search(PHRASE) == []
+        assert index.unverified == 2
+    with SearchIndex(path, text_source=lambda song_ids: {song["song_id"]: song["lyrics"] for song in SONGS}) as index:
+        assert index.search(PHRASE) == ["1"]
+        assert index.unverified == 0
+
+
+def test_phrases_are_verified_against_the_csv_without_a_lyrics_store(tmp_path):
+    import scripts
+
+    csv_path = str(tmp_path / "lyrics_data_1.csv")
+    _write_csv(csv_path)
+    scripts.export_search_index(csv_path)
+    assert scripts.get_lyrics("1", csv_path) is None
+    assert [result["song_id"] for result in scripts.search_lyrics(PHRASE, filepath=csv_path)] == ["1"]
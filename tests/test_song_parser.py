@@ -0,0 +1,80 @@
+import glob
+import os
+
+import pytest
+
+from conftest import FIXTURES_DIR
+from metrics import MetricsRegistry
+from offline_server import fixture_path, generate_fixtures, load_manifest
+from song_parser import PARSER_BACKENDS, SongParseError, compare_backends, parse_song_page
+
+
+def _saved_pages():
+    """tests/fixtures/song/{song_id}.html（詳細エリアや歌詞のないページを含む）"""
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "song", "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            pages[os.path.basename(path)[:-len(".html")]] = f.read()
+    return pages
+
+
+def test_saved_pages_parse_identically_with_every_backend():
+    pages = _saved_pages()
+    pages["0"] = ""  # 空の応答
+    assert len(pages) > 1
+    assert compare_backends(pages) == []
+
+
+def test_generated_pages_parse_identically_with_every_backend(tmp_path):
+    directory = str(tmp_path)
+    generate_fixtures(directory, pages=1, songs_per_page=20, padding=2000)
+    pages = {}
+    for song_id in load_manifest(directory)["song_ids"]:
+        with open(fixture_path(directory, f"/song/{song_id}/"), encoding="utf-8") as f:
+            pages[song_id] = f.read()
+    assert compare_backends(pages) == []
+
+
+def test_saved_page_fields():
+    html = _saved_pages()["12345"]
+    for backend in PARSER_BACKENDS:
+        song_data = parse_song_page("12345", html, backend=backend)
+        assert song_data["title"] == "夜明けの歌"
+        assert song_data["artist"] == "青空バンド"
+        assert song_data["main_theme"] == "ドラマ「朝焼け」主題歌"
+        assert (song_data["lyricist"], song_data["composer"], song_data["arranger"]) == ("山田 花子", "佐藤 太郎", "鈴木 一郎")
+        assert song_data["release_date"] == "2021/04/01"
+        assert song_data["lyrics"] == "夜が明ける\n君の名前を\n\n呼んだ（Ah）\n\n光の中で"
+
+
+def test_pages_without_the_details_area_fail_to_parse():
+    html = _saved_pages()["23456"]
+    for backend in PARSER_BACKENDS:
+        with pytest.raises(SongParseError):
+            parse_song_page("23456", html, backend=backend)
+        with pytest.raises(SongParseError):
+            parse_song_page("0", "", backend=backend)
+
+
+def test_parse_failures_are_counted_as_parse_stage_errors(monkeypatch):
+    import scripts
+
+    monkeypatch.setattr(scripts, "metrics", MetricsRegistry())
+    monkeypatch.setattr(scripts, "_fetch_song_page", lambda song_id, scheduler=None: _saved_pages()["23456"])
+    with pytest.raises(SongParseError):
+        scripts.get_song_details_and_lyrics("23456")
+    assert scripts.metrics.snapshot()["stages"]["parse"]["errors"] == 1
+
+
+def test_parser_benchmark_runs_over_saved_pages(monkeypatch, capsys):
+    import bench_parsers
+
+    directory = os.path.join(FIXTURES_DIR, "song")
+    results = bench_parsers.benchmark_parsers(bench_parsers.load_pages(directory), repeat=1)
+    assert set(results) == set(PARSER_BACKENDS)
+    # 23456.htmlには楽曲詳細エリアが無い
+    assert all(result["failed"] == 1 for result in results.values())
+
+    monkeypatch.setattr("sys.argv", ["bench_parsers.py", directory, "--repeat", "1"])
+    assert bench_parsers.main() == 0
+    assert "不一致 0件" in capsys.readouterr().out
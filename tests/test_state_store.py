@@ -0,0 +1,48 @@
+import csv
+
+import state_store
+from state_store import StateStore
+
+
+def _song(song_id):
+    return {"song_id": song_id, "title": f"曲{song_id}", "lyrics": "あいうえお"}
+
+
+def _written_ids(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return sorted(row["song_id"] for row in csv.DictReader(f))
+
+
+def test_scraped_ids_are_queried_in_chunks_and_scoped_to_the_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(state_store, "QUERY_CHUNK_SIZE", 2)
+    store = StateStore(str(tmp_path / "state.sqlite3"))
+    for song_id in ["1", "2", "3", "4", "5"]:
+        store.mark_scraped(_song(song_id), path=str(tmp_path / "a.csv"))
+    store.mark_scraped(_song("6"), path=str(tmp_path / "b.csv"))
+    wanted = ["1", "3", "5", "6", "7"]
+    assert store.scraped_ids(wanted) == {"1", "3", "5", "6"}
+    assert store.scraped_ids(wanted, path=str(tmp_path / "a.csv")) == {"1", "3", "5"}
+    assert store.scraped_ids(path=str(tmp_path / "b.csv")) == {"6"}
+    store.close()
+
+
+def test_songs_saved_to_another_csv_are_still_written(tmp_path, monkeypatch):
+    import scripts
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scripts, "STATE_DB_PATH", str(tmp_path / "pipeline_state.sqlite3"))
+
+    def details_source(song_ids):
+        return ((song_id, _song(song_id), None) for song_id in song_ids)
+
+    result = scripts.scrape_and_save_lyrics(["1", "2"], filepath="lyrics_data_a.csv", details_source=details_source)
+    assert result["scraped"] == 2
+    result = scripts.scrape_and_save_lyrics(["3"], filepath="lyrics_data_b.csv", details_source=details_source)
+    assert result["scraped"] == 1
+
+    # lyrics_data_a.csvに書き込んだ曲もlyrics_data_b.csvには無いので書き込む
+    result = scripts.scrape_and_save_lyrics(["1", "2", "3"], filepath="lyrics_data_b.csv",
+                                            details_source=details_source)
+    assert result["scraped"] == 2
+    assert _written_ids(tmp_path / "lyrics_data_b.csv") == ["1", "2", "3"]
+    assert _written_ids(tmp_path / "lyrics_data_a.csv") == ["1", "2"]
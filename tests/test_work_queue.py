@@ -0,0 +1,119 @@
+import csv
+
+import record_writer
+import work_queue
+from work_queue import SQLiteWorkQueue
+
+SONG_IDS = ["101", "102", "103", "104", "105"]
+
+
+def _fill_queue(path, failed=()):
+    with SQLiteWorkQueue(path) as queue:
+        queue.enqueue(SONG_IDS, artist_id="1")
+        queue.register_worker("w")
+        leased = queue.lease("w", limit=len(SONG_IDS))
+        assert sorted(leased) == SONG_IDS
+        queue.complete("w", [{"song_id": song_id, "title": f"曲{song_id}", "lyrics": "あいうえお"}
+                             for song_id in SONG_IDS if song_id not in failed])
+        for song_id in failed:
+            queue.fail("w", song_id, "HTTP 500")
+
+
+def _written_ids(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return [row["song_id"] for row in csv.DictReader(f)]
+
+
+def test_collect_pages_through_results_and_keeps_unwritten_songs(tmp_path, monkeypatch):
+    import scripts
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scripts, "STATE_DB_PATH", None)
+    # 1回の失敗で失敗として確定させる
+    monkeypatch.setattr(work_queue, "MAX_ATTEMPTS", 1)
+    queue_path = str(tmp_path / "work_queue.sqlite3")
+    csv_path = str(tmp_path / "lyrics_data_1.csv")
+    _fill_queue(queue_path, failed=("105",))
+
+    # 103だけ書き込みで例外にする
+    write = record_writer.BufferedRecordWriter.write
+
+    def flaky_write(self, record):
+        if record["song_id"] == "103":
+            raise OSError("disk full")
+        return write(self, record)
+
+    monkeypatch.setattr(record_writer.BufferedRecordWriter, "write", flaky_write)
+    result = scripts.collect_queue_results(queue=queue_path, filepath=csv_path, artist_id="1", page_size=2)
+    assert result == {"scraped": 3, "failed": 1, "write_failed": 1}
+    assert sorted(_written_ids(csv_path)) == ["101", "102", "104"]
+    with SQLiteWorkQueue(queue_path) as queue:
+        assert list(queue.results("1")) == ["103"]
+
+    # 書き込めなかった曲は次の回収で書き込まれる
+    monkeypatch.setattr(record_writer.BufferedRecordWriter, "write", write)
+    result = scripts.collect_queue_results(queue=queue_path, filepath=csv_path, artist_id="1", page_size=2)
+    assert result == {"scraped": 1, "failed": 0, "write_failed": 0}
+    assert sorted(_written_ids(csv_path)) == ["101", "102", "103", "104"]
+    with SQLiteWorkQueue(queue_path) as queue:
+        assert queue.results("1") == {}
+
+
+def test_collect_keeps_songs_whose_batch_did_not_reach_the_journal(tmp_path, monkeypatch):
+    import scripts
+    from test_record_writer import FlakyJournal
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scripts, "STATE_DB_PATH", None)
+    monkeypatch.setattr(scripts, "LYRICS_WRITE_BATCH_SIZE", 2)
+    queue_path = str(tmp_path / "work_queue.sqlite3")
+    csv_path = str(tmp_path / "lyrics_data_1.csv")
+    _fill_queue(queue_path)
+
+    # 最初のバッチ（101, 102）のジャーナルへの書き込みだけを失敗させる
+    init = record_writer.BufferedRecordWriter.__init__
+
+    def flaky_init(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        self._journal = FlakyJournal(self._journal)
+
+    monkeypatch.setattr(record_writer.BufferedRecordWriter, "__init__", flaky_init)
+    result = scripts.collect_queue_results(queue=queue_path, filepath=csv_path, artist_id="1", page_size=5)
+    assert result == {"scraped": 5, "failed": 0, "write_failed": 0}
+    assert sorted(_written_ids(csv_path)) == SONG_IDS
+    with SQLiteWorkQueue(queue_path) as queue:
+        assert queue.results("1") == {}
+
+
+def test_results_are_paged_in_song_id_order(tmp_path):
+    queue_path = str(tmp_path / "work_queue.sqlite3")
+    _fill_queue(queue_path)
+    with SQLiteWorkQueue(queue_path) as queue:
+        pages = []
+        after = None
+        while True:
+            page = queue.results("1", after=after, limit=2)
+            if not page:
+                break
+            pages.append(list(page))
+            after = next(reversed(page))
+    assert pages == [["101", "102"], ["103", "104"], ["105"]]
+
+
+def test_request_slots_are_shared_by_every_worker(tmp_path, monkeypatch):
+    queue_path = str(tmp_path / "work_queue.sqlite3")
+    monkeypatch.setattr(work_queue.time, "time", lambda: 1000.0)
+    # 2つのワーカー（別々の接続）が交互に予約しても、枠は全体で1秒おきに払い出される
+    with SQLiteWorkQueue(queue_path) as first, SQLiteWorkQueue(queue_path) as second:
+        delays = [queue.reserve_slot("www.uta-net.com", 1.0) for queue in (first, second, first, second)]
+        assert delays == [0.0, 1.0, 2.0, 3.0]
+        assert first.reserve_slot("example.com", 1.0) == 0.0
+
+        # どれかのワーカーが429を受けたら、全ワーカーの次の枠を遅らせる
+        sleeps = []
+        monkeypatch.setattr(work_queue.time, "sleep", sleeps.append)
+        scheduler = work_queue.SharedHostScheduler(first, 1.0, backoff=30.0)
+        scheduler.record("https://www.uta-net.com/song/1/", 429, 0.1)
+        scheduler.wait("https://www.uta-net.com/song/2/")
+        assert sleeps == [30.0]
+        assert second.reserve_slot("www.uta-net.com", 1.0) == 31.0
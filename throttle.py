@@ -0,0 +1,276 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+from metrics import log_event
+
+
+class HostScheduler:
+    """
+    ホストごとにリクエストの最小間隔を保証するスケジューラ
+
+    複数スレッドから同時に呼ばれても、同じホストへのリクエストが
+    min_interval秒より詰まらないように送信枠を予約する。
+    ロックは枠の予約にだけ使い、待機はロックの外で行うため、
+    別ホストへのリクエストはお互いをブロックしない。
+    """
+
+    def __init__(self, min_interval=1.0):
+        """
+        Args:
+            min_interval (float): 同一ホストへのリクエスト間の最小間隔（秒）
+        """
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        """
+        urlのホストに対する次の送信枠まで待機する
+
+        Args:
+            url (str): これからリクエストするURL
+
+        Returns:
+            float: 実際に待機した秒数
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return max(delay, 0.0)
+
+    def record(self, url, status_code, elapsed):
+        """リクエストの結果を受け取る（固定間隔なので何もしない。AdaptiveSchedulerと同じ呼び出し方にするため）"""
+
+
+class _HostState:
+    """AdaptiveSchedulerがホストごとに持つ状態"""
+
+    def __init__(self, rate, concurrency):
+        self.rate = rate
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.next_slot = 0.0
+        self.successes = 0
+        self.last_decrease = 0.0
+
+
+class AdaptiveScheduler:
+    """
+    応答時間とエラーに合わせてホストごとのリクエスト速度と同時接続数を調整するスケジューラ（AIMD）
+
+    HostSchedulerと同じくwait(url)で送信枠を予約し、リクエスト後にrecord()で結果を受け取る。
+    - 成功が window 件続き、応答時間が slow_latency 秒未満なら速度を rate_step 件/秒、
+      同時接続数を1つ上げる（加算的増加）
+    - 429 / 5xx / 接続エラー、または応答が slow_latency 秒以上かかったら、
+      速度と同時接続数に decrease_factor を掛けて下げる（乗算的減少）
+    同時に送っていたリクエストがまとめて失敗しても下げるのは1回だけになるよう、
+    減少の後は cooldown 秒間は次の減少をしない。速度と同時接続数は下限と上限の間に保つ。
+    """
+
+    # 速度を下げる理由になるステータスコード（5xxは別途判定）
+    BACKOFF_STATUS_CODES = (429,)
+
+    def __init__(self, initial_rate=1.0, min_rate=0.2, max_rate=3.0, initial_concurrency=1,
+                 min_concurrency=1, max_concurrency=4, rate_step=0.1, decrease_factor=0.5,
+                 slow_latency=5.0, window=10, cooldown=None, verbose=True):
+        """
+        Args:
+            initial_rate (float): 開始時の速度（件/秒）
+            min_rate (float): 速度の下限（件/秒）
+            max_rate (float): 速度の上限（件/秒）
+            initial_concurrency (int): 開始時の同時接続数
+            min_concurrency (int): 同時接続数の下限
+            max_concurrency (int): 同時接続数の上限
+            rate_step (float): 1回の増加で上げる速度（件/秒）
+            decrease_factor (float): 1回の減少で掛ける係数
+            slow_latency (float): この秒数以上かかった応答は混雑の兆候とみなす
+            window (int): 速度を上げるまでに必要な連続成功数
+            cooldown (float): 減少の後に次の減少をしない秒数（省略時は開始時の間隔の2倍）
+            verbose (bool): 調整のたびにメッセージを表示する
+        """
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.initial_rate = min(max(initial_rate, min_rate), max_rate)
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.initial_concurrency = min(max(initial_concurrency, self.min_concurrency), self.max_concurrency)
+        self.rate_step = rate_step
+        self.decrease_factor = decrease_factor
+        self.slow_latency = slow_latency
+        self.window = max(1, window)
+        self.cooldown = cooldown if cooldown is not None else 2.0 / self.initial_rate
+        self.verbose = verbose
+        # (時刻, ホスト, 速度, 同時接続数, 理由) の履歴
+        self.adjustments = []
+        self._cond = threading.Condition()
+        self._hosts = {}
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.initial_rate, self.initial_concurrency)
+        return state
+
+    def wait(self, url):
+        """
+        同時接続数の空きと、urlのホストに対する次の送信枠まで待機する
+
+        waitした後は必ずrecord()を呼ぶこと（同時接続数の枠を返すため）
+
+        Args:
+            url (str): これからリクエストするURL
+
+        Returns:
+            float: 実際に待機した秒数
+        """
+        host = urlparse(url).netloc
+        start = time.monotonic()
+        with self._cond:
+            state = self._state(host)
+            while state.in_flight >= state.concurrency:
+                self._cond.wait()
+            state.in_flight += 1
+            now = time.monotonic()
+            slot = max(now, state.next_slot)
+            state.next_slot = slot + 1.0 / state.rate
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return time.monotonic() - start
+
+    def record(self, url, status_code, elapsed):
+        """
+        リクエストの結果を受け取り、速度と同時接続数を調整する
+
+        Args:
+            url (str): リクエストしたURL
+            status_code (int | None): ステータスコード（接続エラーなどで応答が無ければNone）
+            elapsed (float): 応答までの秒数
+        """
+        host = urlparse(url).netloc
+        with self._cond:
+            state = self._state(host)
+            state.in_flight = max(0, state.in_flight - 1)
+            reason = None
+            if status_code is None:
+                reason = "接続エラー"
+            elif status_code in self.BACKOFF_STATUS_CODES or status_code >= 500:
+                reason = f"ステータス {status_code}"
+            elif elapsed >= self.slow_latency:
+                reason = f"応答 {elapsed:.1f}秒"
+
+            now = time.monotonic()
+            if reason is not None:
+                state.successes = 0
+                if now - state.last_decrease >= self.cooldown:
+                    state.last_decrease = now
+                    self._adjust(host, state, state.rate * self.decrease_factor,
+                                 int(state.concurrency * self.decrease_factor), f"減速 ({reason})")
+            else:
+                state.successes += 1
+                if state.successes >= self.window:
+                    state.successes = 0
+                    self._adjust(host, state, state.rate + self.rate_step, state.concurrency + 1, "加速")
+            self._cond.notify_all()
+
+    def _adjust(self, host, state, rate, concurrency, reason):
+        rate = min(max(rate, self.min_rate), self.max_rate)
+        concurrency = min(max(concurrency, self.min_concurrency), self.max_concurrency)
+        if rate == state.rate and concurrency == state.concurrency:
+            return
+        if self.verbose:
+            log_event("rate_adjusted",
+                      f"[{host}] {reason}: {state.rate:.2f} → {rate:.2f} 件/秒, "
+                      f"同時接続数 {state.concurrency} → {concurrency}",
+                      host=host, reason=reason, rate=rate, concurrency=concurrency)
+        self.adjustments.append((time.time(), host, rate, concurrency, reason))
+        state.rate = rate
+        state.concurrency = concurrency
+
+    def current(self, url):
+        """
+        urlのホストに対する現在の設定を返す
+
+        Returns:
+            dict: {"rate": 件/秒, "concurrency": 同時接続数, "in_flight": 送信中の件数}
+        """
+        with self._cond:
+            state = self._state(urlparse(url).netloc)
+            return {"rate": state.rate, "concurrency": state.concurrency, "in_flight": state.in_flight}
+
+
+class TokenBucket:
+    """
+    複数スレッドで共有するトークンバケット型のレートリミッタ
+
+    平均rate件/秒、最大capacity件までのバーストを許可する。
+    pause()で全スレッドの取得を一時停止できるため、あるワーカーが
+    429のRetry-Afterを受け取ったら、バケット全体がその秒数だけ止まる。
+    """
+
+    def __init__(self, rate=3.0, capacity=None):
+        """
+        Args:
+            rate (float): 1秒あたりに補充するトークン数（平均リクエスト数）
+            capacity (float): バケットの容量（省略時はrateと同じ）
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    def acquire(self):
+        """
+        トークンを1つ取得する（取得できるまで待機する）
+
+        Returns:
+            float: 待機した秒数
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        """
+        全スレッドのトークン取得をseconds秒間停止する
+
+        Args:
+            seconds (float): 停止する秒数（既に停止中なら長い方を採用）
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            # 再開直後にバーストしないよう、停止中はトークンを補充しない
+            self._tokens = min(self._tokens, 1.0)
+            self._updated_at = max(self._updated_at, self._paused_until)
+
+    @property
+    def paused_for(self):
+        """残りの停止秒数"""
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
@@ -0,0 +1,477 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from song_parser import SONG_FIELDS
+
+# タスクの状態（取得待ち / ワーカーが貸し出し中 / 結果を受け取り済み / 失敗が続いたので諦めた）
+TASK_PENDING = "pending"
+TASK_LEASED = "leased"
+TASK_DONE = "done"
+TASK_FAILED = "failed"
+
+# 貸し出しの期限（秒）。ワーカーはこの間にハートビートで延長し続け、止まったワーカーの曲は期限切れ後に他のワーカーが引き取る
+LEASE_SECONDS = 120.0
+
+# 1回の貸し出しでワーカーが受け取る曲数（結果もこの単位でまとめて書き込む）
+LEASE_BATCH_SIZE = 20
+
+# 取得に失敗した曲を取得待ちに戻すまでの待ち時間（秒、試行回数に比例）と、諦めるまでの試行回数
+RETRY_BACKOFF = 30.0
+MAX_ATTEMPTS = 3
+
+# 共有ボリューム上のSQLiteを複数のプロセス・ホストから開くときに、ロックを待つ時間（秒）
+BUSY_TIMEOUT = 60.0
+
+# どれかのワーカーがこのステータスを受けたら、全ワーカーがRATE_LIMIT_BACKOFF秒間そのホストへのリクエストを止める
+RATE_LIMIT_STATUS_CODES = (429, 503)
+RATE_LIMIT_BACKOFF = 30.0
+
+
+class SQLiteWorkQueue:
+    """
+    複数のワーカーで楽曲ページの取得を分担するための、SQLiteの作業キュー
+
+    song_idを1行1タスクで登録し、ワーカーは期限付きで貸し出しを受ける（lease）。
+    処理中はハートビートで期限を延ばし、結果（楽曲データ）をキューに書き込んで完了にする。
+    期限が切れたタスクは次の貸し出しで他のワーカーが引き取る（止まったワーカーの分を回収する）。
+    完了の書き込みは貸し出しを受けたワーカーのものだけを受け付けるので、期限切れ後に
+    引き取られた曲を元のワーカーが上書きすることはない。
+
+    共有ボリューム（NFSなど）でも使えるよう、WALではなく通常のロールバックジャーナルで開く。
+    貸し出しと完了はLEASE_BATCH_SIZE曲ずつまとめて1トランザクションで行うので、
+    ワーカーを増やしてもキューへの書き込みは1曲あたり数回で済む。
+    取得先のホストごとの次の送信枠もキューに1行ずつ持ち（reserve_slot）、全ワーカーで
+    リクエスト速度の上限を共有する。
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): データベースファイルのパス
+        """
+        self.path = path
+        self.reclaimed = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        self._conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS tasks (
+                song_id TEXT PRIMARY KEY,
+                artist_id TEXT,
+                status TEXT NOT NULL DEFAULT '{TASK_PENDING}',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                enqueued_at REAL,
+                finished_at REAL,
+                error TEXT,
+                result TEXT,
+                collected INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS tasks_pending ON tasks (status, available_at);
+            CREATE INDEX IF NOT EXISTS tasks_leased ON tasks (status, lease_expires);
+            CREATE INDEX IF NOT EXISTS tasks_collected ON tasks (collected, status);
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                started_at REAL,
+                heartbeat_at REAL,
+                completed INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                host TEXT PRIMARY KEY,
+                next_slot REAL NOT NULL
+            );
+            """
+        )
+
+    def _transaction(self, func):
+        """書き込みロックを先に取ってからfunc(conn)を実行する（複数のプロセスが同じ行を貸し出さないように）"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    # --- 登録 ---
+
+    def enqueue(self, song_ids, artist_id=None):
+        """
+        song_idを取得待ちとして登録する（登録済みのsong_idは状態を変えない）
+
+        Returns:
+            int: 新しく登録された件数
+        """
+        now = time.time()
+        rows = [(str(song_id), None if artist_id is None else str(artist_id), now) for song_id in song_ids]
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO tasks (song_id, artist_id, enqueued_at) VALUES (?, ?, ?)", rows)
+            return conn.total_changes - before
+        return self._transaction(insert)
+
+    # --- ワーカー ---
+
+    def register_worker(self, worker_id):
+        now = time.time()
+        self._transaction(lambda conn: conn.execute(
+            "INSERT INTO workers (worker_id, started_at, heartbeat_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(worker_id) DO UPDATE SET started_at = excluded.started_at, heartbeat_at = excluded.heartbeat_at",
+            (worker_id, now, now),
+        ))
+
+    def lease(self, worker_id, limit=LEASE_BATCH_SIZE, lease_seconds=LEASE_SECONDS):
+        """
+        取得待ちのタスクと期限切れのタスクを最大limit件貸し出す
+
+        期限切れのタスクのうち、試行回数がMAX_ATTEMPTSに達しているものは失敗にする
+        （取得のたびにワーカーが落ちる曲で、キューが止まらないように）。
+
+        Returns:
+            list: 貸し出したsong_id
+        """
+        now = time.time()
+
+        def take(conn):
+            rows = conn.execute(
+                f"""
+                SELECT song_id, status, attempts FROM tasks
+                WHERE status = '{TASK_PENDING}' AND available_at <= ?
+                UNION ALL
+                SELECT song_id, status, attempts FROM tasks
+                WHERE status = '{TASK_LEASED}' AND lease_expires < ?
+                LIMIT ?
+                """,
+                (now, now, limit),
+            ).fetchall()
+            leased = []
+            reclaimed = 0
+            for song_id, status, attempts in rows:
+                if status == TASK_LEASED:
+                    reclaimed += 1
+                    if attempts >= MAX_ATTEMPTS:
+                        conn.execute(
+                            "UPDATE tasks SET status = ?, lease_owner = NULL, finished_at = ?, error = ? WHERE song_id = ?",
+                            (TASK_FAILED, now, f"{attempts}回の貸し出しがいずれも期限切れになりました", song_id),
+                        )
+                        continue
+                leased.append(song_id)
+            conn.executemany(
+                "UPDATE tasks SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE song_id = ?",
+                [(TASK_LEASED, worker_id, now + lease_seconds, song_id) for song_id in leased],
+            )
+            conn.execute("UPDATE workers SET heartbeat_at = ? WHERE worker_id = ?", (now, worker_id))
+            return leased, reclaimed
+
+        leased, reclaimed = self._transaction(take)
+        self.reclaimed += reclaimed
+        return leased
+
+    def heartbeat(self, worker_id, song_ids, lease_seconds=LEASE_SECONDS):
+        """
+        貸し出し中のタスクの期限を延ばす
+
+        Returns:
+            set: まだこのワーカーが貸し出しを受けているsong_id（含まれないものは他のワーカーに引き取られた）
+        """
+        now = time.time()
+        song_ids = [str(song_id) for song_id in song_ids]
+
+        def extend(conn):
+            held = set()
+            for song_id in song_ids:
+                cursor = conn.execute(
+                    "UPDATE tasks SET lease_expires = ? WHERE song_id = ? AND status = ? AND lease_owner = ?",
+                    (now + lease_seconds, song_id, TASK_LEASED, worker_id),
+                )
+                if cursor.rowcount:
+                    held.add(song_id)
+            conn.execute("UPDATE workers SET heartbeat_at = ? WHERE worker_id = ?", (now, worker_id))
+            return held
+        return self._transaction(extend)
+
+    def complete(self, worker_id, results):
+        """
+        取得した楽曲データを書き込み、タスクを完了にする
+
+        Args:
+            worker_id (str): ワーカーID
+            results (list): 楽曲データのdict
+
+        Returns:
+            list: 受け付けたsong_id（貸し出しを失っていた曲は含まれない）
+        """
+        now = time.time()
+
+        def finish(conn):
+            accepted = []
+            for song_data in results:
+                song_id = str(song_data["song_id"])
+                data = json.dumps({field: song_data.get(field, "") for field in SONG_FIELDS}, ensure_ascii=False)
+                cursor = conn.execute(
+                    "UPDATE tasks SET status = ?, result = ?, error = NULL, finished_at = ?, lease_owner = NULL"
+                    " WHERE song_id = ? AND status = ? AND lease_owner = ?",
+                    (TASK_DONE, data, now, song_id, TASK_LEASED, worker_id),
+                )
+                if cursor.rowcount:
+                    accepted.append(song_id)
+            conn.execute("UPDATE workers SET completed = completed + ?, heartbeat_at = ? WHERE worker_id = ?",
+                         (len(accepted), now, worker_id))
+            return accepted
+        return self._transaction(finish)
+
+    def fail(self, worker_id, song_id, error):
+        """
+        取得の失敗を記録する
+
+        試行回数がMAX_ATTEMPTS未満なら待ち時間の後に取得待ちに戻し、達していれば失敗にする。
+
+        Returns:
+            bool: 失敗として確定した場合True
+        """
+        now = time.time()
+
+        def record(conn):
+            row = conn.execute("SELECT attempts FROM tasks WHERE song_id = ? AND status = ? AND lease_owner = ?",
+                               (str(song_id), TASK_LEASED, worker_id)).fetchone()
+            if row is None:
+                return False
+            attempts = row[0]
+            if attempts >= MAX_ATTEMPTS:
+                conn.execute(
+                    "UPDATE tasks SET status = ?, error = ?, finished_at = ?, lease_owner = NULL WHERE song_id = ?",
+                    (TASK_FAILED, str(error), now, str(song_id)),
+                )
+            else:
+                conn.execute(
+                    "UPDATE tasks SET status = ?, error = ?, available_at = ?, lease_owner = NULL WHERE song_id = ?",
+                    (TASK_PENDING, str(error), now + RETRY_BACKOFF * attempts, str(song_id)),
+                )
+            conn.execute("UPDATE workers SET failed = failed + 1, heartbeat_at = ? WHERE worker_id = ?", (now, worker_id))
+            return attempts >= MAX_ATTEMPTS
+        return self._transaction(record)
+
+    def release(self, worker_id, song_ids):
+        """貸し出し中のタスクを取得待ちに戻す（ワーカーを途中で止めるとき。試行回数には数えない）"""
+        rows = [(TASK_PENDING, str(song_id), TASK_LEASED, worker_id) for song_id in song_ids]
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE tasks SET status = ?, lease_owner = NULL, attempts = MAX(attempts - 1, 0)"
+            " WHERE song_id = ? AND status = ? AND lease_owner = ?",
+            rows,
+        ))
+
+    # --- 結果の回収 ---
+
+    def results(self, artist_id=None, after=None, limit=None):
+        """
+        まだ回収していない完了・失敗のタスクを返す
+
+        大量の結果を回収するときは、前回の最後のsong_idをafterに渡してlimit件ずつ読む
+        （楽曲データは歌詞を含むので、全件を一度に読み込まない）。
+
+        Args:
+            artist_id (str): このアーティストとして登録したタスクだけを返す
+            after (str): このsong_idより後のタスクだけを返す
+            limit (int): 返す件数の上限（省略時は全件）
+
+        Returns:
+            dict: {song_id: (楽曲データ、失敗ならNone, エラーメッセージ)}（song_id順）
+        """
+        sql = "SELECT song_id, status, result, error FROM tasks WHERE collected = 0 AND status IN (?, ?)"
+        params = [TASK_DONE, TASK_FAILED]
+        if artist_id is not None:
+            sql += " AND artist_id = ?"
+            params.append(str(artist_id))
+        if after is not None:
+            sql += " AND song_id > ?"
+            params.append(str(after))
+        sql += " ORDER BY song_id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return {
+            song_id: (json.loads(result) if status == TASK_DONE else None, error)
+            for song_id, status, result, error in rows
+        }
+
+    def mark_collected(self, song_ids):
+        """回収した（出力先に書き込んだ）タスクに印を付ける"""
+        rows = [(str(song_id),) for song_id in song_ids]
+        self._transaction(lambda conn: conn.executemany("UPDATE tasks SET collected = 1 WHERE song_id = ?", rows))
+
+    # --- 集計 ---
+
+    # --- リクエスト速度 ---
+
+    def reserve_slot(self, host, interval):
+        """
+        全ワーカーで共有するhostへの次の送信枠を予約する
+
+        枠はinterval秒おきに1つずつ払い出すので、ワーカーが何台あっても
+        hostへのリクエストは全体でinterval秒に1件までになる。時刻はtime.time()で
+        比べるので、ワーカーを動かすマシンの時計は合わせておく（NTPなど）。
+
+        Args:
+            host (str): 取得先のホスト
+            interval (float): 全体でのリクエスト間の最小間隔（秒）
+
+        Returns:
+            float: 予約した枠までの秒数（この秒数だけ待ってから送信する）
+        """
+        def reserve(conn):
+            now = time.time()
+            row = conn.execute("SELECT next_slot FROM rate_limits WHERE host = ?", (host,)).fetchone()
+            slot = max(now, row[0]) if row else now
+            conn.execute(
+                "INSERT INTO rate_limits (host, next_slot) VALUES (?, ?)"
+                " ON CONFLICT(host) DO UPDATE SET next_slot = excluded.next_slot",
+                (host, slot + interval),
+            )
+            return slot - now
+        return self._transaction(reserve)
+
+    def delay_host(self, host, seconds):
+        """hostへの次の送信枠を、今からseconds秒後より前にならないように遅らせる（全ワーカーが待つ）"""
+        until = time.time() + seconds
+        self._transaction(lambda conn: conn.execute(
+            "INSERT INTO rate_limits (host, next_slot) VALUES (?, ?)"
+            " ON CONFLICT(host) DO UPDATE SET next_slot = MAX(next_slot, excluded.next_slot)",
+            (host, until),
+        ))
+
+    def counts(self):
+        """
+        状態ごとの件数
+
+        Returns:
+            dict: {状態: 件数}（"expired"は期限切れで引き取り待ちの貸し出し、"uncollected"は未回収の完了・失敗）
+        """
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status"))
+            counts["expired"] = self._conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status = ? AND lease_expires < ?", (TASK_LEASED, now)).fetchone()[0]
+            counts["uncollected"] = self._conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE collected = 0 AND status IN (?, ?)",
+                (TASK_DONE, TASK_FAILED)).fetchone()[0]
+        return counts
+
+    def is_drained(self):
+        """取得待ち・貸し出し中のタスクが残っていないか"""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM tasks WHERE status IN (?, ?) LIMIT 1",
+                                     (TASK_PENDING, TASK_LEASED)).fetchone()
+        return row is None
+
+    def workers(self):
+        """ワーカーごとの最終ハートビートと処理件数 [(worker_id, heartbeat_at, completed, failed)]"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT worker_id, heartbeat_at, completed, failed FROM workers ORDER BY worker_id").fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# キューの場所の書き方（"sqlite:///shared/queue.sqlite3" など）ごとの実装。
+# 同じメソッド（enqueue / register_worker / lease / heartbeat / complete / fail / release / results /
+# mark_collected / counts / is_drained / workers / close）を持つクラスを登録すれば、Redisなど別の保存先も使える。
+# reserve_slot / delay_host も持っていれば、SharedHostSchedulerで全ワーカーのリクエスト速度を共有できる
+QUEUE_BACKENDS = {"sqlite": SQLiteWorkQueue}
+
+
+class SharedHostScheduler:
+    """
+    作業キューを通して、全ワーカーでホストごとのリクエスト間隔を共有するスケジューラ
+
+    HostScheduler / AdaptiveSchedulerと同じくwait(url)で送信枠を予約し、リクエスト後にrecord()で
+    結果を受け取る。送信枠はキューのreserve_slot()で予約するので、ワーカーを増やしても
+    同じホストへのリクエストは全体でmin_interval秒に1件までになる。localを渡すと、
+    ワーカー内のスケジューラ（同時接続数や自動調整）でも待ってから全体の枠を予約する。
+    RATE_LIMIT_STATUS_CODESを受けたら、全ワーカーの次の送信枠をbackoff秒後まで遅らせる。
+    """
+
+    def __init__(self, queue, min_interval, local=None, backoff=RATE_LIMIT_BACKOFF):
+        """
+        Args:
+            queue: reserve_slot / delay_hostを持つ作業キュー
+            min_interval (float): 全ワーカー合計での同一ホストへのリクエスト間の最小間隔（秒）
+            local (HostScheduler | AdaptiveScheduler): ワーカー内のスケジューラ
+            backoff (float): 429 / 503を受けたときに全ワーカーを止める秒数
+        """
+        self.queue = queue
+        self.min_interval = min_interval
+        self.local = local
+        self.backoff = backoff
+
+    def wait(self, url):
+        """
+        urlのホストに対する全体の次の送信枠まで待機する
+
+        Returns:
+            float: 実際に待機した秒数
+        """
+        start = time.monotonic()
+        if self.local is not None:
+            self.local.wait(url)
+        delay = self.queue.reserve_slot(urlparse(url).netloc, self.min_interval)
+        if delay > 0:
+            time.sleep(delay)
+        return time.monotonic() - start
+
+    def record(self, url, status_code, elapsed):
+        """リクエストの結果を受け取る（429 / 503なら全ワーカーを止める）"""
+        if self.local is not None:
+            self.local.record(url, status_code, elapsed)
+        if status_code in RATE_LIMIT_STATUS_CODES:
+            self.queue.delay_host(urlparse(url).netloc, self.backoff)
+
+
+def register_queue_backend(scheme, factory):
+    """
+    キューの実装を登録する
+
+    Args:
+        scheme (str): URLのスキーム（"redis" など）
+        factory (callable): スキームを除いた残りの文字列を受け取り、キューを返す関数
+    """
+    QUEUE_BACKENDS[scheme] = factory
+
+
+def open_work_queue(location):
+    """
+    キューを開く
+
+    Args:
+        location (str): "スキーム://場所" 形式（スキームが無ければSQLiteのファイルのパス）
+
+    Returns:
+        SQLiteWorkQueue: キュー（登録した実装の場合はそのインスタンス）
+    """
+    scheme, separator, rest = location.partition("://")
+    if not separator:
+        return SQLiteWorkQueue(location)
+    if scheme not in QUEUE_BACKENDS:
+        raise ValueError(f"未対応のキューの種類です: {scheme}（{', '.join(sorted(QUEUE_BACKENDS))}のいずれか）")
+    # sqlite:///abs/path なら "/abs/path"、sqlite://rel/path なら "rel/path" を渡す
+    return QUEUE_BACKENDS[scheme](rest)